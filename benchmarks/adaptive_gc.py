@@ -0,0 +1,38 @@
+""" grating period/ff sweep: adaptive sampling vs the uniform 11 x 11 grid
+
+uses the toy grating response of pylum.adaptive (no FDTD needed)
+
+    python benchmarks/adaptive_gc.py
+"""
+import numpy as np
+
+from pylum.adaptive import _grating
+from pylum.adaptive import adaptive_sweep
+
+if __name__ == "__main__":
+    bounds = dict(period=(0.62e-6, 0.7e-6), ff=(0.3, 0.7))
+    period, ff = np.meshgrid(np.linspace(*bounds["period"], 11), np.linspace(*bounds["ff"], 11))
+    grid = _grating(period=period, ff=ff)
+    i = np.argmax(grid["transmission"])
+    print(f"{'method':>16} {'simulations':>11} {'efficiency':>10} {'peak (nm)':>9}")
+    print(
+        f"{'grid 11x11':>16} {period.size:>11} {grid['transmission'].flat[i]:>10.4f}"
+        f" {grid['peak_wavelength'].flat[i] * 1e9:>9.1f}"
+    )
+
+    for tolerance in [1e-2, 5e-3, 2e-3]:
+        d = adaptive_sweep(
+            _grating,
+            bounds,
+            output="transmission",
+            tolerance=tolerance,
+            max_points=121,
+            batch_size=4,
+            processes=0,
+            progress=False,
+        )
+        best = _grating(period=d["best"]["period"], ff=d["best"]["ff"])
+        print(
+            f"{'adaptive ' + str(tolerance):>16} {len(d['points']):>11}"
+            f" {best['transmission']:>10.4f} {best['peak_wavelength'] * 1e9:>9.1f}"
+        )
@@ -0,0 +1,29 @@
+""" apodized grating coupler candidates: design and rank thousands at once
+
+    python benchmarks/apodization_rank.py
+"""
+import time
+
+import numpy as np
+
+from pylum.apodization import gaussian
+from pylum.apodization import rank
+
+if __name__ == "__main__":
+    print(f"{'designs':>8} {'teeth':>6} {'design (s)':>10} {'rank (s)':>9} {'designs/s':>10}")
+    for n in [10, 20, 40]:
+        t0 = time.perf_counter()
+        d = gaussian(
+            n_gratings=40,
+            fiber_offset=np.linspace(2e-6, 8e-6, n)[:, None, None],
+            alpha_max=np.linspace(0.1e6, 0.4e6, n)[:, None],
+            ff_max=np.linspace(0.75, 0.95, n),
+        )
+        t1 = time.perf_counter()
+        rank(d, top=5)
+        t2 = time.perf_counter()
+        ndesigns = n ** 3
+        print(
+            f"{ndesigns:>8} {40:>6} {t1 - t0:>10.3f} {t2 - t1:>9.3f}"
+            f" {ndesigns / (t2 - t0):>10.0f}"
+        )
@@ -0,0 +1,26 @@
+""" fiber alignment maps: position x angle coupling of one grating near field
+
+    python benchmarks/fiber_coupling.py
+"""
+import time
+
+import numpy as np
+
+from pylum.fiber import coupling
+from pylum.fiber import field
+
+if __name__ == "__main__":
+    x = np.linspace(-5e-6, 20e-6, 1001)
+    near_field = field(x, position=6e-6, angle_deg=12)
+    print(f"{'settings':>9} {'points':>7} {'time (s)':>9} {'settings/s':>11}")
+    for npositions, nangles in [(101, 11), (1001, 41), (2001, 101)]:
+        t0 = time.perf_counter()
+        coupling(
+            near_field,
+            x,
+            position=np.linspace(0, 12e-6, npositions)[:, None],
+            angle_deg=np.linspace(5, 20, nangles),
+        )
+        t = time.perf_counter() - t0
+        n = npositions * nangles
+        print(f"{n:>9} {x.size:>7} {t:>9.2f} {n / t:>11.0f}")
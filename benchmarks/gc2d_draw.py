@@ -0,0 +1,34 @@
+""" lumapi calls and setup time for gc2d: one call per property vs one batched script
+
+uses pylum.fake_lumapi with an emulated round-trip latency, so it runs without a license
+
+    python benchmarks/gc2d_draw.py
+"""
+import time
+
+from pylum import fake_lumapi
+from pylum.gc import gc2d
+
+
+def benchmark(n_gratings=50, latency=1e-3):
+    gap_width_list = [(0.33e-6, 0.33e-6)] * n_gratings
+    results = {}
+    for batch in [False, True]:
+        s = fake_lumapi.FDTD(latency=latency)
+        t0 = time.perf_counter()
+        gc2d(session=s, gap_width_list=gap_width_list, batch=batch, cache=False)
+        results[batch] = (len(s.calls), time.perf_counter() - t0)
+    return results
+
+
+if __name__ == "__main__":
+    latency = 1e-3
+    print(f"emulated lumapi latency {latency*1e3:.1f} ms per call")
+    print(f"{'teeth':>6} {'calls':>7} {'batched':>8} {'saved':>7} {'time (s)':>9} {'batched':>8}")
+    for n in [50, 100, 300]:
+        r = benchmark(n_gratings=n, latency=latency)
+        calls, t = r[False]
+        calls_batch, t_batch = r[True]
+        print(
+            f"{n:>6} {calls:>7} {calls_batch:>8} {calls - calls_batch:>7} {t:>9.3f} {t_batch:>8.3f}"
+        )
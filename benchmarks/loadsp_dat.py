@@ -0,0 +1,71 @@
+""" Interconnect .dat reader: bulk NumPy parse vs the previous line by line parser
+
+    python benchmarks/loadsp_dat.py
+"""
+import pathlib
+import re
+import tempfile
+
+import numpy as np
+
+from pylum.loadsp import read_sparameters_dat
+from pylum.loadsp import write_sparameters_dat
+from timing import timeit
+
+
+def read_line_by_line(filepath_sp, numports):
+    """ previous pylum.loadsp parser """
+    F = []
+    port_names = []
+
+    with open(filepath_sp, "r") as fid:
+        for i in range(numports):
+            port_line = fid.readline()
+            m = re.search(r'\[".*",', port_line)
+            if m:
+                port = m.group(0)
+                port_names.append(port[2:-2])
+        line = fid.readline()
+        line = fid.readline()
+        numrows = int(tuple(line[1:-2].split(","))[0])
+        S = np.zeros((numrows, numports, numports), dtype="complex128")
+        r = m = n = 0
+        for line in fid:
+            if line[0] == "(":
+                continue
+            data = line.split()
+            data = list(map(float, data))
+            if m == 0 and n == 0:
+                F.append(data[0])
+            S[r, m, n] = data[1] * np.exp(1j * data[2])
+            r += 1
+            if r == numrows:
+                r = 0
+                m += 1
+                if m == numports:
+                    m = 0
+                    n += 1
+                    if n == numports:
+                        break
+    return (port_names, F, S)
+
+
+if __name__ == "__main__":
+    print(f"{'ports':>5} {'points':>7} {'MB':>6} {'line (s)':>9} {'numpy (s)':>10} {'mmap (s)':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as dirpath:
+        for nports, nfreq in [(2, 1000), (4, 10000), (8, 10000)]:
+            filepath = pathlib.Path(dirpath) / f"sp_{nports}_{nfreq}.dat"
+            f = np.linspace(180e12, 200e12, nfreq)
+            S = np.random.rand(nfreq, nports, nports) * np.exp(
+                1j * np.random.rand(nfreq, nports, nports)
+            )
+            port_names = [f"port {i+1}" for i in range(nports)]
+            write_sparameters_dat(filepath, port_names, f, S)
+            mb = filepath.stat().st_size / 1e6
+
+            t_line = timeit(read_line_by_line, filepath, nports)
+            t_numpy = timeit(read_sparameters_dat, filepath)
+            t_mmap = timeit(read_sparameters_dat, filepath, mmap=True)
+            print(
+                f"{nports:>5} {nfreq:>7} {mb:>6.1f} {t_line:>9.3f} {t_numpy:>10.3f} {t_mmap:>9.3f} {t_line / t_numpy:>7.1f}x"
+            )
@@ -0,0 +1,27 @@
+""" ring resonator design maps: radius x coupling designs over a wavelength window
+
+    python benchmarks/ring_map.py
+"""
+import time
+
+import numpy as np
+
+from pylum.circuits.ring import ring_map
+
+if __name__ == "__main__":
+    wavelength = np.linspace(1549e-9, 1551e-9, 101)
+    print(f"{'designs':>8} {'wavelengths':>11} {'chunk (MB)':>10} {'time (s)':>9} {'Mpoints/s':>10}")
+    for n, max_elements in [(100, 2 ** 22), (1000, 2 ** 20), (1000, 2 ** 22)]:
+        t0 = time.perf_counter()
+        ring_map(
+            wavelength,
+            radius=np.linspace(5e-6, 20e-6, n)[:, None],
+            coupling=np.linspace(0.05, 0.5, n),
+            max_elements=max_elements,
+        )
+        t = time.perf_counter() - t0
+        npoints = n * n * wavelength.size
+        print(
+            f"{n * n:>8} {wavelength.size:>11} {max_elements * 8 / 2 ** 20:>10.0f}"
+            f" {t:>9.2f} {npoints / t / 1e6:>10.1f}"
+        )
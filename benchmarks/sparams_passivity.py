@@ -0,0 +1,29 @@
+""" passivity check: per-frequency norm loop (Sparam_passivity.m) vs batched SVD
+
+    python benchmarks/sparams_passivity.py
+"""
+import time
+
+import numpy as np
+
+from pylum.sparams.passivity import singular_values
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'nfreq':>6} {'nports':>6} {'loop (ms)':>10} {'batched (ms)':>13} {'speedup':>8}")
+    for nfreq, nports in [(300, 2), (1000, 4), (10000, 4), (10000, 8)]:
+        shape = (nfreq, nports, nports)
+        S = rng.normal(size=shape) + 1j * rng.normal(size=shape)
+
+        t0 = time.perf_counter()
+        loop = np.array([np.linalg.norm(S[i], 2) for i in range(nfreq)])
+        t_loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        batched = singular_values(S)[:, 0]
+        t_batched = time.perf_counter() - t0
+        assert np.allclose(loop, batched)
+        print(
+            f"{nfreq:>6} {nports:>6} {t_loop * 1e3:>10.1f} {t_batched * 1e3:>13.1f}"
+            f" {t_loop / t_batched:>8.1f}"
+        )
@@ -0,0 +1,12 @@
+""" shared helpers for the benchmark scripts """
+import time
+
+
+def timeit(function, *args, repeat=3, **kwargs):
+    """ returns the fastest of `repeat` runs (s) """
+    t = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function(*args, **kwargs)
+        t.append(time.perf_counter() - t0)
+    return min(t)
@@ -0,0 +1,46 @@
+""" Bragg grating TMM: batched NumPy vs one matrix power per wavelength (as TMM_Grating.m)
+
+    python benchmarks/tmm_grating.py
+"""
+
+import numpy as np
+
+from pylum import tmm
+from timing import timeit
+
+
+def grating_loop(wavelength, period, n_periods, n1, n2, loss):
+    """ one matrix product and matrix power per wavelength """
+    R = np.zeros(len(wavelength))
+    for i, w in enumerate(wavelength):
+        M = tmm.period_matrix(w, period, n1[i], n2[i], loss)
+        M = np.linalg.matrix_power(M, n_periods)
+        R[i] = abs(M[1, 0] / M[0, 0]) ** 2
+    return R
+
+
+if __name__ == "__main__":
+    npoints = 10000
+    period = 310e-9
+    wavelength = tmm.bragg_wavelength(period) + np.linspace(-15e-9, 15e-9, npoints)
+    loss = np.log(10) * 3 / 10 * 100
+
+    n = tmm.neff_wavelength(wavelength)
+    n1 = n + tmm.dneff_width(0.49)
+    n2 = n + tmm.dneff_width(0.51)
+    t_loop = timeit(grating_loop, wavelength, period, 200, n1, n2, loss, repeat=1)
+    t_numpy = timeit(tmm.grating, wavelength, period, 200, n1, n2)
+    print(
+        f"1 grating x {npoints} points: loop {t_loop:.3f} s, numpy {t_numpy:.4f} s"
+        f" ({t_loop / t_numpy:.0f}x)"
+    )
+
+    print(f"{'variants':>8} {'points':>7} {'time (s)':>9} {'variants/s':>11} {'Mpoints/s':>10}")
+    for nvariants, npoints in [(10, 10000), (100, 10000), (1000, 10000), (1000, 1000)]:
+        wavelength = tmm.bragg_wavelength(period) + np.linspace(-15e-9, 15e-9, npoints)
+        dwidth = np.linspace(5e-3, 50e-3, nvariants)[:, None]
+        t = timeit(tmm.grating_width, wavelength, period=period, dwidth=dwidth)
+        print(
+            f"{nvariants:>8} {npoints:>7} {t:>9.3f} {nvariants / t:>11.0f}"
+            f" {nvariants * npoints / t / 1e6:>10.1f}"
+        )
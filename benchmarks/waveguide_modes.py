@@ -0,0 +1,45 @@
+""" neff/ng over wavelength: lumapi calls per wavelength and mode vs one batched script
+
+uses a fake MODE session with an emulated round-trip latency (no solver time), so
+it measures the lumapi overhead that batching removes
+
+    python benchmarks/waveguide_modes.py
+"""
+import time
+
+from pylum.waveguide_modes import _fake_mode_session
+from pylum.waveguide_modes import waveguide_modes
+
+
+def benchmark(npoints=101, nmodes=2, cross_sections=10, latency=1e-3):
+    results = {}
+    for batch in [False, True]:
+        calls = 0
+        t0 = time.perf_counter()
+        for i in range(cross_sections):
+            s = _fake_mode_session(latency=latency)
+            waveguide_modes(
+                session=s,
+                wg_width=400e-9 + i * 20e-9,
+                npoints=npoints,
+                nmodes=nmodes,
+                batch=batch,
+                cache=False,
+            )
+            calls += len(s.calls)
+        results[batch] = (calls, time.perf_counter() - t0)
+    return results
+
+
+if __name__ == "__main__":
+    latency = 1e-3
+    cross_sections = 10
+    print(f"emulated lumapi latency {latency*1e3:.1f} ms per call, {cross_sections} cross sections")
+    print(f"{'wavelengths':>11} {'modes':>5} {'calls':>7} {'batched':>8} {'time (s)':>9} {'batched':>8} {'speedup':>8}")
+    for npoints, nmodes in [(11, 2), (101, 2), (101, 4)]:
+        r = benchmark(npoints, nmodes, cross_sections, latency)
+        (calls, t), (calls_batch, t_batch) = r[False], r[True]
+        print(
+            f"{npoints:>11} {nmodes:>5} {calls:>7} {calls_batch:>8} {t:>9.3f}"
+            f" {t_batch:>8.3f} {t / t_batch:>7.1f}x"
+        )
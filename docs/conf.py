@@ -2,7 +2,7 @@ from recommonmark.parser import CommonMarkParser
 from recommonmark.transform import AutoStructify
 
 project = "pylum"
-version = "0.0.2"
+version = "0.0.3"
 copyright = "2019, Joaquin"
 author = "Joaquin"
 
@@ -1,5 +1,6 @@
 """ pylum: lumerical templates for simulations"""
 import pylum.plot as plot
+import pylum.sessions as sessions
 from pylum.autoname import autoname
 from pylum.config import CONFIG
 from pylum.loadmat import loadmat
@@ -8,7 +9,7 @@ from pylum.run import run_mode
 from pylum.write_scripts import mkdir
 from pylum.write_scripts import write_scripts
 
-__version__ = "0.0.2"
+__version__ = "0.0.3"
 __author__ = "Joaquin <j>"
 __all__ = [
     "CONFIG",
@@ -18,6 +19,7 @@ __all__ = [
     "run_fdtd",
     "run_mode",
     "plot",
+    "sessions",
     "write_scripts",
 ]
 
@@ -0,0 +1,268 @@
+""" adaptive sampling sweeps: simulate where the response is uncertain or curved
+
+Instead of a uniform grid (`steps=11` in both dimensions is 121 simulations),
+`adaptive_sweep` starts from a small Latin hypercube and fits a Gaussian process
+(`pylum.surrogate.GaussianProcess`) to the output. Each batch adds the points
+with the largest score, the surrogate standard deviation weighted up by the
+curvature of the mean (|laplacian|), so points concentrate on peaks and edges.
+It stops once the largest standard deviation is below `tolerance` or after
+`max_points`.
+
+Batches run through `pylum.sweep` and default to one point per worker session,
+so cached points are loaded and failed points are skipped. If every point of the
+initial batch fails there is nothing to fit and a ValueError is raised.
+
+benchmarks/adaptive_gc.py only measures the toy analytic `_grating` response (no
+FDTD): adaptive sampling finds its peak with 46-66 evaluations instead of the 121
+of the 11 x 11 grid. The savings on real simulations depend on how smooth their
+response is, and have not been measured.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.adaptive import adaptive_sweep
+    from pylum.waveguide_dispersion import waveguide_dispersion
+
+    d = adaptive_sweep(
+        waveguide_dispersion,
+        bounds=dict(wg_width=(440e-9, 500e-9), wg_height=(195e-9, 235e-9)),
+        output=lambda d: np.mean(d["ng"]),
+        tolerance=1e-3,
+        solver="MODE",
+    )
+    d["points"]  # DataFrame of the simulated points
+"""
+import numpy as np
+import pandas as pd
+
+from pylum import sessions
+from pylum.surrogate import GaussianProcess
+from pylum.surrogate import _get_output
+from pylum.sweep import sweep
+
+
+def latin_hypercube(n, d, rng=None):
+    """ returns n points in [0, 1]^d, one per row and column of an n x n grid """
+    rng = rng or np.random.default_rng()
+    u = (rng.random((n, d)) + np.arange(n)[:, None]) / n
+    for j in range(d):
+        u[:, j] = rng.permutation(u[:, j])
+    return u
+
+
+def score(gp, U, curvature_weight=1.0, h=1e-2):
+    """returns the sampling score of points U (n, d) in [0, 1] scaled inputs
+
+    standard deviation times (1 + curvature_weight |laplacian|), the laplacian of
+    the mean normalized to its largest value among U, so curved regions are refined
+    first and the score still drops to zero once they are well sampled
+    """
+    mean, std = gp.predict(U)
+    ndim = U.shape[1]
+    laplacian = 0
+    for j in range(ndim):
+        dx = np.zeros(ndim)
+        dx[j] = h
+        up = gp.predict(U + dx, return_std=False)
+        down = gp.predict(U - dx, return_std=False)
+        laplacian = laplacian + (up + down - 2 * mean) / h ** 2
+    curvature = np.abs(laplacian) / max(np.abs(laplacian).max(), 1e-30)
+    return std * (1 + curvature_weight * curvature)
+
+
+def next_points(gp, U, y, batch_size, ncandidates=2000, curvature_weight=1.0, rng=None):
+    """returns the next batch of points (batch_size, d) in [0, 1] scaled inputs
+
+    picks the best score, adds it with its predicted mean (kriging believer) so
+    the standard deviation drops around it, and repeats
+
+    Args:
+        gp: GaussianProcess fitted to U, y
+        U: simulated points (n, d) in [0, 1]
+        y: simulated outputs (n,)
+        batch_size: number of points
+        ncandidates: random candidates scored
+        curvature_weight: see score
+        rng: numpy random Generator
+    """
+    rng = rng or np.random.default_rng()
+    candidates = rng.random((ncandidates, U.shape[1]))
+    batch = []
+    model = gp
+    for _ in range(batch_size):
+        i = np.argmax(score(model, candidates, curvature_weight))
+        batch.append(candidates[i])
+        U = np.vstack([U, candidates[i]])
+        y = np.append(y, model.predict(candidates[i], return_std=False))
+        candidates = np.delete(candidates, i, axis=0)
+        model = GaussianProcess(noise=gp.noise)
+        model.length_scale = gp.length_scale
+        model.fit(U, y, optimize=False)
+    return np.array(batch)
+
+
+def _evaluate(function, output, points, fixed, **sweep_kwargs):
+    df = sweep(function, kwargs_list=[dict(fixed, **p) for p in points], **sweep_kwargs)
+    values = [
+        np.nan if not pd.isnull(row["error"]) else _get_output(output, row)
+        for row in df.to_dict("records")
+    ]
+    return df, np.array(values, dtype=float)
+
+
+def adaptive_sweep(
+    function,
+    bounds,
+    output,
+    fixed=None,
+    tolerance=1e-2,
+    max_points=60,
+    initial_points=None,
+    batch_size=None,
+    curvature_weight=1.0,
+    ncandidates=2000,
+    seed=0,
+    solver=None,
+    processes=None,
+    lumapi=None,
+    progress=True,
+):
+    """runs a function where a surrogate of its output is uncertain or curved
+
+    Args:
+        function: pylum function
+        bounds: dict of name: (min, max) for the swept settings
+        output: result key (scalar) or function of the result dict returning a float
+        fixed: other settings passed to every call
+        tolerance: stops when the largest surrogate std is below (output units)
+        max_points: maximum number of simulations
+        initial_points: size of the initial Latin hypercube (default 2 dims + 2)
+        batch_size: points per batch (default: processes, or the session pool size)
+        curvature_weight: how much curvature increases the score of uncertain points
+        ncandidates: random candidates scored per batch point
+        seed: random seed
+        solver, processes, lumapi, progress: see `pylum.sweep.sweep`
+
+    Returns:
+        points: DataFrame of simulated points with `output` column
+        model: GaussianProcess fitted to all the points (inputs scaled to bounds)
+        best: settings with the largest predicted output, and its `output`
+        converged: True if the tolerance was reached
+    """
+    rng = np.random.default_rng(seed)
+    fixed = dict(fixed or {})
+    names = list(bounds.keys())
+    lower = np.array([bounds[k][0] for k in names], dtype=float)
+    upper = np.array([bounds[k][1] for k in names], dtype=float)
+    ndim = len(names)
+    batch_size = batch_size or processes or sessions.get_pool().size
+    initial_points = initial_points or 2 * ndim + 2
+    sweep_kwargs = dict(
+        solver=solver, processes=processes, lumapi=lumapi, progress=progress
+    )
+
+    def to_kwargs(U):
+        X = lower + U * (upper - lower)
+        return [{k: float(x[j]) for j, k in enumerate(names)} for x in X]
+
+    frames = []
+    U = np.zeros((0, ndim))
+    y = np.zeros(0)
+    batch = latin_hypercube(initial_points, ndim, rng)
+    gp = GaussianProcess()
+
+    while True:
+        df, values = _evaluate(function, output, to_kwargs(batch), fixed, **sweep_kwargs)
+        df["output"] = values
+        frames.append(df)
+        ok = np.isfinite(values)
+        U = np.vstack([U, batch[ok]])
+        y = np.append(y, values[ok])
+        if not len(y):
+            error = df["error"].dropna()
+            raise ValueError(
+                f"no successful evaluations of {function.__name__} in the initial"
+                f" {len(batch)} points"
+                + (f", first error:\n{error.iloc[0]}" if len(error) else "")
+            )
+        gp.fit(U, y)
+
+        _, std = gp.predict(rng.random((ncandidates, ndim)))
+        converged = std.max() < tolerance
+        nsimulated = sum(len(f) for f in frames)
+        if converged or nsimulated >= max_points:
+            break
+        n = min(batch_size, max_points - nsimulated)
+        batch = next_points(gp, U, y, n, ncandidates, curvature_weight, rng)
+
+    candidates = rng.random((20 * ncandidates, ndim))
+    mean = gp.predict(candidates, return_std=False)
+    best = to_kwargs(candidates[[np.argmax(mean)]])[0]
+    best["output"] = float(mean.max())
+    return dict(
+        points=pd.concat(frames, ignore_index=True),
+        model=gp,
+        best=best,
+        converged=converged,
+    )
+
+
+def _grating(period=0.66e-6, ff=0.5, wavelength=1.55e-6):
+    """ toy grating coupler response, peak wavelength from the Bragg condition """
+    neff = 2.3 + 0.6 * ff
+    peak_wavelength = period * (neff - np.sin(np.radians(20)))
+    transmission = 0.7 * np.exp(-(((ff - 0.45) / 0.15) ** 2))
+    transmission *= np.exp(-(((peak_wavelength - wavelength) / 60e-9) ** 2))
+    return dict(transmission=transmission, peak_wavelength=peak_wavelength)
+
+
+def _failing_grating(period=0.66e-6, ff=0.5, wavelength=1.55e-6):
+    if ff > 0.6:
+        raise ValueError("simulation failed")
+    return _grating(period=period, ff=ff, wavelength=wavelength)
+
+
+def test_evaluate_failed_point():
+    points = [dict(ff=0.4), dict(ff=0.7), dict(ff=0.5)]
+    df, values = _evaluate(
+        _failing_grating, "transmission", points, {}, processes=0, progress=False
+    )
+    assert np.isnan(values[1])
+    expected = [_grating(ff=ff)["transmission"] for ff in [0.4, 0.5]]
+    assert np.allclose(values[[0, 2]], expected)
+
+
+def test_adaptive_sweep_all_failed():
+    import pytest
+
+    with pytest.raises(ValueError, match="no successful evaluations"):
+        adaptive_sweep(
+            _failing_grating,
+            bounds=dict(ff=(0.65, 0.8)),
+            output="transmission",
+            processes=0,
+            progress=False,
+        )
+
+
+def test_adaptive_sweep():
+    bounds = dict(period=(0.62e-6, 0.7e-6), ff=(0.3, 0.7))
+    d = adaptive_sweep(
+        _grating,
+        bounds,
+        output="transmission",
+        tolerance=5e-3,
+        max_points=40,
+        batch_size=4,
+        processes=0,
+        progress=False,
+    )
+    assert len(d["points"]) <= 40
+
+    period, ff = np.meshgrid(np.linspace(0.62e-6, 0.7e-6, 11), np.linspace(0.3, 0.7, 11))
+    grid = _grating(period=period, ff=ff)
+    i = np.argmax(grid["transmission"])
+    assert d["best"]["output"] >= grid["transmission"].flat[i] - 0.01
+
+    best = _grating(period=d["best"]["period"], ff=d["best"]["ff"])
+    assert abs(best["peak_wavelength"] - grid["peak_wavelength"].flat[i]) < 10e-9
@@ -0,0 +1,5 @@
+""" analytic and semi-analytic mode solvers (NumPy, no Lumerical license needed)
+
+- `slab`: TE/TM modes of 3-layer slab waveguides (port of `wg_1D_analytic.m`)
+- `eim`: effective index method for strip and rib waveguides (`wg_EIM.lsf`)
+"""
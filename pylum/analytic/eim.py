@@ -0,0 +1,113 @@
+""" effective index method (EIM) estimate of 2D waveguide modes, Python version of
+`templates/waveguide/wg_EIM.lsf` and `wg_EIM_profile.m` built on `pylum.analytic.slab`
+
+1. vertical slab (box, core, cladding) for the waveguide and the side slab
+2. horizontal slab with the vertical TE indices, solved for TM (TE-like 2D mode)
+
+Takes the same geometry and material kwargs as `pylum.waveguide.waveguide`, and
+all of them broadcast, so a whole width x height x wavelength grid is one call.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.analytic.eim import eim_dispersion
+
+    d = eim_dispersion(wg_width=np.linspace(440e-9, 500e-9, 7)[:, None])
+    d["ng"].shape  # (7, number of wavelengths)
+"""
+import numpy as np
+
+from pylum.analytic.slab import slab
+from pylum.materials import refractive_index
+
+
+def eim(
+    wavelength=1550e-9,
+    wg_width=500e-9,
+    wg_height=220e-9,
+    slab_height=0,
+    material_wg="si",
+    material_clad="sio2",
+    material_box="sio2",
+    mode_number=1,
+    **kwargs,
+):
+    """returns effective index of the TE-like mode of a strip or rib waveguide
+
+    Args:
+        wavelength: 1550e-9
+        wg_width: 500e-9
+        wg_height: 220e-9
+        slab_height: 0
+        material_wg: "si"
+        material_clad: "sio2"
+        material_box: "sio2"
+        mode_number: 1 for fundamental, 2 for 2nd order ...
+        kwargs: other `pylum.waveguide.waveguide` settings (ignored, mesh and margins)
+
+    Returns:
+        neff, nan where the mode is not guided
+    """
+    n_core = refractive_index(material_wg, wavelength)
+    n_clad = refractive_index(material_clad, wavelength)
+    n_box = refractive_index(material_box, wavelength)
+
+    n_te = slab(wavelength, wg_height, n_box, n_core, n_clad, nmodes=1)["neff"][..., 0]
+    n_te_slab = slab(
+        wavelength, np.maximum(slab_height, 1e-12), n_box, n_core, n_clad, nmodes=1
+    )["neff"][..., 0]
+    n_side = np.where(np.asarray(slab_height) > 0, n_te_slab, n_clad)
+    n_side = np.where(np.isnan(n_side), n_clad, n_side)
+
+    d = slab(wavelength, wg_width, n_side, n_te, n_side, "TM", nmodes=mode_number)
+    return d["neff"][..., mode_number - 1]
+
+
+def eim_dispersion(
+    wavelength=1.55e-6, wavelength_min=1.5e-6, npoints=10, mode_number=1, **kwargs
+):
+    """returns effective and group index over wavelength with the EIM
+
+    same arguments and results as `pylum.waveguide_dispersion.waveguide_dispersion`,
+    wavelengths go from wavelength to wavelength_min (last axis)
+
+    Args:
+        wavelength: 1550e-9
+        wavelength_min: 1500e-9
+        npoints: number of wavelengths
+        mode_number: 1 for fundamental, 2 for 2nd order ...
+        kwargs: waveguide geometry and materials (see eim)
+
+    Returns:
+        wavelengths
+        neff
+        ng: neff - wavelength dneff/dwavelength, includes material dispersion
+    """
+    wavelengths = np.linspace(wavelength, wavelength_min, npoints)
+    kwargs = {
+        k: np.asarray(v)[..., None] if np.ndim(v) else v for k, v in kwargs.items()
+    }
+    dw = wavelengths * 1e-4
+    neff = eim(wavelength=wavelengths, mode_number=mode_number, **kwargs)
+    neff1 = eim(wavelength=wavelengths - dw, mode_number=mode_number, **kwargs)
+    neff2 = eim(wavelength=wavelengths + dw, mode_number=mode_number, **kwargs)
+    ng = neff - wavelengths * (neff2 - neff1) / (2 * dw)
+    return dict(wavelengths=wavelengths, neff=neff, ng=ng)
+
+
+def test_eim():
+    neff = eim()
+    n_slab = slab(1.55e-6, 220e-9, 1.444, 3.4777, 1.444)["neff"][0]
+    assert 2.3 < neff < n_slab
+
+    neff = eim(wg_width=np.array([400e-9, 500e-9, 600e-9]), slab_height=90e-9)
+    assert np.all(np.diff(neff) > 0)
+    assert eim(wg_width=2e-6, mode_number=2) < eim(wg_width=2e-6)
+    assert np.isnan(eim(wg_width=200e-9, mode_number=2))
+
+
+def test_eim_dispersion():
+    d = eim_dispersion(wg_width=np.array([450e-9, 500e-9]), wg_height=220e-9)
+    assert d["neff"].shape == (2, 10)
+    assert np.all((d["ng"] > 4) & (d["ng"] < 4.6))
+    assert np.all(np.diff(d["neff"], axis=-1) > 0)
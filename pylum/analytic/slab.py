@@ -0,0 +1,180 @@
+""" analytic TE/TM modes of a 3-layer slab waveguide, NumPy port of
+`templates/waveguide/wg_1D_analytic.m` (Yariv, Photonics, chapter 3)
+
+::
+
+    n3   cladding
+    n2   core, thickness t
+    n1   substrate
+
+All arguments broadcast, so whole arrays of geometries are solved at once. Each
+mode m is the root of the phase condition
+
+    h t = m pi + atan(p' / h) + atan(q' / h)
+
+(p' = p, q' = q for TE and p' = (n2/n3)^2 p, q' = (n2/n1)^2 q for TM), which is
+monotonic in neff between max(n1, n3) and n2, so every mode is bracketed
+and refined with vectorized Newton steps that fall back to bisection.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.analytic.slab import slab
+
+    t = np.linspace(100e-9, 400e-9, 1000)
+    d = slab(wavelength=1.55e-6, t=t, n1=1.444, n2=3.47, n3=1.444)
+    d["neff"].shape  # (1000, number of modes), nan where the mode is not guided
+"""
+import numpy as np
+
+polarizations = ["TE", "TM"]
+
+
+def _phase(phi, k0, t, n1, n2, n3, m, polarization="TE", derivative=False):
+    """returns h t - m pi - atan(p'/h) - atan(q'/h), decreasing in phi
+
+    and its derivative with respect to phi if derivative=True. The mode is
+    parametrized by h = V cos(phi), with V = k0 sqrt(n2^2 - max(n1, n3)^2) and phi
+    from 0 (cutoff) to pi/2 (neff = n2), so the phase is smooth at both ends
+    """
+    V2 = k0 ** 2 * (n2 ** 2 - np.maximum(n1, n3) ** 2)
+    h = np.sqrt(V2) * np.cos(phi)
+    beta2 = (k0 * n2) ** 2 - h ** 2
+    q = np.sqrt(np.maximum(beta2 - (k0 * n1) ** 2, 0))
+    p = np.sqrt(np.maximum(beta2 - (k0 * n3) ** 2, 0))
+    cp = (n2 / n3) ** 2 if polarization == "TM" else 1
+    cq = (n2 / n1) ** 2 if polarization == "TM" else 1
+    phase = h * t - m * np.pi - np.arctan2(cp * p, h) - np.arctan2(cq * q, h)
+    if not derivative:
+        return phase
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dh = -np.sqrt(V2) * np.sin(phi)
+        dbeta2 = -2 * h * dh
+        dp = cp * dbeta2 / (2 * p)
+        dq = cq * dbeta2 / (2 * q)
+        datan_p = (h * dp - cp * p * dh) / (h ** 2 + (cp * p) ** 2)
+        datan_q = (h * dq - cq * q * dh) / (h ** 2 + (cq * q) ** 2)
+        return phase, dh * t - datan_p - datan_q
+
+
+def mode_count(wavelength, t, n1, n2, n3, polarization="TE"):
+    """ returns the number of guided modes """
+    k0 = 2 * np.pi / np.asarray(wavelength)
+    phase = _phase(0, k0, t, n1, n2, n3, 0, polarization)
+    return np.where(phase > 0, np.floor(phase / np.pi) + 1, 0).astype(int)
+
+
+def slab(
+    wavelength=1.55e-6,
+    t=220e-9,
+    n1=1.444,
+    n2=3.47,
+    n3=1.444,
+    polarization="TE",
+    nmodes=None,
+    iterations=10,
+):
+    """returns guided modes of a slab waveguide, fundamental first
+
+    Args:
+        wavelength: (m)
+        t: core thickness (m)
+        n1: substrate index
+        n2: core index
+        n3: cladding index
+        polarization: TE or TM
+        nmodes: number of modes returned (defaults to the most guided in the batch)
+        iterations: safeguarded Newton steps
+
+    Returns:
+        neff: (..., nmodes) effective index, nan for modes that are not guided
+        h: (..., nmodes) transverse wavevector in the core (1/m)
+        q: (..., nmodes) decay constant in the substrate (1/m)
+        p: (..., nmodes) decay constant in the cladding (1/m)
+    """
+    if polarization not in polarizations:
+        raise ValueError(f"{polarization} not in {polarizations}")
+
+    wavelength, t, n1, n2, n3 = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in [wavelength, t, n1, n2, n3]]
+    )
+    if nmodes is None:
+        count = mode_count(wavelength, t, n1, n2, n3, polarization)
+        nmodes = max(int(count.max(initial=0)), 1)
+
+    m = np.arange(nmodes)
+    k0, t, n1, n2, n3 = [x[..., None] for x in [2 * np.pi / wavelength, t, n1, n2, n3]]
+    lower = np.zeros(n2.shape[:-1] + (nmodes,))
+    upper = np.full_like(lower, np.pi / 2)
+    guided = _phase(lower, k0, t, n1, n2, n3, m, polarization) > 0
+
+    # Newton steps, falling back to bisection when a step leaves the bracket
+    phi = (lower + upper) / 2
+    for _ in range(iterations):
+        phase, dphase = _phase(phi, k0, t, n1, n2, n3, m, polarization, True)
+        above = phase > 0
+        lower = np.where(above, phi, lower)
+        upper = np.where(above, upper, phi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = phi - phase / dphase
+        inside = (step >= lower) & (step <= upper)
+        phi = np.where(inside, step, (lower + upper) / 2)
+
+    h = k0 * np.sqrt(n2 ** 2 - np.maximum(n1, n3) ** 2) * np.cos(phi)
+    neff = np.where(guided, np.sqrt(n2 ** 2 - (h / k0) ** 2), np.nan)
+    h = k0 * np.sqrt(n2 ** 2 - neff ** 2)
+    q = k0 * np.sqrt(neff ** 2 - n1 ** 2)
+    p = k0 * np.sqrt(neff ** 2 - n3 ** 2)
+    return dict(neff=neff, h=h, q=q, p=p)
+
+
+def _eq(neff, k0, t, n1, n2, n3, polarization="TE"):
+    """ dispersion equations of wg_1D_analytic.m (TE_eq, TM_eq) """
+    b = neff * k0
+    h = np.sqrt((n2 * k0) ** 2 - b ** 2)
+    q = np.sqrt(b ** 2 - (n1 * k0) ** 2)
+    p = np.sqrt(b ** 2 - (n3 * k0) ** 2)
+    if polarization == "TM":
+        p = (n2 / n3) ** 2 * p
+        q = (n2 / n1) ** 2 * q
+    return np.tan(h * t) - h * (p + q) / (h ** 2 - p * q)
+
+
+def test_slab():
+    wavelength, t, n1, n2, n3 = 1.55e-6, 220e-9, 1.444, 3.47, 1.444
+    te = slab(wavelength, t, n1, n2, n3)
+    tm = slab(wavelength, t, n1, n2, n3, polarization="TM")
+    assert te["neff"].shape == (1,)
+    assert np.allclose(te["neff"], 2.84185, atol=1e-5)
+    assert np.allclose(tm["neff"], 2.04889, atol=1e-5)
+    k0 = 2 * np.pi / wavelength
+    assert abs(_eq(te["neff"][0], k0, t, n1, n2, n3)) < 1e-9
+    assert abs(_eq(tm["neff"][0], k0, t, n1, n2, n3, "TM")) < 1e-9
+
+
+def test_slab_batch():
+    t = np.linspace(100e-9, 2e-6, 200)[:, None]
+    wavelength = np.array([1.31e-6, 1.55e-6])
+    d = slab(wavelength, t, 1.444, 3.47, 1.0)
+    assert d["neff"].shape[:2] == (200, 2)
+    count = mode_count(wavelength, t, 1.444, 3.47, 1.0)
+    assert np.array_equal(np.isfinite(d["neff"]).sum(axis=-1), count)
+
+    # higher order modes have lower neff, all between the cladding and core index
+    neff = d["neff"]
+    assert np.all(np.diff(neff, axis=-1)[np.isfinite(np.diff(neff, axis=-1))] < 0)
+    assert np.nanmin(neff) > 1.444 and np.nanmax(neff) < 3.47
+
+    d_bisection = slab(wavelength, t, 1.444, 3.47, 1.0, iterations=60)
+    assert np.allclose(d["neff"], d_bisection["neff"], equal_nan=True, atol=1e-12)
+
+
+if __name__ == "__main__":
+    import time
+
+    t = np.linspace(50e-9, 500e-9, 1000)[:, None]
+    wavelength = np.linspace(1.5e-6, 1.6e-6, 1000)
+    t0 = time.perf_counter()
+    d = slab(wavelength, t, 1.444, 3.47, 1.444)
+    print(f"{t.size * wavelength.size} slabs in {time.perf_counter() - t0:.2f} s")
@@ -0,0 +1,351 @@
+""" apodized and chirped grating coupler designs, `gc2d(gap_width_list=...)` in bulk
+
+Each tooth (width) and trench (gap) is designed from local effective indices of
+the unetched and etched slabs (`pylum.analytic.slab`), weighted by the fill factor
+
+    neff(ff) = ff n_full + (1 - ff) n_etched
+    period = wavelength / (neff(ff) - n_clad sin(fiber_angle))
+
+so every tooth is phase matched to the fiber, and scatters with a strength that
+follows the first Fourier component of the etch
+
+    alpha(ff) = alpha_max sin(pi ff)^2
+
+`linear` ramps the fill factor, `gaussian` picks the fill factor of each tooth so
+the outcoupled field follows the fiber mode. `overlap` is a 1D coupled-mode
+estimate of the fiber coupling (the decaying waveguide power radiates 2 alpha P,
+with the phase errors of each tooth) to pre-rank candidates before FDTD.
+
+All arguments broadcast over designs, teeth are the last axis of the results.
+`linear` and `overlap` are vectorized over the teeth too, `gaussian` designs the
+teeth one after the other (with all the designs at each step) since the fill
+factor of a tooth depends on the power left by the previous ones.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.apodization import gaussian, gap_width_list, rank
+    from pylum.gc import gc2d
+
+    d = gaussian(
+        fiber_offset=np.linspace(3e-6, 7e-6, 41)[:, None],
+        alpha_max=np.linspace(0.1e6, 0.3e6, 41),
+    )
+    best = rank(d, top=4)
+    designs = gap_width_list(d)
+    for i in best:
+        gc2d(gap_width_list=designs[i])
+"""
+import numpy as np
+
+from pylum.analytic.slab import slab
+from pylum.materials import refractive_index
+
+
+def effective_indices(
+    wavelength=1550e-9,
+    wg_height=220e-9,
+    etch_depth=70e-9,
+    material_wg="si",
+    material_clad="sio2",
+    material_box="sio2",
+):
+    """returns (n_full, n_etched, n_clad) TE slab effective indices and cladding index
+
+    Args:
+        wavelength: 1550e-9
+        wg_height: 220e-9
+        etch_depth: 70e-9
+        material_wg: si
+        material_clad: sio2
+        material_box: sio2
+    """
+    n_core = refractive_index(material_wg, wavelength)
+    n_clad = refractive_index(material_clad, wavelength)
+    n_box = refractive_index(material_box, wavelength)
+    t = np.stack(np.broadcast_arrays(wg_height, np.subtract(wg_height, etch_depth)))
+    neff = slab(wavelength, t, n_box, n_core, n_clad, nmodes=1)["neff"][..., 0]
+    return neff[0], neff[1], n_clad
+
+
+def default_alpha_max(n_full, n_etched, wavelength=1550e-9):
+    """returns a rough scattering strength (1/m) for ff=0.5, pi dn^2 / wavelength
+
+    about 0.2/um for a 70 nm etch in 220 nm SOI, calibrate it against one FDTD run
+    """
+    return np.pi * (n_full - n_etched) ** 2 / wavelength
+
+
+def strength(ff, alpha_max):
+    """ returns scattering strength alpha (1/m) of teeth with fill factor ff """
+    return alpha_max * np.sin(np.pi * ff) ** 2
+
+
+def _fill_factor(alpha, alpha_max, ff_min, ff_max):
+    """ returns the fill factor (0.5 to 1 branch) that scatters alpha """
+    a = np.clip(alpha / alpha_max, 0, 1)
+    return np.clip(1 - np.arcsin(np.sqrt(a)) / np.pi, ff_min, ff_max)
+
+
+def _period(ff, wavelength, n_full, n_etched, n_clad, fiber_angle_deg):
+    neff = ff * n_full + (1 - ff) * n_etched
+    return wavelength / (neff - n_clad * np.sin(np.radians(fiber_angle_deg)))
+
+
+def linear(
+    ff_start=0.9,
+    ff_end=0.5,
+    n_gratings=30,
+    fiber_angle_deg=20,
+    alpha_max=None,
+    wavelength=1550e-9,
+    **kwargs,
+):
+    """returns a linearly apodized (and phase matched, so chirped) grating
+
+    Args:
+        ff_start: fill factor of the first tooth
+        ff_end: fill factor of the last tooth
+        n_gratings: number of teeth
+        fiber_angle_deg: 20
+        alpha_max: scattering strength at ff=0.5 (1/m), defaults to default_alpha_max
+        wavelength: 1550e-9
+        kwargs: wg_height, etch_depth and materials (see effective_indices)
+
+    Returns:
+        gap: (..., n_gratings) etched length of each tooth
+        width: (..., n_gratings) unetched length of each tooth
+        alpha: (..., n_gratings) scattering strength
+        settings: the design settings
+    """
+    n_full, n_etched, n_clad = effective_indices(wavelength=wavelength, **kwargs)
+    if alpha_max is None:
+        alpha_max = default_alpha_max(n_full, n_etched, wavelength)
+    x = np.linspace(0, 1, n_gratings)
+    ff = np.asarray(ff_start)[..., None] * (1 - x) + np.asarray(ff_end)[..., None] * x
+    period = _period(
+        ff,
+        wavelength,
+        np.asarray(n_full)[..., None],
+        np.asarray(n_etched)[..., None],
+        np.asarray(n_clad)[..., None],
+        np.asarray(fiber_angle_deg)[..., None],
+    )
+    settings = dict(
+        kwargs,
+        ff_start=ff_start,
+        ff_end=ff_end,
+        fiber_angle_deg=fiber_angle_deg,
+        alpha_max=alpha_max,
+        wavelength=wavelength,
+    )
+    return dict(
+        gap=period * (1 - ff),
+        width=period * ff,
+        alpha=strength(ff, np.asarray(alpha_max)[..., None]),
+        settings=settings,
+    )
+
+
+def fiber_mode(z, mfd=10.4e-6, fiber_offset=5e-6, fiber_angle_deg=20):
+    """returns fiber mode intensity along the grating, normalized to 1 over z
+
+    Gaussian with waist mfd / 2 projected on the grating tilted by the fiber angle
+    """
+    w0 = mfd / 2
+    c = np.cos(np.radians(fiber_angle_deg))
+    return np.exp(-2 * ((z - fiber_offset) * c / w0) ** 2) * c / (w0 * np.sqrt(np.pi / 2))
+
+
+def gaussian(
+    mfd=10.4e-6,
+    fiber_offset=None,
+    n_gratings=30,
+    ff_min=0.5,
+    ff_max=0.9,
+    fiber_angle_deg=20,
+    alpha_max=None,
+    wavelength=1550e-9,
+    **kwargs,
+):
+    """returns a grating apodized so the outcoupled field matches the fiber mode
+
+    each tooth scatters alpha = G^2 / (2 P), the fiber intensity G^2 over the power
+    left in the waveguide P, within the fill factors ff_min to ff_max, so the teeth
+    are a recurrence computed tooth by tooth for all the designs at once
+
+    Args:
+        mfd: fiber mode field diameter
+        fiber_offset: fiber center from the first tooth (defaults to mfd / 2)
+        n_gratings: number of teeth
+        ff_min: lowest fill factor (strongest teeth, 0.5 is the strongest)
+        ff_max: highest fill factor (weakest teeth, smallest trench)
+        fiber_angle_deg: 20
+        alpha_max: scattering strength at ff=0.5 (1/m), defaults to default_alpha_max
+        wavelength: 1550e-9
+        kwargs: wg_height, etch_depth and materials (see effective_indices)
+
+    Returns:
+        gap: (..., n_gratings) etched length of each tooth
+        width: (..., n_gratings) unetched length of each tooth
+        alpha: (..., n_gratings) scattering strength
+        settings: the design settings
+    """
+    n_full, n_etched, n_clad = effective_indices(wavelength=wavelength, **kwargs)
+    if alpha_max is None:
+        alpha_max = default_alpha_max(n_full, n_etched, wavelength)
+    if fiber_offset is None:
+        fiber_offset = mfd / 2 * np.ones_like(mfd)
+    arrays = np.broadcast_arrays(
+        mfd, fiber_offset, ff_min, ff_max, fiber_angle_deg, alpha_max, n_full, n_etched, n_clad
+    )
+    mfd, fiber_offset, ff_min, ff_max, angle, alpha_max, n_full, n_etched, n_clad = [
+        np.asarray(a, dtype=float) for a in arrays
+    ]
+
+    shape = mfd.shape + (n_gratings,)
+    ff = np.empty(shape)
+    period = np.empty(shape)
+    z = np.zeros(mfd.shape)
+    power = np.ones(mfd.shape)
+    for i in range(n_gratings):
+        p = _period(0.5 * (ff_min + ff_max), wavelength, n_full, n_etched, n_clad, angle)
+        G2 = fiber_mode(z + p / 2, mfd, fiber_offset, angle)
+        alpha = G2 / (2 * np.maximum(power, 1e-3))
+        ff[..., i] = _fill_factor(alpha, alpha_max, ff_min, ff_max)
+        period[..., i] = _period(ff[..., i], wavelength, n_full, n_etched, n_clad, angle)
+        power = power * np.exp(-2 * strength(ff[..., i], alpha_max) * period[..., i])
+        z = z + period[..., i]
+
+    settings = dict(
+        kwargs,
+        mfd=mfd,
+        fiber_offset=fiber_offset,
+        ff_min=ff_min,
+        ff_max=ff_max,
+        fiber_angle_deg=angle,
+        alpha_max=alpha_max,
+        wavelength=wavelength,
+    )
+    return dict(
+        gap=period * (1 - ff),
+        width=period * ff,
+        alpha=strength(ff, alpha_max[..., None]),
+        settings=settings,
+    )
+
+
+def overlap(
+    gap,
+    width,
+    mfd=10.4e-6,
+    fiber_offset=None,
+    fiber_angle_deg=20,
+    alpha_max=None,
+    wavelength=1550e-9,
+    **kwargs,
+):
+    """returns 1D coupled-mode estimate of the fiber coupling efficiency
+
+    the waveguide power P decays by exp(-2 alpha period) on each tooth and the
+    radiated field sqrt(2 alpha P) accumulates the phase error of each tooth
+    (2 pi / wavelength (neff - n_clad sin(angle)) period - 2 pi), its overlap with
+    the fiber mode is the upwards coupling (no directionality or reflections)
+
+    Args:
+        gap: (..., n_gratings) etched length of each tooth
+        width: (..., n_gratings) unetched length of each tooth
+        mfd: fiber mode field diameter
+        fiber_offset: fiber center from the first tooth, None for the best position
+        fiber_angle_deg: 20
+        alpha_max: scattering strength at ff=0.5 (1/m), defaults to default_alpha_max
+        wavelength: 1550e-9
+        kwargs: wg_height, etch_depth and materials (see effective_indices)
+    """
+    gap, width = np.broadcast_arrays(np.asarray(gap, float), np.asarray(width, float))
+    n_full, n_etched, n_clad = effective_indices(wavelength=wavelength, **kwargs)
+    if alpha_max is None:
+        alpha_max = default_alpha_max(n_full, n_etched, wavelength)
+    period = gap + width
+    ff = width / period
+
+    def expand(x):
+        return np.asarray(x, dtype=float)[..., None]
+
+    alpha = strength(ff, expand(alpha_max))
+    decay = 2 * alpha * period
+    power = np.exp(-np.cumsum(decay, axis=-1) + decay)
+    amplitude = np.sqrt(power * -np.expm1(-decay) / period)
+
+    neff = ff * expand(n_full) + (1 - ff) * expand(n_etched)
+    angle = np.radians(expand(fiber_angle_deg))
+    dphase = 2 * np.pi / wavelength * (neff - expand(n_clad) * np.sin(angle)) * period
+    phase = np.cumsum(dphase - 2 * np.pi, axis=-1) - (dphase - 2 * np.pi) / 2
+    z = np.cumsum(period, axis=-1) - period / 2
+    field = amplitude * np.exp(1j * phase) * period
+
+    def coupling(offset):
+        G = np.sqrt(fiber_mode(z, expand(mfd), offset, expand(fiber_angle_deg)))
+        return np.abs(np.sum(field * G, axis=-1)) ** 2
+
+    if fiber_offset is not None:
+        return coupling(expand(fiber_offset))
+    offsets = np.linspace(0, 1, 41) * z[..., -1:]
+    return np.max([coupling(offsets[..., i : i + 1]) for i in range(41)], axis=0)
+
+
+def gap_width_list(d):
+    """ returns gc2d gap_width_list (list of (gap, width)) of each design, flattened """
+    gap = np.reshape(d["gap"], (-1, np.shape(d["gap"])[-1]))
+    width = np.reshape(d["width"], gap.shape)
+    return [list(zip(g.tolist(), w.tolist())) for g, w in zip(gap, width)]
+
+
+def rank(d, top=None, **kwargs):
+    """returns flat indices of the designs sorted by overlap (best first)
+
+    Args:
+        d: designs from linear or gaussian
+        top: number of designs returned, None for all
+        kwargs: overlap settings (defaults to the design settings)
+    """
+    settings = {
+        k: v
+        for k, v in d["settings"].items()
+        if k not in ["ff_start", "ff_end", "ff_min", "ff_max"]
+    }
+    settings.update(kwargs)
+    efficiency = overlap(d["gap"], d["width"], **settings)
+    efficiency = np.broadcast_to(efficiency, np.shape(d["gap"])[:-1]).ravel()
+    return np.argsort(-efficiency, kind="stable")[:top]
+
+
+def test_linear():
+    d = linear(ff_start=np.array([0.9, 0.8]), ff_end=0.5, n_gratings=20)
+    assert d["gap"].shape == (2, 20)
+    ff = d["width"] / (d["gap"] + d["width"])
+    assert np.allclose(ff[:, -1], 0.5) and np.allclose(ff[:, 0], [0.9, 0.8])
+    period = d["gap"] + d["width"]
+    assert 0.55e-6 < period[0, -1] < 0.75e-6
+    assert np.all(np.diff(period, axis=-1) > 0)
+
+    designs = gap_width_list(d)
+    assert len(designs) == 2 and len(designs[0]) == 20
+    assert isinstance(designs[0][0][0], float)
+
+
+def test_overlap():
+    uniform = linear(ff_start=0.5, ff_end=0.5, n_gratings=40)
+    eta_uniform = overlap(uniform["gap"], uniform["width"])
+    assert 0.6 < eta_uniform < 0.82  # 0.8 at best for an exponential field
+
+    d = gaussian(n_gratings=40, fiber_offset=np.linspace(2e-6, 8e-6, 13))
+    eta = overlap(d["gap"], d["width"], fiber_offset=d["settings"]["fiber_offset"])
+    assert eta.shape == (13,)
+    assert eta.max() > 0.9 and eta.max() > eta_uniform
+
+    detuned = overlap(d["gap"], d["width"], wavelength=1.6e-6)
+    assert np.all(detuned < eta)
+
+    best = rank(d, top=3)
+    assert best[0] == np.argmax(eta)
@@ -1,16 +1,21 @@
 import functools
 import hashlib
+import json
+import os
+import pathlib
+from inspect import Parameter
 from inspect import signature
 
 import numpy as np
 
-from pylum.cache import read_cache
-from pylum.cache import write_cache
-from pylum.config import CONFIG
+from pylum.cache import memory_cache
+from pylum.store import get_cache_filepath
+from pylum.store import get_store
 
 MAX_NAME_LENGTH = 255
 
-ignore_keys = ["session", "base_fsp_path"]
+ignore_keys = ["session", "base_fsp_path", "batch"]
+template_suffixes = [".fsp", ".lms", ".ldev", ".lsf", ".icp"]
 
 
 def get_function_name(function_name, **kwargs):
@@ -74,11 +79,11 @@ def clean_value(value):
     if isinstance(value, int):  # integer
         value = str(value)
     elif type(value) in [float, np.float64]:  # float
-        if 1e9 > value > 1e12:
+        if 1e12 > value >= 1e9:
             value = f"{int(value/1e9)}G"
-        elif 1e6 > value > 1e9:
+        elif 1e9 > value >= 1e6:
             value = f"{int(value/1e6)}M"
-        elif 1e3 > value > 1e6:
+        elif 1e6 > value >= 1e3:
             value = f"{int(value/1e3)}K"
         elif 1 > value > 1e-3:
             value = f"{int(value*1e3)}m"
@@ -110,10 +115,104 @@ def join_first_letters(name):
     return "".join([x[0] for x in name.split("_") if x])
 
 
-def autoname(function):
+def get_settings(function, **kwargs):
+    """ returns all the settings of a function call, defaults included """
+    sig = signature(function)
+    bound = sig.bind_partial(**kwargs)
+    bound.apply_defaults()
+    settings = {}
+    for key, value in bound.arguments.items():
+        if sig.parameters[key].kind == Parameter.VAR_KEYWORD:
+            settings.update(value)
+        else:
+            settings[key] = value
+    return settings
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_file(filepath, mtime_ns, size):
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_file(filepath):
+    """ returns the sha256 of a file, memoized on path, modification time and size """
+    stat = os.stat(filepath)
+    return _hash_file(str(filepath), stat.st_mtime_ns, stat.st_size)
+
+
+def is_template(value):
+    """ returns True for paths to existing Lumerical files """
+    return (
+        isinstance(value, (str, pathlib.Path))
+        and pathlib.Path(value).suffix in template_suffixes
+        and pathlib.Path(value).is_file()
+    )
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return dict(dtype=str(value.dtype), shape=value.shape, data=value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pathlib.PurePath):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if callable(value):
+        return f"{value.__module__}.{value.__qualname__}"
+    return repr(value)
+
+
+def get_cache_key(function, templates=(), **kwargs):
+    """returns a stable hash for a function call
+
+    The hash covers the function identity, all its settings (defaults included),
+    the contents of template files (settings that point to Lumerical files and
+    `templates`) and the pylum version, so editing a template misses the cache.
+    """
+    from pylum import __version__
+
+    settings = get_settings(function, **kwargs)
+    files = {}
+    for key in sorted(settings):
+        if key in ignore_keys and not is_template(settings[key]):
+            settings.pop(key)
+        elif is_template(settings[key]):
+            files[key] = hash_file(settings.pop(key))
+    for i, template in enumerate(templates):
+        if pathlib.Path(template).is_file():
+            files[f"template{i}"] = hash_file(template)
+
+    identity = dict(
+        function=f"{function.__module__}.{function.__qualname__}",
+        settings=settings,
+        templates=files,
+        version=__version__,
+    )
+    identity = json.dumps(identity, sort_keys=True, default=_to_json)
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def is_cached(function, **kwargs):
+    """ returns True if an @autoname function has cached results for kwargs """
+    return function.is_cached(**kwargs)
+
+
+def autoname(function=None, templates=()):
     """decorator for auto-naming functions
     if no Keyword argument `name`  is passed it creates a name by concenating all Keyword arguments
 
+    results are cached under a hash of the function, its settings and templates
+    (see `get_cache_key`), `templates` lists Lumerical files the function loads
+    that are not already passed as settings
+
+    draw-only functions (`gc2d`, `dbr(run=False)`) return nothing but their
+    session, so they are never cached and always draw
+
     .. plot::
       :include-source:
 
@@ -128,6 +227,16 @@ def autoname(function):
       >> mode_solver_WW1
 
     """
+    if function is None:
+        return functools.partial(autoname, templates=templates)
+
+    def _check_kwargs(kwargs):
+        sig = signature(function)
+        if "args" not in sig.parameters and "kwargs" not in sig.parameters:
+            for key in kwargs.keys():
+                assert (
+                    key in sig.parameters.keys()
+                ), f"{key} key not in {list(sig.parameters.keys())}"
 
     @functools.wraps(function)
     def wrapper(*args, **kwargs):
@@ -135,36 +244,43 @@ def autoname(function):
             raise ValueError("autoname supports only Keyword args")
         cache = kwargs.pop("cache", True)
         name = kwargs.pop("name", get_function_name(function.__name__, **kwargs))
+        _check_kwargs(kwargs)
 
-        sig = signature(function)
-        if "args" not in sig.parameters and "kwargs" not in sig.parameters:
-            for key in kwargs.keys():
-                assert (
-                    key in sig.parameters.keys()
-                ), f"{key} key not in {list(sig.parameters.keys())}"
+        key = get_cache_key(function, templates=templates, **kwargs)
+        store = get_store()
+        settings = get_settings(function, **kwargs)
+        settings.pop("session", "")
 
-        filepath = CONFIG["workspace"] / f"{name}.h5"
+        simdict = memory_cache.get(key) if cache else None
 
-        if cache and filepath.exists():
-            # simdict = dict(results=read_cache(filepath))
-            results = read_cache(filepath)
-            simdict = {k: v[()] for k, v in results.items()}
+        if simdict is None and cache and store.exists(function.__name__, key):
+            simdict = store.read(function.__name__, key)
+            memory_cache.put(key, simdict, copy=False)
 
-        else:
+        elif simdict is None:
             simdict = function(**kwargs)
             assert isinstance(
                 simdict, dict
-            ), f"Function {function.name} needs to return a dict"
-            write_cache(simdict, filepath)
+            ), f"Function {function.__name__} needs to return a dict"
+            results = {k: v for k, v in simdict.items() if k not in ignore_keys}
+            if results or "session" not in simdict:
+                store.write(
+                    function.__name__, key, results, name=name, settings=settings
+                )
+                memory_cache.put(key, results)
         simdict["name"] = name
         simdict["function_name"] = function.__name__
-        settings = kwargs.copy()
-
-        settings.update(**{p.name: p.default for p in sig.parameters.values()})
         simdict["settings"] = settings
-        simdict["settings"].pop("session", "")
         return simdict
 
+    def _is_cached(**kwargs):
+        kwargs.pop("cache", None)
+        kwargs.pop("name", None)
+        key = get_cache_key(function, templates=templates, **kwargs)
+        return get_store().exists(function.__name__, key)
+
+    wrapper.is_cached = _is_cached
+    wrapper.templates = templates
     return wrapper
 
 
@@ -205,6 +321,22 @@ def test_clean_value():
     assert clean_value(2e-06) == "2u"
     assert clean_value(2e-09) == "2n"
     assert clean_value(2e-12) == "2p"
+    assert clean_value(2e9) == "2G"
+    assert clean_value(3e6) == "3M"
+
+
+def test_cache_key(tmp_path):
+    k1 = get_cache_key(_dummy.__wrapped__, wg_width=500.4e-9)
+    k2 = get_cache_key(_dummy.__wrapped__, wg_width=500.6e-9)
+    assert k1 != k2
+    assert k1 == get_cache_key(_dummy.__wrapped__, wg_width=500.4e-9, plot=True)
+
+    fsp = tmp_path / "base.fsp"
+    fsp.write_bytes(b"v1")
+    k1 = get_cache_key(_dummy.__wrapped__, material_wg=str(fsp))
+    fsp.write_bytes(b"v2 changed")
+    k2 = get_cache_key(_dummy.__wrapped__, material_wg=str(fsp))
+    assert k1 != k2
 
 
 def test_clean_name():
@@ -1,8 +1,34 @@
+"""read and write dicts of results as HDF5
+
+Every value is stored with its type in the `pylum_type` attribute so it reads
+back as written:
+
+- dict: group (keys must be strings)
+- str, pathlib.Path: variable-length string, bytes: opaque dataset
+- None: empty dataset
+- bool, int, float, complex, numpy scalars and numeric arrays: datasets
+- numpy string arrays: variable-length string datasets
+- object arrays, lists and tuples: groups of items, rectangular numeric
+  lists/tuples (like `gap_width_list`) are stored as a single dataset
+
+Unsupported values raise TypeError instead of being dropped.
+"""
+import json
+import os
+import pathlib
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
 import h5py
 import numpy as np
 
 from pylum.config import CONFIG
 
+TYPE = "pylum_type"
+scalar_types = dict(bool=bool, int=int, float=float, complex=complex)
+
 
 def test_cache():
     filepath = CONFIG["workspace"] / "test.h5"
@@ -11,25 +37,413 @@ def test_cache():
     write_cache(d, filepath)
     d2 = read_cache(filepath)
     for k in d2.keys():
-        assert np.array_equal(d[k], d2[k].value), f"{k} {d[k]} and {d2[k]} do not match"
+        assert np.array_equal(d[k], d2[k]), f"{k} {d[k]} and {d2[k]} do not match"
 
 
 def write_cache(d, filepath):
-    """ writes dict to cache """
+    """writes dict to cache
 
-    f = h5py.File(filepath, "w")
+    writes a temporary file renamed to filepath when complete, so a value that
+    can not be cached leaves neither a partial file nor a changed previous one
+    """
+    filepath = pathlib.Path(filepath)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp = filepath.with_name(filepath.name + suffix)
+    try:
+        with h5py.File(tmp, "w", track_order=True) as f:
+            write_group(f, d)
+        os.replace(tmp, filepath)
+    finally:
+        tmp.unlink(missing_ok=True)
 
+
+def write_group(group, d, compression=None):
+    """writes dict items into an HDF5 group
+
+    Args:
+        group: h5py File or Group
+        d: dict
+        compression: for example "gzip", stores arrays chunked and compressed
+    """
     for k, v in d.items():
-        try:
-            f.create_dataset(k, data=v)
-        except Exception:
-            pass
+        _write(group, k, v, compression=compression)
+
+
+def _sequence_levels(value):
+    """returns container type names per level of a rectangular numeric sequence
+    returns None for anything else
+    """
+    levels = []
+    items = [value]
+    while all(isinstance(item, (list, tuple)) for item in items):
+        kinds = {type(item) for item in items}
+        lengths = {len(item) for item in items}
+        if len(kinds) != 1 or len(lengths) != 1 or lengths == {0}:
+            return None
+        levels.append(kinds.pop().__name__)
+        items = [i for item in items for i in item]
+    leaves = {type(item) for item in items}
+    if len(leaves) != 1 or leaves.pop() not in scalar_types.values():
+        return None
+    return levels
+
+
+def _restore_sequence(value, levels):
+    if not levels:
+        return value
+    container = tuple if levels[0] == "tuple" else list
+    return container(_restore_sequence(v, levels[1:]) for v in value)
+
+
+def _array_options(value, compression):
+    if compression and np.ndim(value) > 0 and np.size(value) > 1:
+        return dict(chunks=True, compression=compression, shuffle=True)
+    return {}
+
+
+def _write(group, key, value, compression=None):
+    if not isinstance(key, str) or "/" in key:
+        raise TypeError(f"can not cache key {key!r}, keys are strings without '/'")
+
+    if isinstance(value, dict):
+        node = group.create_group(key, track_order=True)
+        node.attrs[TYPE] = "dict"
+        write_group(node, value, compression=compression)
+    elif value is None:
+        node = group.create_dataset(key, data=h5py.Empty("f"))
+        node.attrs[TYPE] = "none"
+    elif isinstance(value, (str, pathlib.PurePath)):
+        node = group.create_dataset(key, data=str(value), dtype=h5py.string_dtype())
+        node.attrs[TYPE] = "path" if isinstance(value, pathlib.PurePath) else "str"
+    elif isinstance(value, bytes):
+        node = group.create_dataset(key, data=np.void(value))
+        node.attrs[TYPE] = "bytes"
+    elif type(value) in scalar_types.values():
+        node = group.create_dataset(key, data=value)
+        node.attrs[TYPE] = type(value).__name__
+    elif isinstance(value, np.generic) and value.dtype.kind not in "OUS":
+        node = group.create_dataset(key, data=value)
+        node.attrs[TYPE] = "generic"
+    elif isinstance(value, np.ndarray) and value.dtype.kind == "U":
+        data = value.astype(object)
+        node = group.create_dataset(key, data=data, dtype=h5py.string_dtype())
+        node.attrs[TYPE] = "str_array"
+    elif isinstance(value, np.ndarray) and value.dtype.kind == "O":
+        node = group.create_group(key, track_order=True)
+        node.attrs[TYPE] = "object_array"
+        node.attrs["shape"] = value.shape
+        for i, item in enumerate(value.ravel()):
+            _write(node, str(i), item, compression=compression)
+    elif isinstance(value, np.ndarray):
+        options = _array_options(value, compression)
+        node = group.create_dataset(key, data=value, **options)
+        node.attrs[TYPE] = "ndarray"
+    elif isinstance(value, (list, tuple)):
+        levels = _sequence_levels(value)
+        data = np.asarray(value) if levels else None
+        if data is not None and data.dtype.kind in "biufc":
+            options = _array_options(data, compression)
+            node = group.create_dataset(key, data=data, **options)
+            node.attrs[TYPE] = "sequence"
+            node.attrs["levels"] = json.dumps(levels)
+        else:
+            node = group.create_group(key, track_order=True)
+            node.attrs[TYPE] = type(value).__name__
+            for i, item in enumerate(value):
+                _write(node, str(i), item, compression=compression)
+    else:
+        raise TypeError(f"can not cache {key!r} of type {type(value).__name__}")
+
+
+def _read(node):
+    kind = node.attrs.get(TYPE)
+    if isinstance(node, h5py.Group):
+        if kind in ["list", "tuple"]:
+            items = [_read(node[str(i)]) for i in range(len(node))]
+            return tuple(items) if kind == "tuple" else items
+        if kind == "object_array":
+            items = np.empty(len(node), dtype=object)
+            items[:] = [_read(node[str(i)]) for i in range(len(node))]
+            return items.reshape(tuple(node.attrs["shape"]))
+        return {k: _read(v) for k, v in node.items()}
+
+    if kind == "none":
+        return None
+    if kind == "str":
+        return node.asstr()[()]
+    if kind == "path":
+        return pathlib.Path(node.asstr()[()])
+    if kind == "bytes":
+        return node[()].tobytes()
+    if kind in scalar_types:
+        return scalar_types[kind](node[()])
+    if kind == "str_array":
+        return node.asstr()[()].astype(str)
+    if kind == "sequence":
+        return _restore_sequence(node[()].tolist(), json.loads(node.attrs["levels"]))
+    return node[()]
+
+
+def read_group(group):
+    """ returns dict with all items of an HDF5 group """
+    return {k: _read(v) for k, v in group.items()}
+
+
+class LazyGroup(Mapping):
+    """ read-only mapping over an HDF5 group that reads items when accessed """
+
+    def __init__(self, group):
+        self._group = group
+
+    def __getitem__(self, key):
+        return _read(self._group[key])
+
+    def __iter__(self):
+        return iter(list(self._group.keys()))
+
+    def __len__(self):
+        return len(self._group)
+
+
+class LazyCache(LazyGroup):
+    """read-only mapping over a cache file that reads items when accessed
+
+    use it as a context manager (or call close) to close the file
+
+    .. code-block:: python
+
+        with read_cache(filepath, lazy=True) as d:
+            neff = d["neff"]
+    """
+
+    def __init__(self, filepath):
+        self._file = h5py.File(filepath, "r")
+        super().__init__(self._file)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_cache(filepath, lazy=False):
+    """reads a cache file
+
+    Args:
+        filepath: .h5 file
+        lazy: returns a LazyCache (close it), otherwise a dict (file already closed)
+    """
+    if lazy:
+        return LazyCache(filepath)
+    with h5py.File(filepath, "r") as f:
+        return read_group(f)
+
+
+def write_index(dirpath, key, **entry):
+    """appends a cache entry to the index (one JSON line per key)
+
+    not safe across processes by itself, `pylum.store.FileStore` holds a lock
+    """
+    entry = dict(key=key, **entry)
+    line = (json.dumps(entry, default=str) + "\n").encode()
+    with open(dirpath / "index.jsonl", "ab+") as f:
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            # a writer that died mid-line left no newline, start a new line
+            if f.read(1) != b"\n":
+                line = b"\n" + line
+        f.write(line)
+
+
+def read_index(dirpath):
+    """ returns dict of cache key to entry (name, settings), skips torn lines """
+    filepath = dirpath / "index.jsonl"
+    if not filepath.exists():
+        return {}
+    entries = []
+    with open(filepath) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return {entry["key"]: entry for entry in entries}
+
+
+def _map_objects(function, value):
+    """ returns a new object array with function applied to each element """
+    out = np.empty(value.shape, dtype=object)
+    for i, v in enumerate(value.flat):
+        out.flat[i] = function(v)
+    return out
+
+
+def _freeze(value, copy=True):
+    """returns a read-only version of value
+
+    arrays become read-only, dicts, lists, tuples and object arrays are rebuilt
+    with their items frozen so the cache holds no object shared with the caller
+    """
+    if isinstance(value, dict):
+        return {k: _freeze(v, copy=copy) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_freeze(v, copy=copy) for v in value)
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            value = _map_objects(lambda v: _freeze(v, copy=copy), value)
+        elif copy:
+            value = value.copy()
+        value.flags.writeable = False
+    return value
+
+
+def _view(value):
+    """ returns views of frozen arrays in new containers (lists are copied) """
+    if isinstance(value, dict):
+        return {k: _view(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_view(v) for v in value)
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            value = _map_objects(_view, value)
+            value.flags.writeable = False
+            return value
+        return value.view()
+    return value
+
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values()) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value) + sys.getsizeof(value)
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return sum(_nbytes(v) for v in value.flat) + value.nbytes
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class MemoryCache:
+    """in-process LRU cache of results, bounded by size in bytes
+
+    Arrays are stored read-only and every hit returns a new dict of views (lists,
+    tuples and object arrays are rebuilt around them), so hits do not copy arrays
+    and callers can not modify the cached values.
+    Safe to share across threads.
+
+    Args:
+        maxbytes: evicts least recently used entries above this size
+    """
+
+    def __init__(self, maxbytes=256e6):
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ returns cached dict or None """
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            d, _ = self._data[key]
+        return _view(d)
+
+    def put(self, key, d, copy=True):
+        """stores a dict of results
+
+        Args:
+            key: cache key
+            d: dict of results
+            copy: copies arrays, set False when nobody else holds them (read from disk)
+        """
+        d = _freeze(d, copy=copy)
+        nbytes = _nbytes(d)
+        if nbytes > self.maxbytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            self._data[key] = (d, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.maxbytes:
+                _, (_, evicted_nbytes) = self._data.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """ returns dict with hits, misses, evictions, entries and nbytes """
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                entries=len(self._data),
+                nbytes=self.nbytes,
+            )
+
+
+memory_cache = MemoryCache(maxbytes=CONFIG.get("cache_memory_bytes", 256e6))
+
+
+def test_memory_cache():
+    array = np.ones(100)
+    cache = MemoryCache(maxbytes=2.5 * array.nbytes)
+    cache.put("a", dict(array=array))
+    array[0] = 2  # copied on put
+    d1 = cache.get("a")
+    d2 = cache.get("a")
+    assert d1["array"][0] == 1
+    assert not d1["array"].flags.writeable
+    assert np.shares_memory(d1["array"], d2["array"])
+    assert d1 is not d2
+
+    cache.put("b", dict(array=np.ones(100)))
+    cache.get("a")
+    cache.put("c", dict(array=np.ones(100)))  # evicts b, least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 4
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+
 
-    f.close()
+def test_memory_cache_containers():
+    objects = np.empty(2, dtype=object)
+    objects[0], objects[1] = [1, 2], "a"
+    gap_width_list = [(0.3e-6, 0.35e-6), (0.2e-6, 0.4e-6)]
+    cache = MemoryCache()
+    cache.put("a", dict(gap_width_list=gap_width_list, objects=objects, nested=[[1]]))
+    gap_width_list.append((0, 0))  # copied on put
 
+    d = cache.get("a")
+    d["gap_width_list"].append((1, 1))
+    d["nested"][0].append(2)
+    d["objects"][0].append(3)
+    assert not d["objects"].flags.writeable
 
-def read_cache(filepath):
-    return h5py.File(filepath, "r")
+    d = cache.get("a")
+    assert d["gap_width_list"] == [(0.3e-6, 0.35e-6), (0.2e-6, 0.4e-6)]
+    assert d["nested"] == [[1]]
+    assert d["objects"][0] == [1, 2]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,4 @@
+""" circuit models built on pylum waveguide results (NumPy, no Lumerical license needed)
+
+- `ring`: all-pass and add-drop ring resonators (port of `RingResonator.m`)
+"""
@@ -0,0 +1,262 @@
+""" ring resonator spectra, NumPy port of `templates/coupler/RingResonator.m` and the
+optical part of `templates/modulator/RingMod.m`
+
+All arguments broadcast, so wavelength x radius x coupling x loss arrays are one
+call. The effective index comes from a `waveguide_dispersion` result (interpolated
+over wavelength, with its group index), a callable neff(wavelength) or a number.
+
+`ring_map` reduces the spectrum of each design to its figures of merit (extinction,
+resonance, Q, FSR) processing the designs in chunks of at most `max_elements`
+design x wavelength points, so large maps run in bounded memory.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.circuits.ring import ring, ring_map
+    from pylum.waveguide_dispersion import waveguide_dispersion
+
+    wavelength = np.linspace(1540e-9, 1550e-9, 10001)
+    d = ring(wavelength, radius=10e-6, coupling=0.2, filter_type="add-drop")
+    thru_dB = 20 * np.log10(abs(d["thru"]))
+
+    dispersion = waveguide_dispersion(engine="eim")
+    m = ring_map(
+        np.linspace(1549e-9, 1551e-9, 201),
+        radius=np.linspace(5e-6, 20e-6, 1000)[:, None],
+        coupling=np.linspace(0.05, 0.5, 1000),
+        neff=dispersion,
+    )
+    m["extinction_dB"].shape  # (1000, 1000)
+"""
+import numpy as np
+
+filter_types = ["all-pass", "add-drop"]
+
+
+def neff_lambda(wavelength):
+    """ returns the linear neff model of RingResonator.m (220 x 500 nm strip) """
+    return 2.57 - 0.85 * (wavelength * 1e6 - 1.55)
+
+
+def get_neff_ng(wavelength, neff=None, ng=None, dw=0.1e-9):
+    """returns (neff, ng) at wavelength
+
+    Args:
+        wavelength: (m)
+        neff: None (neff_lambda), number, callable(wavelength) or dict with
+            wavelengths, neff and ng (waveguide_dispersion results)
+        ng: group index, defaults to neff - wavelength dneff/dwavelength
+        dw: wavelength step for the derivative of callable neff
+    """
+    wavelength = np.asarray(wavelength, dtype=float)
+    if neff is None:
+        neff = neff_lambda
+    if isinstance(neff, dict):
+        w = np.asarray(neff["wavelengths"], dtype=float).ravel()
+        i = np.argsort(w)
+        n = np.asarray(neff["neff"], dtype=float).ravel()[i]
+        if ng is None:
+            ng = np.interp(wavelength, w[i], np.asarray(neff["ng"]).ravel()[i])
+        return np.interp(wavelength, w[i], n), ng
+    if callable(neff):
+        if ng is None:
+            ng = neff(wavelength) - wavelength * (
+                neff(wavelength + dw) - neff(wavelength - dw)
+            ) / (2 * dw)
+        return neff(wavelength), ng
+    return neff, neff if ng is None else ng
+
+
+def loss_to_alpha(loss_dB_cm):
+    """ returns power attenuation coefficient (1/m) from loss in dB/cm """
+    return np.log(10) / 10 * np.asarray(loss_dB_cm) * 100
+
+
+def ring(
+    wavelength=1550e-9,
+    radius=10e-6,
+    coupling=0.2,
+    loss_dB_cm=10,
+    coupler_length=0,
+    filter_type="all-pass",
+    coupling_drop=None,
+    neff=None,
+    ng=None,
+):
+    """returns ring resonator through (and drop) fields with its quality factors
+
+    Args:
+        wavelength: (m)
+        radius: (m)
+        coupling: field cross coupling k of the bus coupler (t = sqrt(1 - k^2))
+        loss_dB_cm: waveguide propagation loss
+        coupler_length: straight length of each coupler (m)
+        filter_type: all-pass or add-drop
+        coupling_drop: field coupling of the drop coupler (defaults to coupling)
+        neff: None (neff_lambda), number, callable or waveguide_dispersion result
+        ng: group index (see get_neff_ng)
+
+    Returns:
+        thru: through port field
+        drop: drop port field (0 for all-pass)
+        Qi: intrinsic quality factor
+        Qc: coupling quality factor
+        Q: loaded quality factor
+        fsr: free spectral range (m)
+    """
+    if filter_type not in filter_types:
+        raise ValueError(f"{filter_type} not in {filter_types}")
+    wavelength = np.asarray(wavelength, dtype=float)
+    neff, ng = get_neff_ng(wavelength, neff, ng)
+
+    length = 2 * np.asarray(coupler_length) + 2 * np.pi * np.asarray(radius)
+    alpha = loss_to_alpha(loss_dB_cm)
+    a = np.exp(-alpha * length / 2)  # round-trip field attenuation sqrt(A)
+    phase = (2 * np.pi / wavelength) * neff * length
+    phasor = a * np.exp(1j * phase)
+    k1 = np.asarray(coupling)
+    t1 = np.sqrt(1 - k1 ** 2)
+
+    Qi = 2 * np.pi * ng / wavelength / alpha
+    Qc = -(np.pi * length * ng) / (wavelength * np.log(t1))
+    if filter_type == "all-pass":
+        thru = (t1 - phasor) / (1 - t1 * phasor)
+        drop = np.zeros_like(thru)
+    else:
+        k2 = k1 if coupling_drop is None else np.asarray(coupling_drop)
+        t2 = np.sqrt(1 - k2 ** 2)
+        denominator = 1 - t1 * t2 * phasor
+        thru = (t1 - t2 * phasor) / denominator
+        drop = -k1 * k2 * np.sqrt(a) * np.exp(0.5j * phase) / denominator
+        Qc2 = -(np.pi * length * ng) / (wavelength * np.log(t2))
+        Qc = 1 / (1 / Qc + 1 / Qc2)
+
+    return dict(
+        thru=thru,
+        drop=drop,
+        Qi=Qi,
+        Qc=Qc,
+        Q=1 / (1 / Qi + 1 / Qc),
+        fsr=wavelength ** 2 / (ng * length),
+    )
+
+
+def ring_map(
+    wavelength,
+    radius=10e-6,
+    coupling=0.2,
+    loss_dB_cm=10,
+    coupler_length=0,
+    filter_type="all-pass",
+    coupling_drop=None,
+    neff=None,
+    ng=None,
+    max_elements=2 ** 22,
+):
+    """returns figures of merit of each ring design over a wavelength range
+
+    same arguments as ring (wavelength is a 1D array), the other arrays broadcast
+    to the design shape and are processed `max_elements` // len(wavelength)
+    designs at a time, only the round-trip phase is computed over wavelength
+
+    Returns:
+        extinction_dB: max / min of the through port power
+        resonance: wavelength of the deepest through port dip (m)
+        thru_min_dB: through port power at resonance
+        drop_max_dB: peak drop port power (-inf for all-pass)
+        Qi, Qc, Q, fsr: at the resonance
+    """
+    wavelength = np.asarray(wavelength, dtype=float).ravel()
+    neff, ng = get_neff_ng(wavelength, neff, ng)
+    neff = np.broadcast_to(neff, wavelength.shape)
+    ng = np.broadcast_to(ng, wavelength.shape)
+    designs = dict(
+        radius=radius,
+        coupling=coupling,
+        loss_dB_cm=loss_dB_cm,
+        coupler_length=coupler_length,
+        coupling_drop=coupling if coupling_drop is None else coupling_drop,
+    )
+    arrays = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in designs.values()])
+    shape = arrays[0].shape
+    flat = {k: v.ravel() for k, v in zip(designs.keys(), arrays)}
+    n = flat["radius"].size
+
+    keys = ["extinction_dB", "resonance", "thru_min_dB", "drop_max_dB"]
+    keys += ["Qi", "Qc", "Q", "fsr"]
+    results = {k: np.empty(n) for k in keys}
+    chunk = max(1, int(max_elements) // wavelength.size)
+    # |thru|^2 decreases and |drop|^2 increases with cos(round-trip phase), so the
+    # resonance and the through port maximum are the max and min of the cosine
+    k0neff = 2 * np.pi * neff / wavelength
+    for start in range(0, n, chunk):
+        i = slice(start, min(start + chunk, n))
+        design = {k: v[i] for k, v in flat.items()}
+        length = 2 * design["coupler_length"] + 2 * np.pi * design["radius"]
+        cos = np.cos(length[:, None] * k0neff)
+        j = np.argmax(cos, axis=-1)
+        on, off = [
+            ring(
+                wavelength[index],
+                filter_type=filter_type,
+                neff=neff[index],
+                ng=ng[index],
+                **design,
+            )
+            for index in [j, np.argmin(cos, axis=-1)]
+        ]
+        thru_min = np.abs(on["thru"]) ** 2
+        with np.errstate(divide="ignore"):
+            results["extinction_dB"][i] = 10 * np.log10(
+                np.abs(off["thru"]) ** 2 / thru_min
+            )
+            results["thru_min_dB"][i] = 10 * np.log10(thru_min)
+            results["drop_max_dB"][i] = 10 * np.log10(np.abs(on["drop"]) ** 2)
+        results["resonance"][i] = wavelength[j]
+        for key in ["Qi", "Qc", "Q", "fsr"]:
+            results[key][i] = on[key]
+
+    return {k: v.reshape(shape) for k, v in results.items()}
+
+
+def test_ring():
+    wavelength = np.linspace(1540e-9, 1550e-9, 20001)
+    d = ring(wavelength, radius=10e-6, coupling=0.2)
+    assert np.all(np.abs(d["thru"]) <= 1 + 1e-12)
+
+    t = np.sqrt(1 - 0.2 ** 2)
+    a = np.exp(-loss_to_alpha(10) * 2 * np.pi * 10e-6 / 2)
+    assert np.isclose(np.min(np.abs(d["thru"])), abs(a - t) / (1 - a * t), rtol=1e-3)
+
+    dips = np.flatnonzero(np.diff(np.sign(np.diff(np.abs(d["thru"])))) > 0)
+    fsr = np.diff(wavelength[dips + 1])
+    assert np.allclose(fsr, np.interp(wavelength[dips[1:]], wavelength, d["fsr"]), rtol=2e-3)
+
+    with np.errstate(divide="ignore"):
+        d = ring(wavelength, coupling=0.2, loss_dB_cm=0, filter_type="add-drop")
+    power = np.abs(d["thru"]) ** 2 + np.abs(d["drop"]) ** 2
+    assert np.allclose(power, 1)
+
+    d = ring(1550e-9, loss_dB_cm=np.array([1, 10]), coupling=np.array([[0.1], [0.3]]))
+    assert d["Q"].shape == (2, 2)
+    assert np.all(d["Q"] < d["Qi"]) and d["Qi"][0] > d["Qi"][1]
+
+
+def test_ring_map():
+    wavelength = np.linspace(1545e-9, 1555e-9, 2001)
+    radius = np.linspace(5e-6, 10e-6, 7)[:, None]
+    coupling = np.linspace(0.05, 0.4, 5)
+    m = ring_map(wavelength, radius=radius, coupling=coupling, max_elements=10000)
+    assert m["extinction_dB"].shape == (7, 5)
+
+    d = ring(wavelength, radius=radius[3, 0], coupling=coupling[2])
+    thru = np.abs(d["thru"]) ** 2
+    assert np.isclose(m["thru_min_dB"][3, 2], 10 * np.log10(thru.min()))
+    assert np.isclose(m["resonance"][3, 2], wavelength[np.argmin(thru)])
+
+    dispersion = dict(
+        wavelengths=wavelength, neff=neff_lambda(wavelength), ng=np.full(2001, 4.2)
+    )
+    m = ring_map(wavelength, radius=radius, coupling=coupling, neff=dispersion)
+    fsr = m["resonance"][:, 0] ** 2 / 4.2 / (2 * np.pi * radius[:, 0])
+    assert np.allclose(m["fsr"][:, 0], fsr)
@@ -41,6 +41,10 @@ CONFIG["workspace"] = pathlib.Path(
     CONFIG.get("workspace", repo_path / "workspace")
 ).absolute()
 
+CONFIG["cache"] = pathlib.Path(
+    CONFIG.get("cache", CONFIG["workspace"] / "cache")
+).absolute()
+
 CONFIG["grating_coupler"] = repo_path / "templates" / "fiber_coupler"
 CONFIG["grating_coupler_2D"] = CONFIG["grating_coupler"] / "grating_coupler_2D.fsp"
 CONFIG["grating_coupler_2D_base"] = CONFIG["grating_coupler"] / "grating_base.fsp"
@@ -0,0 +1,6 @@
+""" directional couplers (port of `templates/coupler/DC_*.lsf`)
+
+- `supermodes`: draws the two waveguide cross section, solves the even and odd
+  supermodes for each (gap, wavelength) in parallel MODE sessions and builds an
+  interpolated `CouplerModel` of the coupling, crossover length and power splitting
+"""
@@ -0,0 +1,371 @@
+""" directional coupler supermodes, Python version of `templates/coupler/DC_modes.lsf`
+and `DC_gap.lsf`
+
+Each (gap, wavelength) point is one cached `supermodes` MODE solve of the even and
+odd modes of two coupled waveguides, that gives
+
+    kappa = pi (neff_even - neff_odd) / wavelength
+    crossover length Lx = wavelength / (2 (neff_even - neff_odd))
+    cross power coupling after a length L = sin(kappa L)^2
+
+`coupler_sweep` runs a gap x wavelength grid in parallel sessions (cached points
+are loaded) and returns a `CouplerModel` that interpolates log(dn), which decays
+almost exponentially with the gap, so later lookups are array operations.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.coupler.supermodes import coupler_sweep
+
+    model = coupler_sweep(
+        gap=np.linspace(100e-9, 500e-9, 9),
+        wavelength=np.linspace(1.5e-6, 1.6e-6, 5),
+        processes=4,
+    )
+    Lx = model.length_cross(gap=200e-9, wavelength=1.55e-6)
+    L3dB = model.length(0.5, gap=np.linspace(150e-9, 300e-9, 100)[:, None], wavelength=1.55e-6)
+"""
+import numpy as np
+import scipy.interpolate
+
+from pylum import lsf
+from pylum import sessions
+from pylum.autoname import autoname
+from pylum.config import materials
+from pylum.sweep import sweep
+
+
+def draw(
+    session=None,
+    gap=200e-9,
+    wg_width=500e-9,
+    wg_height=220e-9,
+    slab_height=0,
+    box_height=2e-6,
+    clad_height=2e-6,
+    margin_wg_height=1e-6,
+    margin_wg_width=2e-6,
+    substrate_height=2e-6,
+    material_wg="si",
+    material_wafer="si",
+    material_clad="sio2",
+    material_box="sio2",
+    wavelength=1550e-9,
+    mesh_size=10e-9,
+    modes=4,
+    batch=True,
+):
+    """draws the cross section of two coupled waveguides in a 2D mode solver
+
+    same settings as `pylum.waveguide.waveguide`, waveguide1 and waveguide2 are
+    centered at -(wg_width + gap) / 2 and (wg_width + gap) / 2
+
+    Args:
+        session: None
+        gap: 200e-9 between the waveguides
+        wg_width: 500e-9
+        wg_height: 220e-9
+        slab_height: 0
+        box_height: 2e-6
+        clad_height: 2e-6
+        margin_wg_height: 1e-6
+        margin_wg_width: 2e-6
+        substrate_height: 2e-6
+        material_wg: "si"
+        material_wafer: "si"
+        material_clad: "sio2"
+        material_box: "sio2"
+        wavelength: 1550e-9
+        mesh_size: 10e-9
+        modes: 4
+        batch: sends the whole drawing as one LSF script
+
+    without a session it takes one from `pylum.sessions`, release it when done
+    """
+    for material in [material_wg, material_box, material_clad, material_wafer]:
+        if material not in materials:
+            raise ValueError(f"{material} not in {list(materials.keys())}")
+
+    s = session or sessions.acquire("MODE")
+    s.newproject()
+    s.selectall()
+    s.deleteall()
+
+    xmin = -2e-6
+    xmax = 2e-6
+    dy = 2 * margin_wg_width + 2 * wg_width + gap
+    x = {"x min": xmin, "x max": xmax}
+    background = {"y": 0, "y span": dy}
+
+    commands = lsf.addrect(
+        {
+            "name": "clad",
+            "material": materials[material_clad],
+            "z min": 0,
+            "z max": clad_height,
+            **background,
+            **x,
+            "override mesh order from material database": True,
+            "mesh order": 3,
+            "alpha": 0.05,
+        }
+    )
+    commands += lsf.addrect(
+        {
+            "name": "box",
+            "material": materials[material_box],
+            "z min": -box_height,
+            "z max": 0,
+            **background,
+            **x,
+            "alpha": 0.05,
+        }
+    )
+    commands += lsf.addrect(
+        {
+            "name": "wafer",
+            "material": materials[material_wafer],
+            "z min": -box_height - substrate_height,
+            "z max": -box_height,
+            **background,
+            **x,
+            "alpha": 0.1,
+        }
+    )
+    for i, sign in [(1, -1), (2, 1)]:
+        commands += lsf.addrect(
+            {
+                "name": f"waveguide{i}",
+                "y": sign * (wg_width + gap) / 2,
+                "material": materials[material_wg],
+                "z min": 0,
+                "z max": wg_height,
+                "y span": wg_width,
+                **x,
+            }
+        )
+    if slab_height > 0:
+        commands += lsf.addrect(
+            {
+                "name": "slab",
+                "material": materials[material_wg],
+                "z min": 0,
+                "z max": slab_height,
+                **background,
+                **x,
+            }
+        )
+
+    commands += [("addfde",), ("set", "solver type", "2D X normal")]
+    commands += [("set", k, v) for k, v in [("x", 0), ("y", 0), ("y span", dy)]]
+    commands += [
+        ("set", "z max", wg_height + margin_wg_height),
+        ("set", "z min", -margin_wg_height),
+        ("set", "wavelength", wavelength),
+        ("set", "y min bc", "PML"),
+        ("set", "y max bc", "PML"),
+        ("set", "z min bc", "metal"),
+        ("set", "z max bc", "metal"),
+        ("set", "define y mesh by", "maximum mesh step"),
+        ("set", "dy", mesh_size),
+        ("set", "define z mesh by", "maximum mesh step"),
+        ("set", "dz", mesh_size),
+        ("set", "number of trial modes", modes),
+    ]
+    lsf.draw(s, commands, batch=batch)
+    return s
+
+
+@autoname
+def supermodes(gap=200e-9, wavelength=1550e-9, session=None, **kwargs):
+    """Computes the even and odd supermodes of a directional coupler.
+
+    Args:
+        gap: 200e-9 between the waveguides
+        wavelength: 1550e-9
+        session: None
+        kwargs: other draw settings (wg_width, wg_height, slab_height ...)
+
+    Returns:
+        neff_even: effective index of the even (fundamental) supermode
+        neff_odd: effective index of the odd supermode
+        dn: neff_even - neff_odd
+        kappa: coupling coefficient pi dn / wavelength (1/m)
+        length_cross: crossover length wavelength / (2 dn)
+    """
+    with sessions.session("MODE", existing=session) as s:
+        draw(session=s, gap=gap, wavelength=wavelength, **kwargs)
+        n = s.findmodes()
+        if not n or n < 2:
+            raise ValueError(f"found {n} supermodes for gap={gap}, need 2")
+        neff_even, neff_odd = [
+            float(abs(np.asarray(s.getdata(f"FDE::data::mode{m}", "neff")).squeeze()))
+            for m in [1, 2]
+        ]
+    dn = neff_even - neff_odd
+    return dict(
+        neff_even=neff_even,
+        neff_odd=neff_odd,
+        dn=dn,
+        kappa=np.pi * dn / wavelength,
+        length_cross=wavelength / (2 * dn),
+    )
+
+
+class CouplerModel:
+    """interpolated directional coupler over a gap x wavelength grid
+
+    linear interpolation of log(dn) (dn decays almost exponentially with the gap),
+    all methods broadcast their arguments
+
+    Args:
+        gap: (ngaps,) increasing
+        wavelength: (nwavelengths,) increasing
+        dn: (ngaps, nwavelengths) neff_even - neff_odd
+    """
+
+    def __init__(self, gap, wavelength, dn):
+        self.gap = np.asarray(gap, dtype=float)
+        self.wavelength = np.asarray(wavelength, dtype=float)
+        self.dn_grid = np.asarray(dn, dtype=float).reshape(
+            len(self.gap), len(self.wavelength)
+        )
+        points = [self.gap]
+        values = np.log(self.dn_grid)
+        if len(self.wavelength) > 1:
+            points.append(self.wavelength)
+        else:
+            values = values[:, 0]
+        self._interpolator = scipy.interpolate.RegularGridInterpolator(
+            points, values, bounds_error=False, fill_value=None
+        )
+
+    def dn(self, gap, wavelength=1550e-9):
+        """ returns neff_even - neff_odd """
+        gap, wavelength = np.broadcast_arrays(
+            np.asarray(gap, dtype=float), np.asarray(wavelength, dtype=float)
+        )
+        points = [gap.ravel()]
+        if len(self.wavelength) > 1:
+            points.append(wavelength.ravel())
+        log_dn = self._interpolator(np.stack(points, axis=-1))
+        return np.exp(log_dn).reshape(gap.shape)
+
+    def kappa(self, gap, wavelength=1550e-9):
+        """ returns coupling coefficient pi dn / wavelength (1/m) """
+        return np.pi * self.dn(gap, wavelength) / wavelength
+
+    def length_cross(self, gap, wavelength=1550e-9):
+        """ returns crossover length wavelength / (2 dn), full power transfer """
+        return wavelength / (2 * self.dn(gap, wavelength))
+
+    def power_coupling(self, length, gap, wavelength=1550e-9):
+        """ returns cross port power fraction sin(kappa L)^2 """
+        return np.sin(self.kappa(gap, wavelength) * length) ** 2
+
+    def length(self, ratio, gap, wavelength=1550e-9):
+        """ returns the shortest length with cross power fraction ratio """
+        return np.arcsin(np.sqrt(ratio)) / self.kappa(gap, wavelength)
+
+
+def coupler_sweep(
+    gap=np.linspace(100e-9, 500e-9, 5),
+    wavelength=(1550e-9,),
+    session=None,
+    processes=None,
+    lumapi=None,
+    progress=True,
+    **kwargs,
+):
+    """runs (or loads) supermodes over a gap x wavelength grid, returns a CouplerModel
+
+    Args:
+        gap: gaps (m)
+        wavelength: wavelengths (m)
+        session: runs every point in this session (no parallel sessions)
+        processes: parallel MODE sessions (see pylum.sweep)
+        lumapi: module name for worker sessions (for example pylum.fake_lumapi)
+        progress: prints progress
+        kwargs: other draw settings (wg_width, wg_height, slab_height ...)
+    """
+    gap = np.sort(np.atleast_1d(np.asarray(gap, dtype=float)))
+    wavelength = np.sort(np.atleast_1d(np.asarray(wavelength, dtype=float)))
+    grid = dict(gap=gap, wavelength=wavelength)
+    grid.update({k: [v] for k, v in kwargs.items()})
+    if session is None:
+        df = sweep(
+            supermodes,
+            grid=grid,
+            solver="MODE",
+            processes=processes,
+            lumapi=lumapi,
+            progress=progress,
+        )
+        failed = df[df["error"].notnull()]
+        if len(failed):
+            raise ValueError(
+                f"supermodes failed for {failed[['gap', 'wavelength']].values.tolist()}"
+                f"\n{failed['error'].iloc[0]}"
+            )
+        dn = df["dn"].values
+    else:
+        dn = [
+            supermodes(session=session, gap=float(g), wavelength=float(w), **kwargs)["dn"]
+            for g in gap
+            for w in wavelength
+        ]
+    return CouplerModel(gap, wavelength, dn)
+
+
+def _fake_dn(gap, wavelength):
+    return 0.05 * np.exp(-gap / 150e-9) * (wavelength / 1.55e-6) ** 3
+
+
+def _fake_mode_session():
+    """ fake MODE session with supermodes split by _fake_dn """
+    import re
+
+    from pylum import fake_lumapi
+
+    state = dict(findmodes=0)
+
+    def eval(script):
+        y = re.search(r'"waveguide2"\);\nset\("y", ([^)]+)\)', script).group(1)
+        wavelength = re.search(r'set\("wavelength", ([^)]+)\)', script).group(1)
+        state["gap"] = 2 * float(y) - 500e-9
+        state["wavelength"] = float(wavelength)
+
+    def findmodes():
+        state["findmodes"] += 1
+        return 4
+
+    def getdata(mode, key):
+        dn = _fake_dn(state["gap"], state["wavelength"])
+        return 2.4 + dn / 2 if mode.endswith("1") else 2.4 - dn / 2
+
+    returns = dict(eval=eval, findmodes=findmodes, getdata=getdata)
+    return fake_lumapi.MODE(returns=returns), state
+
+
+def test_coupler_sweep(tmp_path, monkeypatch):
+    from pylum.config import CONFIG
+
+    monkeypatch.setitem(CONFIG, "cache", tmp_path)
+    s, state = _fake_mode_session()
+    gap = np.linspace(100e-9, 400e-9, 7)
+    wavelength = np.linspace(1.5e-6, 1.6e-6, 5)
+    model = coupler_sweep(gap=gap, wavelength=wavelength, session=s)
+    assert state["findmodes"] == 35
+
+    g = np.linspace(100e-9, 400e-9, 31)[:, None]
+    w = np.linspace(1.5e-6, 1.6e-6, 11)
+    assert np.allclose(model.dn(g, w), _fake_dn(g, w), rtol=1e-2)
+    Lx = model.length_cross(200e-9, 1.55e-6)
+    assert np.isclose(Lx, 1.55e-6 / 2 / _fake_dn(200e-9, 1.55e-6), rtol=1e-2)
+    assert np.isclose(model.power_coupling(Lx, 200e-9, 1.55e-6), 1)
+    L = model.length(0.5, g, w)
+    assert L.shape == (31, 11)
+    assert np.allclose(model.power_coupling(L, g, w), 0.5)
+
+    coupler_sweep(gap=np.append(gap, 450e-9), wavelength=wavelength, session=s)
+    assert state["findmodes"] == 40
@@ -3,6 +3,7 @@ https://support.lumerical.com/hc/en-us/articles/360042304394-Bragg-Grating-Initi
 
 We extract kappa from a DRB unit cell
 """
+from pylum import sessions
 from pylum.autoname import autoname
 from pylum.config import CONFIG
 from pylum.config import materials
@@ -18,34 +19,39 @@ def draw(
     n_sweep=8,
 ):
     """ draw DBR unit cell in FDTD
+
+    without a session it takes one from `pylum.sessions`, the caller must hand it
+    back with `sessions.release(s)` (it is closed if drawing fails)
     """
     if material_wg not in materials:
         raise ValueError(f"{material_wg} not in {list(materials.keys())}")
 
     material_wg = materials[material_wg]
 
-    import lumapi
-
-    s = session if session is not None else lumapi.FDTD(hide=False)
-    s.newproject()
-    s.selectall()
-    s.deleteall()
-
-    s.load(fsp)
-    s.setnamed("w1", "z span", wg_height)
-    s.setnamed("w2", "z span", wg_height)
-    s.setnamed("w1", "y span", w1)
-    s.setnamed("w2", "y span", w2)
-    s.setnamed("w1", "material", material_wg)
-    s.setnamed("w2", "material", material_wg)
-    s.setsweep("sweep", "number of points", n_sweep)
+    with sessions.handout("FDTD", existing=session) as s:
+        s.newproject()
+        s.selectall()
+        s.deleteall()
+
+        s.load(fsp)
+        s.setnamed("w1", "z span", wg_height)
+        s.setnamed("w2", "z span", wg_height)
+        s.setnamed("w1", "y span", w1)
+        s.setnamed("w2", "y span", w2)
+        s.setnamed("w1", "material", material_wg)
+        s.setnamed("w2", "material", material_wg)
+        s.setsweep("sweep", "number of points", n_sweep)
     return s
 
 
-@autoname
+@autoname(templates=[CONFIG["dbr"]])
 def dbr(session=None, run=True, **kwargs):
     """ draw DBR unit cell in FDTD
 
+    with run=True a session taken from `pylum.sessions` goes back to the pool when
+    done, with run=False the drawn session is returned and the caller must hand it
+    back with `sessions.release(s)`
+
     Args:
         session: lumapi.FDTD session
         material_wg: 'si' or 'sin'
@@ -53,17 +59,35 @@ def dbr(session=None, run=True, **kwargs):
         w1: 550e-9
         w2: 450e-9
     """
-    s = draw(session=session, **kwargs)
-    d = dict(session=s)
+    if not run:
+        return dict(session=draw(session=session, **kwargs))
 
-    if run:
+    with sessions.session("FDTD", existing=session) as s:
+        draw(session=s, **kwargs)
         s.runsweep()
-        d["w"] = s.getsweepdata("sweep", "w")
-        d["kappa"] = s.getsweepdata("sweep", "kappa")
-        d["bandwidth"] = s.getsweepdata("sweep", "bandwidth")
-
+        d = dict(
+            w=s.getsweepdata("sweep", "w"),
+            kappa=s.getsweepdata("sweep", "kappa"),
+            bandwidth=s.getsweepdata("sweep", "bandwidth"),
+        )
+    if session is not None:
+        d["session"] = session
     return d
 
 
+def test_dbr_releases_session(monkeypatch):
+    from pylum import fake_lumapi
+
+    pool = sessions.SessionPool(size=1, lumapi=fake_lumapi)
+    monkeypatch.setattr(sessions, "_pool", pool)
+    d = dbr(cache=False)
+    assert "session" not in d
+    assert pool.idle("FDTD") == 1
+
+    s = fake_lumapi.FDTD()
+    assert dbr(session=s, cache=False)["session"] is s
+    assert pool.idle("FDTD") == 1
+
+
 if __name__ == "__main__":
     d = dbr()
@@ -0,0 +1,60 @@
+""" in-process stand-in for `lumapi` that records calls instead of running a solver
+
+Useful for tests and benchmarks on machines without a Lumerical license.
+
+.. code-block:: python
+
+    from pylum import fake_lumapi
+
+    s = fake_lumapi.FDTD(latency=1e-3)  # emulate 1ms per lumapi round-trip
+    s.addrect()
+    print(len(s.calls))
+"""
+import time
+
+
+class LumApiError(Exception):
+    pass
+
+
+class Session:
+    """ records every method call as (name, args, kwargs)
+
+    Args:
+        hide: ignored, kept for lumapi compatibility
+        latency: seconds to sleep on every call, emulates the IPC round-trip
+        returns: dict of method name to return value or callable(*args)
+    """
+
+    def __init__(self, hide=False, latency=0, returns=None, **kwargs):
+        self.hide = hide
+        self.latency = latency
+        self.returns = returns or {}
+        self.calls = []
+        self.closed = False
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            if self.closed:
+                raise LumApiError(f"{name} called on a closed session")
+            if self.latency:
+                time.sleep(self.latency)
+            self.calls.append((name, args, kwargs))
+            value = self.returns.get(name)
+            return value(*args) if callable(value) else value
+
+        return method
+
+    def close(self):
+        self.closed = True
+
+
+class FDTD(Session):
+    pass
+
+
+class MODE(Session):
+    pass
@@ -0,0 +1,307 @@
+""" fiber modes and fiber coupling efficiency of grating near fields in NumPy
+
+Gaussian and step-index (LP01) fiber modes are analytic, so the coupling of one
+near field (from `pylum.gc_sweep.gc_near_field` or any monitor) to the fiber is an
+overlap integral. `coupling` broadcasts fiber position, angle and mode field
+diameter, so an alignment tolerance map of thousands of fiber positions comes from
+a single FDTD run instead of one run per `Position` or `theta` (GC_sweeps.lsf).
+
+The fiber is tilted by `angle_deg` from the vertical in the cladding (index
+n_clad), its field on the monitor line is stretched by 1 / cos(angle) and carries
+the phase exp(i 2 pi / wavelength n_clad sin(angle) x), as the outcoupled field of
+a grating phase matched to that angle (see `pylum.apodization`).
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.fiber import coupling
+    from pylum.gc_sweep import gc_near_field
+
+    d = gc_near_field(n_gratings=30)
+    i = np.argmin(abs(d["wavelength_nm"] - 1550))
+    efficiency = coupling(
+        d["Ez"][i],
+        d["x"],
+        position=np.linspace(0, 15e-6, 1501)[:, None],
+        angle_deg=np.linspace(10, 20, 101),
+        power=d["T"][i],
+        wavelength=d["wavelength_nm"][i] * 1e-9,
+    )
+    efficiency.shape  # (1501, 101)
+"""
+import numpy as np
+import scipy.optimize
+import scipy.special
+
+mode_types = ["gaussian", "step_index"]
+
+
+def v_number(
+    core_diameter=8.2e-6, core_index=1.4682, cladding_index=1.4629, wavelength=1550e-9
+):
+    """ returns the normalized frequency V of a step-index fiber """
+    na = np.sqrt(core_index ** 2 - cladding_index ** 2)
+    return np.pi * core_diameter / wavelength * na
+
+
+def marcuse_mfd(
+    core_diameter=8.2e-6, core_index=1.4682, cladding_index=1.4629, wavelength=1550e-9
+):
+    """ returns the Gaussian mode field diameter of a step-index fiber (Marcuse) """
+    V = v_number(core_diameter, core_index, cladding_index, wavelength)
+    return core_diameter * (0.65 + 1.619 * V ** -1.5 + 2.879 * V ** -6)
+
+
+def _lp01_u(V):
+    """ returns the core parameter u of the LP01 mode, u J1/J0 = w K1/K0 """
+
+    def f(u):
+        w = np.sqrt(V ** 2 - u ** 2)
+        core = u * scipy.special.j1(u) / scipy.special.j0(u)
+        return core - w * scipy.special.k1(w) / scipy.special.k0(w)
+
+    return scipy.optimize.brentq(f, 1e-9, min(V, scipy.special.jn_zeros(0, 1)[0]) - 1e-9)
+
+
+def step_index(
+    r,
+    core_diameter=8.2e-6,
+    core_index=1.4682,
+    cladding_index=1.4629,
+    wavelength=1550e-9,
+):
+    """returns the LP01 field of a step-index fiber, 1 on the fiber axis
+
+    Args:
+        r: distance from the fiber axis (m)
+        core_diameter: 8.2e-6 (SMF-28)
+        core_index: 1.4682
+        cladding_index: 1.4629
+        wavelength: 1550e-9
+    """
+    V = v_number(core_diameter, core_index, cladding_index, wavelength)
+    if V >= scipy.special.jn_zeros(1, 1)[0]:
+        raise ValueError(f"V = {V:.3f} > 3.832, the fiber is not single mode")
+    u = _lp01_u(V)
+    w = np.sqrt(V ** 2 - u ** 2)
+    rho = np.abs(r) / (core_diameter / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cladding = scipy.special.j0(u) * scipy.special.k0(w * rho) / scipy.special.k0(w)
+    return np.where(rho < 1, scipy.special.j0(u * rho), cladding)
+
+
+def gaussian(r, mfd=10.4e-6):
+    """ returns a Gaussian fiber field with waist mfd / 2, 1 on the fiber axis """
+    return np.exp(-((r / (mfd / 2)) ** 2))
+
+
+def _expand(value):
+    return np.asarray(value, dtype=float)[..., None]
+
+
+def envelope(
+    x,
+    y=None,
+    position=0,
+    y_position=0,
+    angle_deg=0,
+    mfd=10.4e-6,
+    mode_type="gaussian",
+    wavelength=1550e-9,
+    **kwargs,
+):
+    """returns the real fiber field amplitude on the monitor points (see field) """
+    if mode_type not in mode_types:
+        raise ValueError(f"{mode_type} not in {mode_types}")
+    r2 = ((x - _expand(position)) * np.cos(np.radians(_expand(angle_deg)))) ** 2
+    if y is not None:
+        r2 = r2 + (y - _expand(y_position)) ** 2
+    if mode_type == "gaussian":
+        return np.exp(-r2 / (_expand(mfd) / 2) ** 2)
+    return step_index(np.sqrt(r2), wavelength=wavelength, **kwargs)
+
+
+def field(
+    x, y=None, position=0, angle_deg=0, n_clad=1.444, wavelength=1550e-9, **kwargs
+):
+    """returns the fiber field on the monitor points, broadcast over fiber settings
+
+    Args:
+        x: (npoints,) along the grating (m)
+        y: (npoints,) across the grating for 3D near fields (flattened x, y grid)
+        position: fiber center along x
+        angle_deg: fiber tilt from the vertical in the cladding
+        n_clad: cladding index at the monitor
+        wavelength: 1550e-9
+        kwargs: y_position, mfd (gaussian), mode_type (gaussian or step_index),
+            core_diameter, core_index, cladding_index (step_index)
+
+    Returns:
+        (..., npoints) complex field, ... the broadcast shape of the fiber settings
+    """
+    E = envelope(
+        x, y, position=position, angle_deg=angle_deg, wavelength=wavelength, **kwargs
+    )
+    k = 2 * np.pi / wavelength * n_clad
+    dx = x - _expand(position)
+    return E * np.exp(1j * k * np.sin(np.radians(_expand(angle_deg))) * dx)
+
+
+def mode(x, y=None, polarization="Ez", **kwargs):
+    """returns a fiber mode dict for `pylum.modes.overlap` (E field only)
+
+    Args:
+        x: grid along the grating
+        y: grid across the grating (3D)
+        polarization: field component of the fiber mode
+        kwargs: fiber settings (see field)
+    """
+    d = dict(x=np.asarray(x, dtype=float))
+    if y is None:
+        d[polarization] = field(d["x"], **kwargs)
+        return d
+    d["y"] = np.asarray(y, dtype=float)
+    X, Y = np.meshgrid(d["x"], d["y"], indexing="ij")
+    d[polarization] = field(X.ravel(), Y.ravel(), **kwargs).reshape(X.shape)
+    return d
+
+
+def _weights(x):
+    """ returns trapezoidal integration weights of a sorted grid """
+    x = np.asarray(x, dtype=float)
+    if x.size == 1:
+        return np.ones(1)
+    dx = np.diff(x)
+    return np.concatenate([[dx[0]], dx[1:] + dx[:-1], [dx[-1]]]) / 2
+
+
+def coupling(
+    near_field,
+    x,
+    y=None,
+    position=0,
+    y_position=0,
+    angle_deg=0,
+    mfd=10.4e-6,
+    power=1,
+    polarization="Ez",
+    max_elements=2 ** 16,
+    **kwargs,
+):
+    """returns fiber coupling efficiency of a near field, broadcast over the fiber
+
+    power |<E, G>|^2 / (<E, E> <G, G>) with the fiber field G (see field), the
+    settings are processed in chunks of `max_elements` settings x points
+
+    Args:
+        near_field: (nx,) or (nx, ny) complex field, or dict with the
+            `polarization` component (pylum.modes mode or gc_near_field result)
+        x: (nx,) grid along the grating (m)
+        y: (ny,) grid across the grating (3D)
+        position: fiber center along x
+        y_position: fiber center along y
+        angle_deg: fiber tilt in the cladding
+        mfd: mode field diameter
+        power: fraction of the source power in the near field (upwards transmission)
+        polarization: field component used from a dict near field
+        max_elements: chunk size
+        kwargs: mode_type, n_clad, wavelength, step-index fiber settings
+
+    Returns:
+        efficiency with the broadcast shape of position, y_position, angle_deg and mfd
+    """
+    if isinstance(near_field, dict):
+        near_field = near_field[polarization]
+    E = np.asarray(near_field, dtype=complex)
+    weights = _weights(x)
+    X = np.asarray(x, dtype=float)
+    if y is not None:
+        weights = np.outer(weights, _weights(y)).ravel()
+        X, Y = np.meshgrid(X, np.asarray(y, dtype=float), indexing="ij")
+        X, Y = X.ravel(), Y.ravel()
+    else:
+        Y = None
+    E = E.ravel()
+    if E.size != X.size:
+        raise ValueError(f"near field with {E.size} points on a grid of {X.size}")
+    norm = np.sum(weights * np.abs(E) ** 2)
+
+    settings = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in [position, y_position, angle_deg, mfd]]
+    )
+    shape = settings[0].shape
+    position, y_position, angle_deg, mfd = [v.ravel() for v in settings]
+    efficiency = np.empty(position.size)
+    chunk = max(1, int(max_elements) // X.size)
+    # the tilt phase only depends on the angle, so each angle is one complex
+    # near field and the fiber envelopes are real matrix-vector products
+    n_clad = kwargs.pop("n_clad", 1.444)
+    wavelength = kwargs.pop("wavelength", 1550e-9)
+    angles, inverse = np.unique(angle_deg, return_inverse=True)
+    for a, angle in enumerate(angles):
+        k = 2 * np.pi / wavelength * n_clad * np.sin(np.radians(angle))
+        tilted = E * np.exp(-1j * k * X) * weights
+        index = np.flatnonzero(inverse == a)
+        for start in range(0, index.size, chunk):
+            i = index[start : start + chunk]
+            G = envelope(
+                X,
+                Y,
+                position=position[i],
+                y_position=y_position[i],
+                angle_deg=angle,
+                mfd=mfd[i],
+                wavelength=wavelength,
+                **kwargs,
+            )
+            cross = G @ tilted
+            efficiency[i] = np.abs(cross) ** 2 / (norm * ((G * G) @ weights))
+    return power * efficiency.reshape(shape)
+
+
+def test_step_index():
+    V = v_number()
+    assert 2.0 < V < 2.405
+    r = np.linspace(0, 30e-6, 30001)
+    E = step_index(r)
+    assert np.isclose(E[0], 1)
+    assert np.allclose(np.diff(E[r < 4.1e-6]) < 0, True)
+    # LP01 is close to a Gaussian with the Marcuse mode field diameter
+    mfd = marcuse_mfd()
+    assert 9.5e-6 < mfd < 10.5e-6
+    gaussian_power = np.sum(gaussian(r, mfd) * E * r) ** 2
+    assert gaussian_power / np.sum(E ** 2 * r) / np.sum(gaussian(r, mfd) ** 2 * r) > 0.99
+
+
+def test_coupling():
+    x = np.linspace(-20e-6, 20e-6, 801)
+    near_field = field(x, position=3e-6, angle_deg=10)
+    efficiency = coupling(
+        near_field,
+        x,
+        position=np.linspace(0, 6e-6, 61)[:, None],
+        angle_deg=np.linspace(0, 20, 21),
+        power=0.7,
+        max_elements=10000,
+    )
+    assert efficiency.shape == (61, 21)
+    assert np.isclose(efficiency.max(), 0.7)
+    assert np.unravel_index(np.argmax(efficiency), efficiency.shape) == (30, 10)
+
+    # an offset d of a Gaussian with waist w couples exp(-(d / w)^2)
+    e = coupling(near_field, x, position=3e-6 + np.array([0, 1e-6, 2e-6]), angle_deg=10)
+    w = 10.4e-6 / 2 / np.cos(np.radians(10))
+    assert np.allclose(e, np.exp(-((np.array([0, 1e-6, 2e-6]) / w) ** 2)), rtol=1e-4)
+
+    from pylum.modes import overlap
+
+    m1 = mode(x, position=3e-6, angle_deg=10)
+    m2 = mode(x, position=4e-6, angle_deg=10)
+    assert np.isclose(overlap(m1, m2), e[1], rtol=1e-4)
+
+    y = np.linspace(-15e-6, 15e-6, 151)
+    m = mode(x, y, position=1e-6)
+    e = coupling(m, x, y, position=[1e-6, 2e-6], mode_type="gaussian")
+    assert np.isclose(e[0], 1) and e[1] < 1
+    e = coupling(m, x, y, position=1e-6, mode_type="step_index")
+    assert 0.95 < e < 1
@@ -12,11 +12,16 @@ import pathlib
 
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy.constants import speed_of_light
 
+from pylum import lsf
+from pylum import sessions
 from pylum.autoname import autoname
 from pylum.autoname import get_function_name
 from pylum.config import CONFIG
 from pylum.config import materials
+from pylum.loadsp import Sparameters
+from pylum.loadsp import write_sparameters_h5
 
 
 @autoname
@@ -40,11 +45,18 @@ def gc2d(
     wavelength=1550e-9,
     wavelength_span=300e-9,  # wavelength span
     base_fsp_path=str(CONFIG["grating_coupler_2D"]),
+    batch=True,
 ):
     """ draw 2D grating coupler
 
     gap_width_list overrides (period, ff and n_gratings)
 
+    batch=True sends the whole geometry as one LSF script (a single `eval`)
+    instead of one lumapi round-trip per property
+
+    without a session it takes one from `pylum.sessions`, the caller must hand it
+    back with `sessions.release(s)` (it is closed if drawing fails)
+
     """
     for material in [material_wg, material_box, material_clad, material_wafer]:
         if material not in materials:
@@ -55,88 +67,98 @@ def gc2d(
     material_clad = materials[material_clad]
     material_box = materials[material_box]
 
-    import lumapi
-
     assert ff < 1, f"fill factor {ff:.3f} is the ratio of period/maxHeigh"
 
-    s = session or lumapi.FDTD(hide=False)
-    s.newproject()
-    s.selectall()
-    s.deleteall()
-
-    s.load(base_fsp_path)
-
-    s.select("fiber")
-    s.set("theta", fiber_angle_deg)
-
-    s.select("")
-    s.set("lambda0", wavelength)
-
-    s.setglobalsource("center wavelength", wavelength)
-    s.setglobalsource("wavelength span", wavelength_span)
-    # s.select("FDTD")
-    # s.set("set simulation bandwidth", True)
-    # s.set("simulation wavelength min", wavelength - wavelength_span / 2)
-    # s.set("simulation wavelength max", wavelength + wavelength_span / 2)
-
-    gap = period * (1 - ff)
-    # etched region of the grating
-
-    s.addrect()
-    s.set("name", "GC_base")
-    s.set("material", material_wg)
-    s.set("x min", gc_xmin)
-    s.set("x max", (n_gratings + 1) * period + gc_xmin)
-    s.set("y", 0.5 * (wg_height - etch_depth))
-    s.set("y span", wg_height - etch_depth)
-
-    # add GC teeth;
-    gap_width_list = gap_width_list or [(gap, ff * period)] * n_gratings
-    xmin = gc_xmin
-
-    for gap, width in gap_width_list:
-        s.addrect()
-        s.set("name", "GC_tooth")
-        s.set("material", material_wg)
-        s.set("y min", 0)
-        s.set("y max", wg_height)
-        s.set("x min", xmin + gap)
-        s.set("x max", xmin + gap + width)
-        xmin += gap + width
-    s.selectpartial("GC")
-    s.addtogroup("GC")
-
-    # draw silicon substrate;
-    s.addrect()
-    s.set("name", "substrate")
-    s.set("material", material_wafer)
-    s.set("x max", 30e-6)
-    s.set("x min", -20e-6)
-    s.set("y", -1 * (box_height + 0.5 * substrate_height))
-    s.set("y span", substrate_height)
-    s.set("alpha", 0.2)
-
-    s.addrect()
-    # draw burried oxide;
-    s.set("name", "BOX")
-    s.set("material", material_box)
-    s.set("x max", 30e-6)
-    s.set("x min", -20e-6)
-    s.set("y min", -box_height)
-    s.set("y max", clad_height)
-    s.set("override mesh order from material database", True)
-    s.set("mesh order", 3)
-    s.set("alpha", 0.3)
-
-    s.addrect()
-    # draw waveguide;
-    s.set("name", "WG")
-    s.set("material", material_wg)
-    s.set("x min", -20e-6)
-    s.set("x max", gc_xmin)
-    s.set("y min", 0)
-    s.set("y max", wg_height)
-
+    with sessions.handout("FDTD", existing=session) as s:
+        s.newproject()
+        s.selectall()
+        s.deleteall()
+
+        s.load(base_fsp_path)
+
+        commands = [("select", "fiber"), ("set", "theta", fiber_angle_deg)]
+        commands += [("select", ""), ("set", "lambda0", wavelength)]
+
+        commands += [("setglobalsource", "center wavelength", wavelength)]
+        commands += [("setglobalsource", "wavelength span", wavelength_span)]
+        # s.select("FDTD")
+        # s.set("set simulation bandwidth", True)
+        # s.set("simulation wavelength min", wavelength - wavelength_span / 2)
+        # s.set("simulation wavelength max", wavelength + wavelength_span / 2)
+
+        gap = period * (1 - ff)
+        # etched region of the grating
+
+        commands += lsf.addrect(
+            {
+                "name": "GC_base",
+                "material": material_wg,
+                "x min": gc_xmin,
+                "x max": (n_gratings + 1) * period + gc_xmin,
+                "y": 0.5 * (wg_height - etch_depth),
+                "y span": wg_height - etch_depth,
+            }
+        )
+
+        # add GC teeth;
+        gap_width_list = gap_width_list or [(gap, ff * period)] * n_gratings
+        xmin = gc_xmin
+
+        for gap, width in gap_width_list:
+            commands += lsf.addrect(
+                {
+                    "name": "GC_tooth",
+                    "material": material_wg,
+                    "y min": 0,
+                    "y max": wg_height,
+                    "x min": xmin + gap,
+                    "x max": xmin + gap + width,
+                }
+            )
+            xmin += gap + width
+        commands += [("selectpartial", "GC"), ("addtogroup", "GC")]
+
+        # draw silicon substrate;
+        commands += lsf.addrect(
+            {
+                "name": "substrate",
+                "material": material_wafer,
+                "x max": 30e-6,
+                "x min": -20e-6,
+                "y": -1 * (box_height + 0.5 * substrate_height),
+                "y span": substrate_height,
+                "alpha": 0.2,
+            }
+        )
+
+        # draw burried oxide;
+        commands += lsf.addrect(
+            {
+                "name": "BOX",
+                "material": material_box,
+                "x max": 30e-6,
+                "x min": -20e-6,
+                "y min": -box_height,
+                "y max": clad_height,
+                "override mesh order from material database": True,
+                "mesh order": 3,
+                "alpha": 0.3,
+            }
+        )
+
+        # draw waveguide;
+        commands += lsf.addrect(
+            {
+                "name": "WG",
+                "material": material_wg,
+                "x min": -20e-6,
+                "x max": gc_xmin,
+                "y min": 0,
+                "y max": wg_height,
+            }
+        )
+
+        lsf.draw(s, commands, batch=batch)
     return dict(session=s)
 
 
@@ -149,9 +171,39 @@ def load_sparameters_from_kwargs(
 
     dirpath = pathlib.Path(dirpath) / function_name
     filepath = dirpath / filename
-    filepath_json = filepath.with_suffix(".json")
+    return load_sparameters(filepath.with_suffix(".dat"))
 
-    return json.loads(open(filepath_json).read())
+
+def test_gc2d_batch():
+    """ batched and per-call drawing send the same geometry """
+    from pylum import fake_lumapi
+
+    gap_width_list = [(0.3e-6, 0.35e-6)] * 3
+    s1 = gc2d(session=fake_lumapi.FDTD(), gap_width_list=gap_width_list, cache=False)
+    s2 = gc2d(
+        session=fake_lumapi.FDTD(),
+        gap_width_list=gap_width_list,
+        batch=False,
+        cache=False,
+    )
+    s1 = s1["session"]
+    s2 = s2["session"]
+    commands = [(name, *args) for name, args, kwargs in s2.calls[4:]]
+    script = s1.calls[-1][1][0]
+    assert script == lsf.to_script(commands)
+    assert script.count("addrect;") == 3 + 4
+    assert len(s1.calls) == 5
+
+
+def test_gc2d_draws_every_call(tmp_path, monkeypatch):
+    """ draw-only results are not cached, so a repeated call still draws """
+    from pylum import fake_lumapi
+
+    monkeypatch.setitem(CONFIG, "cache", tmp_path)
+    for _ in range(2):
+        s = gc2d(session=fake_lumapi.FDTD(), n_gratings=3)["session"]
+        assert s.calls[-1][0] == "eval"
+    assert not gc2d.is_cached(n_gratings=3)
 
 
 def test_load(data_regression):
@@ -159,11 +211,21 @@ def test_load(data_regression):
     data_regression.check(simdict)
 
 
-def load_sparameters(filepath_json):
-    """ returns dict with grating coupler Sparameters """
-    filepath_json = pathlib.Path(filepath_json)
-    if filepath_json.suffix == ".dat":
-        filepath_json = filepath_json.with_suffix(".json")
+def load_sparameters(filepath):
+    """returns dict with grating coupler Sparameters
+
+    reads the binary .h5 (memory-mapped, see pylum.loadsp.Sparameters) if it
+    exists, otherwise the .json written by earlier versions
+
+    Args:
+        filepath: .h5, .dat or .json
+    """
+    filepath = pathlib.Path(filepath)
+    filepath_h5 = filepath.with_suffix(".h5")
+    filepath_json = filepath.with_suffix(".json")
+
+    if filepath_h5.exists():
+        return Sparameters(filepath_h5)
 
     assert filepath_json.exists(), f"{filepath_json} does not exist"
     return json.loads(open(filepath_json).read())
@@ -207,8 +269,6 @@ def write_sparameters(
         fiber_angle_deg: 20
 
     """
-    import lumapi
-
     function_name = draw_function.__name__
     filename = get_function_name(function_name, **kwargs)
 
@@ -216,36 +276,38 @@ def write_sparameters(
     dirpath.mkdir(exist_ok=True)
     filepath = dirpath / filename
     filepath_sim_settings = filepath.with_suffix(".settings.json")
-    filepath_json = filepath.with_suffix(".json")
+    filepath_h5 = filepath.with_suffix(".h5")
     filepath_fsp = filepath.with_suffix(".fsp")
     filepath_sp = filepath.with_suffix(".dat")
 
     if filepath_sp.exists() and not overwrite and run:
         return filepath_sp
 
-    s = session or lumapi.FDTD(hide=False)
-    simdict = draw_function(session=s, **kwargs)
-    s.save(str(filepath_fsp))
+    with sessions.session("FDTD", existing=session) as s:
+        simdict = draw_function(session=s, **kwargs)
+        s.save(str(filepath_fsp))
 
-    if not run:
-        return filepath_sp
+        if not run:
+            return filepath_sp
 
-    s.runsweep("S-parameters")
+        s.runsweep("S-parameters")
 
-    sp = s.getsweepresult("S-parameters", "S parameters")
-    s.exportsweep("S-parameters", str(filepath_sp))
+        sp = s.getsweepresult("S-parameters", "S parameters")
+        s.exportsweep("S-parameters", str(filepath_sp))
     print(f"wrote sparameters to {filepath_sp}")
 
-    keys = [key for key in sp.keys() if key.startswith("S")]
-    ra = {f"{key}a": list(np.unwrap(np.angle(sp[key].flatten()))) for key in keys}
-    rm = {f"{key}m": list(np.abs(sp[key].flatten())) for key in keys}
-
-    sp_dict = dict(wavelength_nm=list(sp["lambda"].flatten() * 1e9))
-    sp_dict.update(ra)
-    sp_dict.update(rm)
-    with open(filepath_json, "w") as f:
-        json.dump(sp_dict, f)
+    nports = int(np.sqrt(len([key for key in sp.keys() if key.startswith("S")])))
+    port_names = [f"port {i+1}" for i in range(nports)]
+    S = np.stack(
+        [
+            np.stack([sp[f"S{i+1}{j+1}"].flatten() for j in range(nports)], axis=-1)
+            for i in range(nports)
+        ],
+        axis=-2,
+    )
+    f = speed_of_light / sp["lambda"].flatten()
     settings = simdict.get("settings")
+    write_sparameters_h5(filepath_h5, port_names, f, S, settings=settings)
     if settings:
         with open(filepath_sim_settings, "w") as f:
             json.dump(settings, f)
@@ -1,6 +1,11 @@
 import json
 import pathlib
 
+import numpy as np
+
+from pylum import lsf
+from pylum import sessions
+from pylum.autoname import autoname
 from pylum.autoname import get_function_name
 from pylum.config import CONFIG
 from pylum.gc import gc2d
@@ -19,8 +24,6 @@ def gc_sweep(
 
     grating_coupler_2D_base optimizes Transmission and does not calculate Sparameters
     """
-    import lumapi
-
     function_name = draw_function.__name__ + "_sweep"
     filename = kwargs.pop("name", get_function_name(function_name, **kwargs))
 
@@ -34,13 +37,13 @@ def gc_sweep(
     if filepath_json.exists() and not overwrite and run:
         return json.loads(open(filepath_json).read())
 
-    s = session or lumapi.FDTD(hide=False)
-    simdict = draw_function(session=s, base_fsp_path=base_fsp_path, **kwargs)
-    s.save(filepath_fsp)
-    if not run:
-        return
-    s.run()
-    T = s.getresult("fom", "T")
+    with sessions.session("FDTD", existing=session) as s:
+        simdict = draw_function(session=s, base_fsp_path=base_fsp_path, **kwargs)
+        s.save(filepath_fsp)
+        if not run:
+            return
+        s.run()
+        T = s.getresult("fom", "T")
     results = dict(wavelength_nm=list(T["lambda"].ravel() * 1e9), T=list(T["T"]))
 
     with open(filepath_json, "w") as f:
@@ -52,8 +55,132 @@ def gc_sweep(
     return results
 
 
-if __name__ == "__main__":
-    import lumapi
+@autoname
+def gc_transmission(
+    session=None,
+    draw_function=gc2d,
+    base_fsp_path=str(CONFIG["grating_coupler_2D_base"]),
+    **kwargs
+):
+    """ returns grating coupler transmission spectrum, cached with @autoname
+
+    same simulation as gc_sweep, the results are cached under a hash of all the
+    settings so `pylum.sweep` and `pylum.optimize` skip the points already simulated
+
+    Returns:
+        wavelength_nm
+        T
+    """
+    with sessions.session("FDTD", existing=session) as s:
+        draw_function(session=s, base_fsp_path=base_fsp_path, **kwargs)
+        s.run()
+        T = s.getresult("fom", "T")
+    return dict(
+        wavelength_nm=np.asarray(T["lambda"]).ravel() * 1e9,
+        T=np.asarray(T["T"]).ravel(),
+    )
+
+
+@autoname
+def gc_near_field(
+    session=None,
+    draw_function=gc2d,
+    base_fsp_path=str(CONFIG["grating_coupler_2D_base"]),
+    monitor_y=1e-6,
+    monitor_xmin=-5e-6,
+    monitor_xmax=20e-6,
+    source_x=-4e-6,
+    source_y_span=2e-6,
+    **kwargs
+):
+    """ returns the field emitted by a grating coupler fed from the waveguide
+
+    disables the fiber source, launches the waveguide mode forward (+x) and records
+    the field on a line above the grating, so `pylum.fiber.coupling` computes the
+    fiber coupling for any fiber position, angle and mode size from one run
+
+    Args:
+        draw_function: gc2d
+        monitor_y: height of the near field line
+        monitor_xmin: near field line start
+        monitor_xmax: near field line end
+        source_x: waveguide mode source position
+        source_y_span: waveguide mode source span
+        kwargs: draw_function settings
+
+    Returns:
+        x: (nx,)
+        wavelength_nm: (nwavelengths,)
+        Ex, Ey, Ez: (nwavelengths, nx) complex field
+        T: (nwavelengths,) source power fraction crossing the line
+    """
+    commands = [("select", "fiber"), ("set", "enabled", False)]
+    commands += [
+        ("addmode",),
+        ("set", "name", "waveguide_source"),
+        ("set", "injection axis", "x-axis"),
+        ("set", "direction", "Forward"),
+        ("set", "x", source_x),
+        ("set", "y", kwargs.get("wg_height", 220e-9) / 2),
+        ("set", "y span", source_y_span),
+    ]
+    commands += [
+        ("addpower",),
+        ("set", "name", "near_field"),
+        ("set", "monitor type", "Linear X"),
+        ("set", "x min", monitor_xmin),
+        ("set", "x max", monitor_xmax),
+        ("set", "y", monitor_y),
+    ]
+    with sessions.session("FDTD", existing=session) as s:
+        draw_function(session=s, base_fsp_path=base_fsp_path, **kwargs)
+        lsf.draw(s, commands, batch=kwargs.get("batch", True))
+        s.run()
+        E = s.getresult("near_field", "E")
+        T = s.transmission("near_field")
+    fields = np.asarray(E["E"])
+    fields = np.reshape(fields, (-1, fields.shape[-2], 3))
+    return dict(
+        x=np.asarray(E["x"]).ravel(),
+        wavelength_nm=np.asarray(E["lambda"]).ravel() * 1e9,
+        Ex=fields[..., 0].T,
+        Ey=fields[..., 1].T,
+        Ez=fields[..., 2].T,
+        T=np.abs(np.asarray(T).ravel()),
+    )
+
+
+def test_gc_near_field():
+    from pylum import fake_lumapi
+    from pylum.fiber import coupling
+    from pylum.fiber import field
+
+    x = np.linspace(-5e-6, 20e-6, 501)
+    wavelengths = np.array([1.54e-6, 1.55e-6, 1.56e-6])
+    Ez = [field(x, position=6e-6, angle_deg=12, wavelength=w) for w in wavelengths]
+    E = np.zeros((501, 1, 1, 3, 3), dtype=complex)
+    E[:, 0, 0, :, 2] = np.transpose(Ez)
+    returns = dict(
+        getresult=lambda *args: dict(x=x[:, None], E=E, **{"lambda": wavelengths}),
+        transmission=lambda *args: np.array([0.5, 0.6, 0.5]),
+    )
+    s = fake_lumapi.FDTD(returns=returns)
+    d = gc_near_field(session=s, n_gratings=3, cache=False)
+    assert d["Ez"].shape == (3, 501)
+    assert s.calls[-4][0] == "eval" and "Linear X" in s.calls[-4][1][0]
 
-    s = lumapi.FDTD()
-    s = gc_sweep(session=s)
+    efficiency = coupling(
+        d["Ez"][1],
+        d["x"],
+        position=np.linspace(0, 12e-6, 121)[:, None],
+        angle_deg=np.linspace(0, 20, 41),
+        power=d["T"][1],
+    )
+    i, j = np.unravel_index(np.argmax(efficiency), efficiency.shape)
+    assert (i, j) == (60, 24)
+    assert np.isclose(efficiency[i, j], 0.6)
+
+
+if __name__ == "__main__":
+    with sessions.session("FDTD") as s:
+        gc_sweep(session=s)
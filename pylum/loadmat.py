@@ -1,5 +1,6 @@
 import json
 import pathlib
+from collections.abc import Mapping
 
 import h5py
 import numpy as np
@@ -8,12 +9,80 @@ from pylum.config import CONFIG
 from pylum.write_scripts import write_scripts
 
 
-def loadmat(matlab_file_path="results.mat"):
+def _decode(dataset, index=()):
+    """ returns a dataset as array, MATLAB char arrays as str """
+    value = dataset[index]
+    if dataset.attrs.get("MATLAB_class") == b"char":
+        chars = np.ascontiguousarray(np.asarray(value, dtype="<u2").T)
+        if chars.ndim < 2 or 1 in chars.shape:
+            return chars.tobytes().decode("utf-16-le")
+        return [row.tobytes().decode("utf-16-le") for row in chars]
+    return value
+
+
+class LazyMat(Mapping):
+    """read-only mapping over a MAT v7.3 file that reads variables when accessed
+
+    use it as a context manager (or call close) to close the file
+
+    .. code-block:: python
+
+        with loadmat("results.mat", lazy=True) as d:
+            wavelength = d["WL"]
+            transmission = d.read("M_T", np.s_[0, :10])  # reads only a slice
+    """
+
+    def __init__(self, matlab_file_path):
+        self._file = h5py.File(matlab_file_path, "r")
+        self._keys = [
+            key
+            for key, value in self._file.items()
+            if isinstance(value, h5py.Dataset) and not key.startswith("#")
+        ]
+
+    def read(self, key, index=()):
+        """returns a variable, or only the part selected by index
+
+        Args:
+            key: variable name
+            index: numpy index (for example np.s_[0, :10]) read from the file
+        """
+        if key not in self._keys:
+            raise KeyError(key)
+        return _decode(self._file[key], index)
+
+    def __getitem__(self, key):
+        return self.read(key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def loadmat(matlab_file_path="results.mat", lazy=False):
     """ reads a dirpath or a matlab file path
     it can also accept a dict of scripts containing dirpath
     returns a dict with the results
 
     you have to make sure that in your scripts you save the results in resuls.mat
+
+    Args:
+        matlab_file_path: results.mat or dict of scripts
+        lazy: returns a LazyMat (close it), otherwise a dict (file already closed)
     """
 
     if not str(matlab_file_path).endswith(".mat"):
@@ -22,18 +91,12 @@ def loadmat(matlab_file_path="results.mat"):
 
     matlab_file_path = pathlib.Path(matlab_file_path)
     assert matlab_file_path.exists(), f"{matlab_file_path} does not exist"
-    f = h5py.File(matlab_file_path, "r")
-
-    d = {fi.name.strip("/"): fi[()] for fi in f.values() if hasattr(fi, "value")}
-    strings = {
-        fi.name.strip("/"): fi[()]
-        for fi in f.values()
-        if hasattr(fi, "value") and fi.dtype == "u2"
-    }
-    for k, v in strings.items():
-        d[k] = "".join([chr(v[i][0]) for i in range(len(v))])
 
-    return d
+    d = LazyMat(matlab_file_path)
+    if lazy:
+        return d
+    with d:
+        return dict(d)
 
 
 def write_dict(d, filepath="results.json"):
@@ -57,6 +120,41 @@ def test_loadmat():
     r = loadmat(matlab_file_path)
     # print(r)
     assert r
+    assert r["polarization"] == "TE"
+    assert r["M_T"].shape == (3, 100)
+
+
+def test_loadmat_lazy():
+    matlab_file_path = (
+        CONFIG["repo_path"] / "workspace" / "grating_coupler_sweep" / "results.mat"
+    )
+
+    with loadmat(matlab_file_path, lazy=True) as d:
+        assert "M_T" in d
+        assert d["polarization"] == "TE"
+        transmission = d.read("M_T", np.s_[1, :10])
+        assert transmission.shape == (10,)
+        assert np.array_equal(transmission, d["M_T"][1, :10])
+    with h5py.File(matlab_file_path, "r+"):  # fails if a handle is still open
+        pass
+
+
+def test_loadmat_types(tmp_path):
+    filepath = tmp_path / "results.mat"
+    with h5py.File(filepath, "w") as f:
+        f["counts"] = np.arange(4, dtype="u2")
+        f["counts"].attrs["MATLAB_class"] = np.bytes_("uint16")
+        f["name"] = np.frombuffer("TE".encode("utf-16-le"), dtype="<u2")[:, None]
+        f["name"].attrs["MATLAB_class"] = np.bytes_("char")
+
+    d = loadmat(filepath)
+    assert d["name"] == "TE"
+    assert np.array_equal(d["counts"], np.arange(4))
+
+    with loadmat(filepath, lazy=True) as d:
+        d.read = None  # membership must not read the variable
+        assert "counts" in d
+        assert "missing" not in d
 
 
 if __name__ == "__main__":
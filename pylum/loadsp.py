@@ -1,52 +1,297 @@
+""" read and write Interconnect S-parameter files (.dat)
+
+The file starts with one `["port name","position"]` line per port, followed by one
+block per S-parameter::
+
+    ("port 1","mode 1",1,"port 2",1,"transmission")  <- output port, ..., input port
+    (300, 3)                                         <- rows, columns
+    frequency magnitude phase                        <- 300 rows
+
+Each block is parsed in one NumPy call. `mmap=True` memory-maps the file so only
+the bytes of each block are read.
+
+`write_sparameters_h5` stores the same data in a binary HDF5 container (complex S,
+frequency, port names and settings) that `read_sparameters_h5` memory-maps, so
+reading one trace out of a large library does not decode the whole file.
+"""
+import json
+import mmap as _mmap
 import pathlib
 import re
+from collections.abc import Mapping
 
+import h5py
 import numpy as np
+from scipy.constants import speed_of_light
 
 from pylum.autoname import get_function_name
 from pylum.config import CONFIG
 
+_port = re.compile(rb'^\["([^"]*)",\s*"([^"]*)"\]', re.M)
+_header = re.compile(
+    rb'^\("([^"]*)",\s*"([^"]*)",\s*(\d+),\s*"([^"]*)",\s*(\d+),\s*"([^"]*)"\)\s*\n'
+    rb"\((\d+),\s*(\d+)\)\s*\n",
+    re.M,
+)
+
+
+def _find_headers(data):
+    """ returns the offsets of the block header lines `("port ...` """
+    starts = [0] if data[:2] == b'("' else []
+    start = data.find(b'\n("')
+    while start >= 0:
+        starts.append(start + 1)
+        start = data.find(b'\n("', start + 1)
+    return starts
+
+
+def read_sparameters_dat(filepath, mmap=False):
+    """returns port_names, frequency (Hz) and S (nfreq, nports, nports) complex
+
+    S[:, i, j] is the transmission from port j (input) to port i (output)
+
+    Args:
+        filepath: Interconnect .dat file
+        mmap: memory-maps the file instead of reading it into memory
+    """
+    with open(filepath, "rb") as f:
+        data = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ) if mmap else f.read()
+    try:
+        starts = _find_headers(data)
+        assert starts, f"no S-parameter blocks found in {filepath}"
+        headers = [_header.match(data, start) for start in starts]
+        for start, m in zip(starts, headers):
+            if m is None:
+                line = bytes(data[start : start + 80]).split(b"\n")[0]
+                raise ValueError(
+                    f"{filepath}: malformed block header at byte {start}: {line!r}"
+                )
+
+        port_names = [m.group(1).decode() for m in _port.finditer(data, 0, starts[0])]
+        for m in headers:
+            for name in [m.group(1).decode(), m.group(4).decode()]:
+                if name not in port_names:
+                    port_names.append(name)
+
+        nports = len(port_names)
+        nfreq = int(headers[0].group(7))
+        S = np.zeros((nfreq, nports, nports), dtype=np.complex128)
+        f = None
+
+        ends = starts[1:] + [len(data)]
+        for m, end in zip(headers, ends):
+            nrows, ncols = int(m.group(7)), int(m.group(8))
+            block = np.array(data[m.end() : end].split(), dtype=np.float64)
+            if block.size != nrows * ncols:
+                raise ValueError(
+                    f"{filepath}: block {m.group(1).decode()} <- {m.group(4).decode()}"
+                    f" has {block.size} values, expected {nrows} x {ncols}"
+                )
+            block = block.reshape(nrows, ncols)
+            i = port_names.index(m.group(1).decode())
+            j = port_names.index(m.group(4).decode())
+            S[:, i, j] = block[:, 1] * np.exp(1j * block[:, 2])
+            if f is None:
+                f = block[:, 0].copy()
+    finally:
+        if mmap:
+            data.close()
+
+    return port_names, f, S
+
+
+def write_sparameters_dat(filepath, port_names, f, S, mode="mode 1"):
+    """writes S (nfreq, nports, nports) into an Interconnect .dat file
+
+    Args:
+        filepath: .dat file
+        port_names: list of port names
+        f: frequency (Hz)
+        S: complex S[:, output, input]
+        mode: mode label
+    """
+    f = np.asarray(f, dtype=np.float64)
+    S = np.asarray(S)
+    nfreq, nports, _ = S.shape
+    assert len(port_names) == nports, f"{len(port_names)} port names for {nports} ports"
+    row = "%.16e %.16e %.16e\n"
+
+    with open(filepath, "w") as fid:
+        for name in port_names:
+            fid.write(f'["{name}",""]\n')
+        for i, out_port in enumerate(port_names):
+            for j, in_port in enumerate(port_names):
+                s = S[:, i, j]
+                fid.write(f'("{out_port}","{mode}",1,"{in_port}",1,"transmission")\n')
+                fid.write(f"({nfreq}, 3)\n")
+                block = np.column_stack([f, np.abs(s), np.unwrap(np.angle(s))])
+                fid.write((row * nfreq) % tuple(block.ravel()))
+    return filepath
+
+
+def write_sparameters_h5(filepath, port_names, f, S, settings=None):
+    """writes S-parameters into a binary HDF5 container
+
+    S is stored contiguous and uncompressed as (nports, nports, nfreq), so every
+    S[:, i, j] trace is one contiguous run of bytes that can be memory-mapped
+
+    Args:
+        filepath: .h5 file
+        port_names: list of port names
+        f: frequency (Hz)
+        S: complex (nfreq, nports, nports), S[:, output, input]
+        settings: dict of simulation settings
+    """
+    S = np.asarray(S, dtype=np.complex128)
+    with h5py.File(filepath, "w") as h5:
+        h5.create_dataset("f", data=np.asarray(f, dtype=np.float64))
+        h5.create_dataset("S", data=np.ascontiguousarray(S.transpose(1, 2, 0)))
+        h5.attrs["port_names"] = json.dumps(list(port_names))
+        h5.attrs["settings"] = json.dumps(settings or {}, default=str)
+    return filepath
+
+
+def read_sparameters_h5(filepath, mmap=True):
+    """returns port_names, frequency (Hz), S (nfreq, nports, nports) and settings
+
+    Args:
+        filepath: .h5 file written by write_sparameters_h5
+        mmap: returns S as a read-only memory-mapped array (nothing is read until sliced)
+    """
+    with h5py.File(filepath, "r") as h5:
+        dataset = h5["S"]
+        offset = dataset.id.get_offset()
+        port_names = json.loads(h5.attrs["port_names"])
+        settings = json.loads(h5.attrs.get("settings", "{}"))
+        f = h5["f"][()]
+        if mmap and offset is not None and dataset.chunks is None:
+            S = np.memmap(
+                filepath,
+                dtype=dataset.dtype,
+                mode="r",
+                offset=offset,
+                shape=dataset.shape,
+            )
+        else:
+            S = dataset[()]
+    return port_names, f, S.transpose(2, 0, 1), settings
+
+
+class Sparameters(Mapping):
+    """dict-like view of a binary S-parameter file
+
+    keys: wavelength_nm, f, S, port_names, settings and, for every port pair,
+    S{i}{j}m (magnitude) and S{i}{j}a (unwrapped phase) computed when accessed
+    from the memory-mapped S
+    """
+
+    def __init__(self, filepath, mmap=True):
+        self.filepath = pathlib.Path(filepath)
+        port_names, f, S, settings = read_sparameters_h5(filepath, mmap=mmap)
+        self._data = dict(
+            wavelength_nm=speed_of_light / f * 1e9,
+            f=f,
+            S=S,
+            port_names=port_names,
+            settings=settings,
+        )
+        n = len(port_names)
+        self._traces = {
+            f"S{i+1}{j+1}{kind}": (i, j, kind)
+            for i in range(n)
+            for j in range(n)
+            for kind in "am"
+        }
+
+    def __getitem__(self, key):
+        if key in self._data:
+            return self._data[key]
+        if key not in self._traces:
+            raise KeyError(key)
+        i, j, kind = self._traces[key]
+        trace = np.asarray(self._data["S"][:, i, j])
+        return np.abs(trace) if kind == "m" else np.unwrap(np.angle(trace))
+
+    def __iter__(self):
+        return iter(list(self._data.keys()) + list(self._traces.keys()))
+
+    def __len__(self):
+        return len(self._data) + len(self._traces)
+
 
 def loadsp(function_name="draw_gc", dirpath=CONFIG["workspace"], numports=2, **kwargs):
+    """returns (port_names, F, S) for the Sparameters of a simulation
+
+    numports is read from the file, the argument is kept for compatibility
+    """
     name = kwargs.pop("name", get_function_name(function_name, **kwargs))
 
     dirpath = pathlib.Path(dirpath) / function_name
     filepath = dirpath / name
-    filepath_sp = str(filepath.with_suffix(".dat"))
+    filepath_sp = filepath.with_suffix(".dat")
 
     assert filepath_sp.exists(), f"Sparameters  not found in {filepath_sp}"
+    return read_sparameters_dat(filepath_sp)
+
+
+def test_read_sparameters_dat():
+    import json
+
+    dirpath = CONFIG["repo_workspace"] / "gc2d"
+    port_names, f, S = read_sparameters_dat(dirpath / "gc2d.dat")
+    d = json.loads(open(dirpath / "gc2d.json").read())
+    assert port_names == ["port 1", "port 2"]
+    assert S.shape == (300, 2, 2)
+    assert np.allclose(3e8 / f * 1e9, d["wavelength_nm"], rtol=1e-3)
+    assert np.allclose(abs(S[:, 0, 1]), d["S12m"])
+    assert np.allclose(abs(S[:, 1, 0]), d["S21m"])
+
+    port_names, f, S_mmap = read_sparameters_dat(dirpath / "gc2d.dat", mmap=True)
+    assert np.array_equal(S, S_mmap)
+
+
+def test_read_sparameters_dat_malformed(tmp_path):
+    import pytest
+
+    f = np.linspace(180e12, 200e12, 5)
+    S = np.ones((5, 2, 2))
+    filepath = write_sparameters_dat(tmp_path / "a.dat", ["1", "2"], f, S)
+    text = filepath.read_text().replace("1.0000000000000000e+00", "nan(ind)", 1)
+    filepath.write_text(text)
+    with pytest.raises(ValueError):
+        read_sparameters_dat(filepath)
+
+    filepath.write_text(text.replace("nan(ind)", "1", 1).replace("(5, 3)", "(6, 3)", 1))
+    with pytest.raises(ValueError, match="expected 6 x 3"):
+        read_sparameters_dat(filepath)
+
+    filepath.write_text(text.replace("nan(ind)", "1", 1).replace('1",1,', '1",one,', 1))
+    with pytest.raises(ValueError, match="malformed block header"):
+        read_sparameters_dat(filepath)
+
+
+def test_sparameters_h5(tmp_path):
+    f = np.linspace(180e12, 200e12, 50)
+    S = np.random.rand(50, 2, 2) * np.exp(1j * np.random.rand(50, 2, 2))
+    filepath = tmp_path / "gc.h5"
+    write_sparameters_h5(filepath, ["port 1", "port 2"], f, S, settings=dict(ff=0.5))
+    port_names, f2, S2, settings = read_sparameters_h5(filepath)
+    assert isinstance(S2.base, np.memmap)
+    assert np.array_equal(S, S2)
+    assert settings == dict(ff=0.5)
+
+    sp = Sparameters(filepath)
+    assert np.allclose(sp["S21m"], abs(S[:, 1, 0]))
+    assert np.allclose(sp["S12a"], np.unwrap(np.angle(S[:, 0, 1])))
+    assert "S22m" in sp
+
 
-    F = []
-    S = []
-    port_names = []
-
-    with open(filepath_sp, "r") as fid:
-        for i in range(numports):
-            port_line = fid.readline()
-            m = re.search('\[".*",', port_line)
-            if m:
-                port = m.group(0)
-                port_names.append(port[2:-2])
-        line = fid.readline()
-        line = fid.readline()
-        numrows = int(tuple(line[1:-2].split(","))[0])
-        S = np.zeros((numrows, numports, numports), dtype="complex128")
-        r = m = n = 0
-        for line in fid:
-            if line[0] == "(":
-                continue
-            data = line.split()
-            data = list(map(float, data))
-            if m == 0 and n == 0:
-                F.append(data[0])
-            S[r, m, n] = data[1] * np.exp(1j * data[2])
-            r += 1
-            if r == numrows:
-                r = 0
-                m += 1
-                if m == numports:
-                    m = 0
-                    n += 1
-                    if n == numports:
-                        break
-    return (port_names, F, S)
+def test_write_sparameters_dat(tmp_path):
+    f = np.linspace(180e12, 200e12, 50)
+    S = np.random.rand(50, 3, 3) * np.exp(1j * np.random.rand(50, 3, 3))
+    port_names = ["in", "through", "drop"]
+    filepath = write_sparameters_dat(tmp_path / "ring.dat", port_names, f, S)
+    port_names2, f2, S2 = read_sparameters_dat(filepath)
+    assert port_names2 == port_names
+    assert np.allclose(f, f2)
+    assert np.allclose(S, S2)
@@ -0,0 +1,89 @@
+""" build Lumerical script (LSF) commands from python
+
+A list of commands can either be sent one by one through lumapi (one blocking
+round-trip per command) or rendered into a single script and sent with one `eval`.
+Both paths go through the same list, so they draw the same geometry.
+
+A command is a tuple `(function_name, *args)`, for example `("set", "x min", 1e-6)`
+"""
+
+
+def to_lsf(value):
+    """ returns a python value as an LSF literal
+
+    LSF strings are quoted with " or ' and have no escape for the quote itself, so
+    strings with both quotes raise ValueError
+    """
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, str):
+        if '"' not in value:
+            return f'"{value}"'
+        if "'" not in value:
+            return f"'{value}'"
+        raise ValueError(f"LSF strings can not contain both quotes: {value!r}")
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def addrect(settings):
+    """ returns commands to add a rectangle and set its properties
+
+    Args:
+        settings: ordered dict of property: value
+    """
+    return [("addrect",)] + [("set", key, value) for key, value in settings.items()]
+
+
+def to_script(commands):
+    """ returns a single LSF script for a list of commands """
+    lines = []
+    for function_name, *args in commands:
+        args = ", ".join(to_lsf(arg) for arg in args)
+        lines.append(f"{function_name}({args});" if args else f"{function_name};")
+    return "\n".join(lines) + "\n"
+
+
+def draw(session, commands, batch=True):
+    """ sends commands to a lumapi session
+
+    Args:
+        session: lumapi session
+        commands: list of (function_name, *args)
+        batch: sends one script with a single `eval` (True) or one call per command
+    """
+    if batch:
+        session.eval(to_script(commands))
+    else:
+        for function_name, *args in commands:
+            getattr(session, function_name)(*args)
+    return session
+
+
+def test_to_script():
+    commands = addrect({"name": "GC_tooth", "x min": 1e-6, "alpha": 0.2})
+    commands += [("set", "override mesh order from material database", True)]
+    commands += [("selectpartial", "GC")]
+    script = to_script(commands)
+    assert script == (
+        "addrect;\n"
+        'set("name", "GC_tooth");\n'
+        'set("x min", 1e-06);\n'
+        'set("alpha", 0.2);\n'
+        'set("override mesh order from material database", 1);\n'
+        'selectpartial("GC");\n'
+    )
+
+
+def test_to_lsf_quotes():
+    import pytest
+
+    assert to_lsf('say "hi"') == "'say \"hi\"'"
+    assert to_lsf("it's") == '"it\'s"'
+    with pytest.raises(ValueError):
+        to_lsf("it's \"quoted\"")
+
+
+if __name__ == "__main__":
+    print(to_script(addrect({"name": "WG", "x min": -20e-6, "x max": 0})))
@@ -0,0 +1,254 @@
+""" complex refractive index of materials without lumapi
+
+Each material is an analytic model (Sellmeier for dielectrics, Drude for metals)
+evaluated once onto a log-spaced wavelength grid over its validity range and
+cached, then `np.interp` evaluates n and k for arrays of any shape.
+
+Materials are looked up by the short names of `pylum.config.materials` (si, sio2,
+sin) or by the Lumerical database names of `pylum.config.materials2`. Lumerical
+materials without a model here (tabulated Palik data is not shipped) raise a
+ValueError, as do wavelengths outside the range of a model.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.materials import nk
+
+    wavelength = np.linspace(1.5e-6, 1.6e-6, 101)
+    n_si = nk("si", wavelength).real
+    n_au = nk("Au (Gold) - Palik", wavelength)  # Drude fit, n + ik
+"""
+import functools
+
+import numpy as np
+
+from pylum.config import materials
+from pylum.config import materials2
+
+# (kind, coefficients, (min, max) wavelength in um, reference)
+# sellmeier: n^2 = 1 + sum(B lambda^2 / (lambda^2 - C^2)) with B, C
+# sellmeier_const: n^2 = A + sum(B lambda^2 / (lambda^2 - C^2)) with A, B, C
+# li: n^2 = eps + A / lambda^2 + B lambda1^2 / (lambda^2 - lambda1^2)
+# drude: eps = 1 - wp^2 / (w^2 + i w wt) with w, wp, wt in cm-1
+models = {
+    "si": ("li", (11.6858, 0.939816, 0.00810461, 1.1071), (1.2, 14), "Li 1980, 293K"),
+    "sio2": (
+        "sellmeier",
+        ((0.6961663, 0.4079426, 0.8974794), (0.0684043, 0.1162414, 9.896161)),
+        (0.21, 6.7),
+        "Malitson 1965",
+    ),
+    "sin": (
+        "sellmeier",
+        ((3.0249, 40314), (0.1353406, 1239.842)),
+        (0.31, 5.504),
+        "Luke 2015",
+    ),
+    "sin_philipp": (
+        "sellmeier",
+        ((2.8939,), (0.13967,)),
+        (0.207, 1.24),
+        "Philipp 1973",
+    ),
+    "al2o3": (
+        "sellmeier",
+        ((1.4313493, 0.65054713, 5.3414021), (0.0726631, 0.1193242, 18.028251)),
+        (0.2, 5.0),
+        "Malitson and Dodge 1972, ordinary ray",
+    ),
+    "gaas": (
+        "sellmeier_const",
+        (
+            5.372514,
+            (5.466742, 0.02429960, 1.957522),
+            (0.4431307, 0.8746453, 36.9166),
+        ),
+        (0.97, 17),
+        "Skauli 2003",
+    ),
+    "inp": (
+        "sellmeier_const",
+        (7.255, (2.316, 2.765), (0.6263, 32.935)),
+        (0.95, 10),
+        "Pettit and Turner 1965",
+    ),
+    "ge": (
+        "sellmeier_const",
+        (9.28156, (6.72880, 0.21307), (0.44105 ** 0.5, 3870.1 ** 0.5)),
+        (2.5, 12),
+        "Icenogle 1976",
+    ),
+    "al": ("drude", (1.19e5, 6.60e2), (1, 200), "Ordal 1985"),
+    "cu": ("drude", (5.96e4, 7.32e1), (1, 200), "Ordal 1985"),
+    "au": ("drude", (7.28e4, 2.15e2), (1, 200), "Ordal 1985"),
+    "ni": ("drude", (3.94e4, 3.52e2), (1, 200), "Ordal 1985"),
+    "pd": ("drude", (4.40e4, 1.24e2), (1, 200), "Ordal 1985"),
+    "pt": ("drude", (4.15e4, 5.58e2), (1, 200), "Ordal 1985"),
+    "ag": ("drude", (7.27e4, 1.45e2), (1, 200), "Ordal 1985"),
+    "ti": ("drude", (2.03e4, 3.82e2), (1, 200), "Ordal 1985"),
+    "v": ("drude", (4.16e4, 4.89e2), (1, 200), "Ordal 1985"),
+    "w": ("drude", (4.83e4, 4.87e2), (1, 200), "Ordal 1985"),
+}
+
+# Lumerical database names (pylum.config.materials2) approximated by each model
+# the short names of pylum.config.materials map to the same model as their
+# Lumerical name. The Phillip data of Lumerical stops at 1.24 um (Lumerical
+# extends it with its material fit), Luke 2015 covers the bands it is used for
+lumerical = {
+    "Si (Silicon) - Palik": "si",
+    "SiO2 (Glass) - Palik": "sio2",
+    "Si3N4 (Silicon Nitride) - Phillip": "sin",
+    "Al2O3 - Palik": "al2o3",
+    "GaAs - Palik": "gaas",
+    "InP - Palik": "inp",
+    "Ge (Germanium) - CRC": "ge",
+    "Ge (Germanium) - Palik": "ge",
+    "Al (Aluminium) - CRC": "al",
+    "Al (Aluminium) - Palik": "al",
+    "Cu (Copper) - CRC": "cu",
+    "Cu (Copper) - Palik": "cu",
+    "Au (Gold) - CRC": "au",
+    "Au (Gold) - Johnson and Christy": "au",
+    "Au (Gold) - Palik": "au",
+    "Ni (Nickel) - CRC": "ni",
+    "Ni (Nickel) - Palik": "ni",
+    "Pd (Palladium) - Palik": "pd",
+    "Pt (Platinum) - Palik": "pt",
+    "Ag (Silver) - CRC": "ag",
+    "Ag (Silver) - Johnson and Christy": "ag",
+    "Ag (Silver) - Palik (0-2um)": "ag",
+    "Ag (Silver) - Palik (1-10um)": "ag",
+    "Ti (Titanium) - CRC": "ti",
+    "Ti (Titanium) - Palik": "ti",
+    "V (Vanadium ) - CRC": "v",
+    "W (Tungsten) - CRC": "w",
+    "W (Tungsten) - Palik": "w",
+}
+
+npoints = 4096
+
+
+def get_model(material):
+    """ returns the model name for a short name, model name or Lumerical name """
+    if material in models:
+        return material
+    if material in lumerical:
+        return lumerical[material]
+    if material in materials2:
+        raise ValueError(f"no data for {material!r}, available: {available()}")
+    raise ValueError(f"{material!r} not in {available()}")
+
+
+def available():
+    """ returns the materials that have a model """
+    return list(models.keys()) + list(lumerical.keys())
+
+
+def _evaluate(model, wavelength_um):
+    """ returns complex index of a model at wavelengths (um) """
+    kind, coefficients, _, _ = models[model]
+    w2 = wavelength_um ** 2
+    if kind == "sellmeier":
+        B, C = coefficients
+        eps = 1 + sum(b * w2 / (w2 - c ** 2) for b, c in zip(B, C))
+    elif kind == "sellmeier_const":
+        A, B, C = coefficients
+        eps = A + sum(b * w2 / (w2 - c ** 2) for b, c in zip(B, C))
+    elif kind == "li":
+        e, A, B, w1 = coefficients
+        eps = e + A / w2 + B * w1 ** 2 / (w2 - w1 ** 2)
+    elif kind == "drude":
+        wp, wt = coefficients
+        w = 1e4 / wavelength_um
+        eps = 1 - wp ** 2 / (w ** 2 + 1j * w * wt)
+    else:
+        raise ValueError(f"unknown model {kind}")
+    return np.sqrt(np.asarray(eps, dtype=complex))
+
+
+@functools.lru_cache(maxsize=None)
+def get_grid(model):
+    """returns (wavelength (m), n, k) of a model on its cached wavelength grid
+
+    the grid spans the validity range of the model with `npoints` log-spaced points
+    """
+    wmin, wmax = models[model][2]
+    wavelength_um = np.geomspace(wmin, wmax, npoints)
+    index = _evaluate(model, wavelength_um)
+    grid = (wavelength_um * 1e-6, index.real, index.imag)
+    for array in grid:
+        array.flags.writeable = False
+    return grid
+
+
+def nk(material, wavelength):
+    """returns complex refractive index n + ik
+
+    Args:
+        material: short name (si, sio2, sin), model name or Lumerical name
+        wavelength: (m), float or array
+    """
+    model = get_model(material)
+    grid, n, k = get_grid(model)
+    wavelength = np.asarray(wavelength, dtype=float)
+    if np.any(wavelength < grid[0] * (1 - 1e-9)) or np.any(
+        wavelength > grid[-1] * (1 + 1e-9)
+    ):
+        wmin, wmax = models[model][2]
+        raise ValueError(
+            f"{material} ({models[model][3]}) defined from {wmin} to {wmax} um"
+        )
+    return np.interp(wavelength, grid, n) + 1j * np.interp(wavelength, grid, k)
+
+
+def refractive_index(material, wavelength):
+    """returns refractive index (real part) of a material
+
+    Args:
+        material: short name (si, sio2, sin), model name or Lumerical name
+        wavelength: (m), float or array
+    """
+    return nk(material, wavelength).real
+
+
+def extinction(material, wavelength):
+    """ returns extinction coefficient k of a material """
+    return nk(material, wavelength).imag
+
+
+def test_refractive_index():
+    assert set(materials.keys()) <= set(models.keys())
+    assert np.isclose(refractive_index("si", 1.55e-6), 3.4764, atol=1e-3)
+    assert np.isclose(refractive_index("sio2", 1.55e-6), 1.4440, atol=1e-3)
+    assert np.isclose(refractive_index("sin", 1.55e-6), 1.9963, atol=1e-3)
+    assert np.isclose(refractive_index("GaAs - Palik", 1.55e-6), 3.370, atol=1e-3)
+    assert np.isclose(refractive_index("InP - Palik", 1.55e-6), 3.165, atol=1e-3)
+    assert refractive_index("si", np.ones((2, 3)) * 1.55e-6).shape == (2, 3)
+
+
+def test_short_names():
+    for name, lumerical_name in materials.items():
+        assert get_model(name) == get_model(lumerical_name), name
+        assert nk(name, 1.55e-6) == nk(lumerical_name, 1.55e-6), name
+
+
+def test_grid_interpolation():
+    for model in models:
+        wmin, wmax = models[model][2]
+        wavelength_um = np.geomspace(wmin, wmax, 1000)[1:-1] * 1.0003
+        exact = _evaluate(model, wavelength_um)
+        assert np.allclose(nk(model, wavelength_um * 1e-6), exact, rtol=1e-5), model
+
+
+def test_metals_and_missing():
+    import pytest
+
+    au = nk("Au (Gold) - Palik", 10e-6)
+    assert au.imag > au.real > 1
+    assert extinction("sio2", 1.55e-6) == 0
+
+    for name in ["H2O (Water) - Palik", "TiN - Palik", "unobtainium"]:
+        with pytest.raises(ValueError):
+            nk(name, 1.55e-6)
+    with pytest.raises(ValueError):
+        nk("si", 0.5e-6)
@@ -0,0 +1,247 @@
+""" mode field export, compressed HDF5 storage and overlap integrals in NumPy
+
+A mode is a dict with its grid axes (x, y or z, only the ones with more than one
+point), the complex field components Ex ... Hz on that grid and scalars such as
+neff. `get_mode` reads one from a MODE session, `write_modes` stores modes as
+chunked, compressed HDF5 (complex64 by default, optionally interpolated onto a
+coarser grid) and `overlap` couples any two stored modes, on different grids or
+with only E fields (fiber modes), without a solver.
+
+Solvers that take `fields=True` (`waveguide_modes`, `waveguide_dispersion`)
+write their modes to `get_filepath(name)` and return that path as `fields`. The
+name holds the cache key (see `pylum.autoname.get_cache_key`), so settings that
+share an autoname, such as wg_width=500.4e-9 and 500.6e-9, never share a file.
+
+.. code-block:: python
+
+    from pylum.modes import overlap, read_modes
+    from pylum.waveguide_modes import waveguide_modes
+
+    straight = read_modes(waveguide_modes(wg_width=500e-9, fields=True)["fields"])
+    wide = read_modes(waveguide_modes(wg_width=600e-9, fields=True)["fields"])
+    overlap(straight["mode1"], wide["mode1"])
+"""
+import pathlib
+
+import h5py
+import numpy as np
+import scipy.interpolate
+from scipy.integrate import trapezoid
+
+from pylum.cache import read_group
+from pylum.cache import write_group
+from pylum.config import CONFIG
+from pylum.store import lock
+
+axes = ["x", "y", "z"]
+fields = ["Ex", "Ey", "Ez", "Hx", "Hy", "Hz"]
+
+
+def get_mode(s, mode="FDE::data::mode1"):
+    """returns grid, fields, neff and loss (dB/m) of a mode in a MODE session
+
+    Args:
+        s: lumapi.MODE session after findmodes
+        mode: mode data name
+    """
+    d = dict(
+        neff=np.asarray(s.getdata(mode, "neff")).squeeze(),
+        loss_dB_m=float(np.asarray(s.getdata(mode, "loss")).squeeze()),
+    )
+    for axis in axes:
+        values = np.asarray(s.getdata(mode, axis), dtype=float).ravel()
+        if values.size > 1:
+            d[axis] = values
+    for field in fields:
+        d[field] = np.asarray(s.getdata(mode, field)).squeeze()
+    return d
+
+
+def get_axes(mode):
+    """ returns the grid axes of a mode """
+    return [axis for axis in axes if axis in mode]
+
+
+def resample(mode, step=None, **grid):
+    """returns a mode with its fields interpolated onto another grid
+
+    Args:
+        mode: dict with grid axes and fields
+        step: grid step (m) of a uniform grid over the same extent
+        grid: axis values, for example y=np.linspace(-1e-6, 1e-6, 101)
+    """
+    names = get_axes(mode)
+    points = [mode[axis] for axis in names]
+    for axis, values in zip(names, points):
+        if axis not in grid and step:
+            n = int(np.ceil((values[-1] - values[0]) / step)) + 1
+            grid[axis] = np.linspace(values[0], values[-1], max(n, 2))
+        grid.setdefault(axis, values)
+    mesh = np.stack(np.meshgrid(*[grid[axis] for axis in names], indexing="ij"), -1)
+
+    d = {k: v for k, v in mode.items() if k not in fields}
+    d.update({axis: np.asarray(grid[axis], dtype=float) for axis in names})
+    for field in fields:
+        if field not in mode:
+            continue
+        interpolator = scipy.interpolate.RegularGridInterpolator(
+            points, mode[field], bounds_error=False, fill_value=0
+        )
+        d[field] = interpolator(mesh).astype(np.result_type(mode[field], np.complex64))
+    return d
+
+
+def get_filepath(name, dirpath=None):
+    """ returns the modes file of a simulation name """
+    dirpath = pathlib.Path(dirpath or CONFIG["cache"]) / "modes"
+    return dirpath / f"{name}.h5"
+
+
+def write_modes(filepath, modes, dtype="float32", step=None, compression="gzip"):
+    """writes modes into chunked, compressed HDF5 groups
+
+    Args:
+        filepath: .h5 file (modes with the same name are replaced)
+        modes: dict of name: mode
+        dtype: float32 (fields stored as complex64) or float64 (complex128)
+        step: interpolates the fields onto a uniform grid with this step (m)
+        compression: gzip, lzf or None
+    """
+    filepath = pathlib.Path(filepath)
+    complex_dtype = np.complex64 if dtype == "float32" else np.complex128
+    with lock(filepath), h5py.File(filepath, "a") as f:
+        for name, mode in modes.items():
+            if step:
+                mode = resample(mode, step=step)
+            mode = {
+                k: np.asarray(v, dtype=complex_dtype) if k in fields else v
+                for k, v in mode.items()
+            }
+            if name in f:
+                del f[name]
+            write_group(f.create_group(name), mode, compression=compression)
+    return filepath
+
+
+def read_modes(filepath, names=None):
+    """ returns dict of name: mode from a modes file (all modes or the names) """
+    with lock(filepath, shared=True), h5py.File(filepath, "r") as f:
+        return {name: read_group(f[name]) for name in names or f.keys()}
+
+
+def export_modes(s, name, wavelength, nmodes=1, modes=None):
+    """solves the modes at one wavelength and writes them to get_filepath(name)
+
+    CONFIG options: `modes_dtype` (float32 or float64, default float32) and
+    `modes_step` (interpolation grid step, default the solver mesh)
+
+    Args:
+        s: lumapi.MODE session with a mode solver
+        name: simulation name
+        wavelength: (m)
+        nmodes: exports mode1 ... mode{nmodes}
+        modes: list of mode numbers (instead of nmodes)
+    """
+    s.setanalysis("wavelength", wavelength)
+    n = int(s.findmodes())
+    modes = [m for m in modes or range(1, nmodes + 1) if m <= n]
+    return write_modes(
+        get_filepath(name),
+        {f"mode{m}": get_mode(s, f"FDE::data::mode{m}") for m in modes},
+        dtype=CONFIG.get("modes_dtype", "float32"),
+        step=CONFIG.get("modes_step"),
+    )
+
+
+def _integrate(values, mode):
+    for axis in reversed(get_axes(mode)):
+        values = trapezoid(values, mode[axis], axis=-1)
+    return values
+
+
+def overlap(mode1, mode2):
+    """returns power coupling from mode1 into mode2
+
+    with H fields, as the MODE `overlap` command for the propagation axis normal to
+    the grid: Re[(E1 x H2*)(E2 x H1*) / (E1 x H1*)] / Re(E2 x H2*)
+
+    with only E fields (fiber or scalar modes): |E1 . E2*|^2 / (|E1|^2 |E2|^2)
+
+    mode2 is interpolated onto the grid of mode1 when the grids differ (zero outside)
+
+    Args:
+        mode1: dict with grid axes and fields
+        mode2: dict with the same axes
+    """
+    names = get_axes(mode1)
+    if get_axes(mode2) != names:
+        raise ValueError(f"modes on {names} and {get_axes(mode2)} axes")
+    if any(
+        mode1[axis].shape != mode2[axis].shape or not np.allclose(mode1[axis], mode2[axis])
+        for axis in names
+    ):
+        mode2 = resample(mode2, **{axis: mode1[axis] for axis in names})
+
+    normal = ({"x", "y", "z"} - set(names)).pop() if len(names) == 2 else "x"
+    i, j = [axis for axis in axes if axis != normal]
+    E1, E2 = f"E{i}", f"E{j}"
+    H1, H2 = f"H{i}", f"H{j}"
+    if all(k in mode1 and k in mode2 for k in [E1, E2, H1, H2]):
+
+        def flux(a, b):
+            return _integrate(a[E1] * np.conj(b[H2]) - a[E2] * np.conj(b[H1]), mode1)
+
+        return float(
+            np.real(flux(mode1, mode2) * flux(mode2, mode1) / flux(mode1, mode1))
+            / np.real(flux(mode2, mode2))
+        )
+
+    components = [k for k in fields[:3] if k in mode1 and k in mode2]
+    if not components:
+        raise ValueError("modes without common E field components")
+    cross = sum(_integrate(mode1[k] * np.conj(mode2[k]), mode1) for k in components)
+    power1 = sum(_integrate(np.abs(mode1[k]) ** 2, mode1) for k in components)
+    power2 = sum(_integrate(np.abs(mode2[k]) ** 2, mode1) for k in components)
+    return float(np.abs(cross) ** 2 / (power1 * power2))
+
+
+def _gaussian_mode(y, z, y0=0, z0=0, w=0.4e-6, neff=2.4):
+    E = np.exp(-(((y[:, None] - y0) / w) ** 2) - ((z - z0) / (w / 2)) ** 2)
+    zero = np.zeros_like(E)
+    return dict(neff=neff, y=y, z=z, Ex=zero, Ey=E, Ez=zero, Hx=zero, Hy=zero, Hz=neff * E)
+
+
+def test_overlap():
+    y = np.linspace(-2e-6, 2e-6, 201)
+    z = np.linspace(-1e-6, 1e-6, 101)
+    a = _gaussian_mode(y, z)
+    assert np.isclose(overlap(a, a), 1)
+
+    b = _gaussian_mode(y, z, y0=0.2e-6)
+    expected = np.exp(-((0.2e-6 / 0.4e-6) ** 2))
+    assert np.isclose(overlap(a, b), expected, rtol=1e-3)
+
+    c = resample(b, step=40e-9)
+    assert c["Ey"].shape == (101, 51)
+    assert np.isclose(overlap(a, c), expected, rtol=1e-2)
+
+    scalar = {k: v for k, v in b.items() if not k.startswith("H")}
+    assert np.isclose(overlap(a, scalar), expected, rtol=1e-3)
+
+
+def test_write_modes(tmp_path):
+    y = np.linspace(-2e-6, 2e-6, 201)
+    z = np.linspace(-1e-6, 1e-6, 101)
+    a = _gaussian_mode(y, z)
+    b = _gaussian_mode(y, z, y0=0.2e-6)
+
+    filepath = tmp_path / "modes.h5"
+    write_modes(filepath, dict(a=a), dtype="float64", compression=None)
+    size = filepath.stat().st_size
+    write_modes(tmp_path / "small.h5", dict(a=a, b=b), step=20e-9)
+    assert (tmp_path / "small.h5").stat().st_size < size / 4
+
+    modes = read_modes(tmp_path / "small.h5")
+    assert modes["a"]["Ey"].dtype == np.complex64
+    assert np.isclose(overlap(modes["a"], modes["b"]), overlap(a, b), rtol=1e-3)
+    assert np.isclose(float(modes["a"]["neff"]), 2.4)
@@ -0,0 +1,515 @@
+""" batched optimizers for pylum functions, for example grating coupler designs
+
+Each iteration a strategy proposes a batch of settings that runs in parallel
+through `pylum.sweep` (cached points are loaded, not simulated), and is told the
+outputs. The strategy state is pickled to `checkpoint` after every batch, so
+calling `optimize` again with the same checkpoint resumes a killed job.
+
+Strategies work in the bounds scaled to [0, 1] and maximize the output:
+
+- `NelderMead`: parallel Nelder-Mead, the reflection, expansion and both
+  contractions of the worst vertices are evaluated in one batch
+- `CMAES`: covariance matrix adaptation evolution strategy, one generation per batch
+- `Bayesian`: Gaussian process (`pylum.surrogate.GaussianProcess`) with a batch of
+  expected improvement points
+
+.. code-block:: python
+
+    from pylum.optimize import optimize_gc
+
+    d = optimize_gc(
+        bounds=dict(period=(0.6e-6, 0.7e-6), ff=(0.3, 0.7), etch_depth=(60e-9, 120e-9)),
+        wavelength=1550e-9,
+        strategy="cmaes",
+        checkpoint="gc_cmaes.pkl",
+    )
+    d["best"]  # settings with the highest transmission (dB) at 1550 nm
+"""
+import os
+import pathlib
+import pickle
+
+import numpy as np
+import pandas as pd
+import scipy.stats
+
+from pylum import sessions
+from pylum.adaptive import _evaluate
+from pylum.adaptive import latin_hypercube
+from pylum.surrogate import GaussianProcess
+
+
+def transmission_dB(d, wavelength=None, key="T"):
+    """returns transmission (dB) at a wavelength, or its maximum (max_transmission_dB)
+
+    Args:
+        d: results with wavelength_nm and key (gc_transmission, gc_sweep or Sparameters)
+        wavelength: (m), None for the maximum over the spectrum
+        key: T or an Sparameter magnitude (S12m)
+    """
+    w = np.asarray(d["wavelength_nm"], dtype=float).ravel()
+    T = np.asarray(d[key], dtype=float).ravel()
+    if wavelength is None:
+        return 10 * np.log10(T.max())
+    i = np.argsort(w)
+    return 10 * np.log10(np.interp(wavelength * 1e9, w[i], T[i]))
+
+
+class NelderMead:
+    """parallel Nelder-Mead simplex (Lee and Wiswall 2007)
+
+    each iteration updates the `nworst` worst vertices against the centroid of the
+    others, proposing reflection, expansion and both contractions of each at once
+    (4 nworst points), and shrinks towards the best vertex if none improves
+
+    Args:
+        ndim: number of inputs
+        x0: start point in [0, 1] (defaults to the center)
+        step: initial simplex size
+        batch_size: points per batch, nworst = batch_size // 4
+        rng: unused, the simplex is deterministic
+    """
+
+    def __init__(self, ndim, x0=None, step=0.2, batch_size=4, rng=None):
+        x0 = np.full(ndim, 0.5) if x0 is None else np.asarray(x0, dtype=float)
+        simplex = np.tile(x0, (ndim + 1, 1))
+        for i in range(ndim):
+            simplex[i + 1, i] += step if x0[i] + step <= 1 else -step
+        self.ndim = ndim
+        self.nworst = max(1, min(ndim, batch_size // 4))
+        self.simplex = simplex
+        self.values = None
+        self._pending = "simplex"
+
+    def ask(self):
+        if self._pending in ["simplex", "shrink"]:
+            return self.simplex if self._pending == "simplex" else self.simplex[1:]
+        n = len(self.simplex) - self.nworst
+        centroid = self.simplex[:n].mean(axis=0)
+        d = centroid - self.simplex[n:]
+        points = [centroid + c * d for c in [1, 2, 0.5, -0.5]]
+        return np.clip(np.concatenate(points), 0, 1)
+
+    def tell(self, U, y):
+        y = np.where(np.isfinite(y), y, -np.inf)
+        if self._pending == "simplex":
+            self.simplex, self.values = U, y
+        elif self._pending == "shrink":
+            self.simplex[1:], self.values[1:] = U, y
+        else:
+            n = len(self.simplex) - self.nworst
+            r, e, oc, ic = np.split(np.arange(len(U)), 4)
+            improved = False
+            for j in range(self.nworst):
+                k = n + j
+                best, second = self.values[0], self.values[n - 1]
+                if y[r[j]] > best:
+                    i = e[j] if y[e[j]] > y[r[j]] else r[j]
+                elif y[r[j]] > second:
+                    i = r[j]
+                elif y[r[j]] > self.values[k]:
+                    i = oc[j] if y[oc[j]] >= y[r[j]] else None
+                else:
+                    i = ic[j] if y[ic[j]] > self.values[k] else None
+                if i is not None:
+                    self.simplex[k], self.values[k] = U[i], y[i]
+                    improved = True
+            if not improved:
+                self.simplex[1:] = self.simplex[0] + 0.5 * (
+                    self.simplex[1:] - self.simplex[0]
+                )
+                self._pending = "shrink"
+                return
+        order = np.argsort(-self.values, kind="stable")
+        self.simplex, self.values = self.simplex[order], self.values[order]
+        self._pending = None
+
+
+class CMAES:
+    """(mu/mu_w, lambda) covariance matrix adaptation evolution strategy (Hansen 2016)
+
+    Args:
+        ndim: number of inputs
+        x0: start mean in [0, 1] (defaults to the center)
+        sigma: initial step size
+        batch_size: population size lambda (at least 4)
+        rng: numpy random Generator
+    """
+
+    def __init__(self, ndim, x0=None, sigma=0.3, batch_size=8, rng=None):
+        n = ndim
+        self.ndim = n
+        self.rng = rng or np.random.default_rng()
+        self.mean = np.full(n, 0.5) if x0 is None else np.asarray(x0, dtype=float)
+        self.sigma = sigma
+        self.popsize = max(4, batch_size)
+        self.mu = self.popsize // 2
+        weights = np.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / np.sum(self.weights ** 2)
+
+        mueff = self.mueff
+        self.cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+        self.cs = (mueff + 2) / (n + mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + mueff)
+        self.cmu = min(1 - self.c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+        self.damps = 1 + 2 * max(0, np.sqrt((mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chin = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.C = np.eye(n)
+        self.generation = 0
+
+    def ask(self):
+        eigenvalues, B = np.linalg.eigh(self.C)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        z = self.rng.standard_normal((self.popsize, self.ndim))
+        return np.clip(self.mean + self.sigma * (z * D) @ B.T, 0, 1)
+
+    def tell(self, U, y):
+        y = np.where(np.isfinite(y), y, -np.inf)
+        n = self.ndim
+        selected = U[np.argsort(-y, kind="stable")[: self.mu]]
+        old = self.mean
+        self.mean = self.weights @ selected
+        step = (self.mean - old) / self.sigma
+
+        eigenvalues, B = np.linalg.eigh(self.C)
+        invsqrt = B @ np.diag(1 / np.sqrt(np.maximum(eigenvalues, 1e-20))) @ B.T
+        self.ps = (1 - self.cs) * self.ps + np.sqrt(
+            self.cs * (2 - self.cs) * self.mueff
+        ) * (invsqrt @ step)
+        self.generation += 1
+        norm = np.linalg.norm(self.ps) / np.sqrt(
+            1 - (1 - self.cs) ** (2 * self.generation)
+        )
+        hsig = norm / self.chin < 1.4 + 2 / (n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * np.sqrt(
+            self.cc * (2 - self.cc) * self.mueff
+        ) * step
+
+        steps = (selected - old) / self.sigma
+        self.C = (
+            (1 - self.c1 - self.cmu) * self.C
+            + self.c1
+            * (
+                np.outer(self.pc, self.pc)
+                + (1 - hsig) * self.cc * (2 - self.cc) * self.C
+            )
+            + self.cmu * (steps.T * self.weights) @ steps
+        )
+        self.sigma *= np.exp(
+            (self.cs / self.damps) * (np.linalg.norm(self.ps) / self.chin - 1)
+        )
+
+
+class Bayesian:
+    """Bayesian optimization with a Gaussian process and expected improvement
+
+    starts with a Latin hypercube, then each batch takes the largest expected
+    improvement, adds it with its predicted mean (kriging believer) and repeats
+
+    Args:
+        ndim: number of inputs
+        batch_size: points per batch
+        initial_points: size of the initial Latin hypercube (default 2 ndim + 2)
+        x0: point in [0, 1] added to the initial Latin hypercube
+        xi: exploration margin of the expected improvement (output std units)
+        ncandidates: random candidates scored per batch point
+        rng: numpy random Generator
+    """
+
+    def __init__(
+        self,
+        ndim,
+        batch_size=4,
+        initial_points=None,
+        x0=None,
+        xi=0.01,
+        ncandidates=2000,
+        rng=None,
+    ):
+        self.ndim = ndim
+        self.x0 = x0
+        self.batch_size = batch_size
+        self.initial_points = initial_points or max(batch_size, 2 * ndim + 2)
+        self.xi = xi
+        self.ncandidates = ncandidates
+        self.rng = rng or np.random.default_rng()
+        self.U = np.zeros((0, ndim))
+        self.y = np.zeros(0)
+        self.gp = GaussianProcess()
+
+    def expected_improvement(self, gp, U, best):
+        mean, std = gp.predict(U)
+        std = np.maximum(std, 1e-12)
+        improvement = mean - best - self.xi * gp.ystd
+        z = improvement / std
+        return improvement * scipy.stats.norm.cdf(z) + std * scipy.stats.norm.pdf(z)
+
+    def ask(self):
+        if len(self.y) < 2:
+            U = latin_hypercube(self.initial_points, self.ndim, self.rng)
+            return U if self.x0 is None else np.vstack([self.x0, U[1:]])
+        best = self.U[np.argmax(self.y)]
+        local = best + 0.05 * self.rng.standard_normal((self.ncandidates, self.ndim))
+        candidates = np.vstack(
+            [self.rng.random((self.ncandidates, self.ndim)), np.clip(local, 0, 1)]
+        )
+        U, y = self.U, self.y
+        model = self.gp
+        batch = []
+        for _ in range(self.batch_size):
+            i = np.argmax(self.expected_improvement(model, candidates, y.max()))
+            batch.append(candidates[i])
+            U = np.vstack([U, candidates[i]])
+            y = np.append(y, model.predict(candidates[i], return_std=False))
+            candidates = np.delete(candidates, i, axis=0)
+            model = GaussianProcess(noise=self.gp.noise)
+            model.length_scale = self.gp.length_scale
+            model.fit(U, y, optimize=False)
+        return np.array(batch)
+
+    def tell(self, U, y):
+        ok = np.isfinite(y)
+        self.U = np.vstack([self.U, U[ok]])
+        self.y = np.append(self.y, y[ok])
+        if len(self.y) >= 2:
+            self.gp.fit(self.U, self.y)
+
+
+strategies = dict(neldermead=NelderMead, cmaes=CMAES, bayesian=Bayesian)
+
+
+def _save(filepath, state):
+    """ pickles state to a temporary file and renames it, never a partial file """
+    filepath = pathlib.Path(filepath)
+    tmp = filepath.with_suffix(filepath.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f)
+    os.replace(tmp, filepath)
+
+
+def optimize(
+    function,
+    bounds,
+    output,
+    fixed=None,
+    strategy="bayesian",
+    x0=None,
+    max_evaluations=50,
+    batch_size=None,
+    checkpoint=None,
+    seed=0,
+    solver=None,
+    processes=None,
+    lumapi=None,
+    progress=True,
+    **strategy_kwargs,
+):
+    """maximizes the output of a function over bounded settings in parallel batches
+
+    Args:
+        function: pylum function (@autoname functions load the points already cached)
+        bounds: dict of name: (min, max) for the optimized settings
+        output: result key (scalar) or function of the result dict returning a float
+        fixed: other settings passed to every call
+        strategy: neldermead, cmaes or bayesian
+        x0: dict of start values (neldermead and cmaes, defaults to the center)
+        max_evaluations: stops after the batch that reaches it
+        batch_size: points per batch (default: processes, or the session pool size)
+        checkpoint: pickle file with the optimizer state, resumes from it if it exists
+        seed: random seed
+        solver, processes, lumapi, progress: see `pylum.sweep.sweep`
+        strategy_kwargs: passed to the strategy (step, sigma, xi ...)
+
+    Returns:
+        points: DataFrame of evaluated points with `output` and `batch` columns
+        best: settings of the best point and its `output`
+        strategy: the strategy object
+
+    Raises ValueError if every evaluation failed (the checkpoint keeps the points)
+    """
+    fixed = dict(fixed or {})
+    names = list(bounds.keys())
+    lower = np.array([bounds[k][0] for k in names], dtype=float)
+    upper = np.array([bounds[k][1] for k in names], dtype=float)
+    sweep_kwargs = dict(
+        solver=solver, processes=processes, lumapi=lumapi, progress=progress
+    )
+
+    if checkpoint and pathlib.Path(checkpoint).exists():
+        with open(checkpoint, "rb") as f:
+            state = pickle.load(f)
+        if state["names"] != names or not np.allclose(
+            state["bounds"], [lower, upper]
+        ):
+            raise ValueError(
+                f"{checkpoint} optimizes {state['names']} within {state['bounds']}"
+            )
+    else:
+        if strategy not in strategies:
+            raise ValueError(f"{strategy} not in {list(strategies.keys())}")
+        batch_size = batch_size or processes or sessions.get_pool().size
+        if x0 is not None:
+            x0 = (np.array([x0[k] for k in names], dtype=float) - lower) / (
+                upper - lower
+            )
+            strategy_kwargs["x0"] = x0
+        state = dict(
+            names=names,
+            bounds=np.array([lower, upper]),
+            strategy=strategies[strategy](
+                len(names),
+                batch_size=batch_size,
+                rng=np.random.default_rng(seed),
+                **strategy_kwargs,
+            ),
+            frames=[],
+        )
+
+    while sum(len(df) for df in state["frames"]) < max_evaluations:
+        U = state["strategy"].ask()
+        X = lower + U * (upper - lower)
+        points = [{k: float(x[j]) for j, k in enumerate(names)} for x in X]
+        df, values = _evaluate(function, output, points, fixed, **sweep_kwargs)
+        state["strategy"].tell(U, values)
+        df["output"] = values
+        df["batch"] = len(state["frames"])
+        state["frames"].append(df)
+        if checkpoint:
+            _save(checkpoint, state)
+
+    points = pd.concat(state["frames"], ignore_index=True)
+    if points["output"].isnull().all():
+        error = points["error"].dropna()
+        raise ValueError(
+            f"no successful evaluations of {function.__name__} in {len(points)} points"
+            + (f", first error:\n{error.iloc[0]}" if len(error) else "")
+        )
+    i = points["output"].idxmax()
+    best = {k: points.loc[i, k] for k in names}
+    best["output"] = float(points.loc[i, "output"])
+    return dict(points=points, best=best, strategy=state["strategy"])
+
+
+def optimize_gc(bounds, wavelength=1550e-9, key="T", fixed=None, **kwargs):
+    """maximizes grating coupler transmission (dB) at a wavelength
+
+    runs `pylum.gc_sweep.gc_transmission` in FDTD sessions
+
+    Args:
+        bounds: dict of gc2d settings: (min, max), period, ff, etch_depth, fiber_angle_deg
+        wavelength: target wavelength (m), also the source center wavelength
+        key: transmission key of the results
+        fixed: other gc2d settings
+        kwargs: see optimize (strategy, max_evaluations, checkpoint, processes ...)
+    """
+    import functools
+
+    from pylum.gc_sweep import gc_transmission
+
+    fixed = dict(fixed or {})
+    fixed.setdefault("wavelength", wavelength)
+    output = functools.partial(transmission_dB, wavelength=wavelength, key=key)
+    kwargs.setdefault("solver", "FDTD")
+    return optimize(gc_transmission, bounds, output, fixed=fixed, **kwargs)
+
+
+def _grating(period=0.66e-6, ff=0.5, etch_depth=70e-9, wavelength=1.55e-6):
+    """ toy grating coupler spectrum, Gaussian around the Bragg peak wavelength """
+    neff = 2.3 + 0.6 * ff + 1e6 * (etch_depth - 70e-9)
+    peak_wavelength = period * (neff - np.sin(np.radians(20)))
+    wavelength_nm = np.linspace(1450, 1650, 201)
+    peak = 0.7 * np.exp(-(((ff - 0.45) / 0.15) ** 2))
+    T = peak * np.exp(-(((wavelength_nm * 1e-9 - peak_wavelength) / 40e-9) ** 2))
+    return dict(wavelength_nm=wavelength_nm, T=np.maximum(T, 1e-6))
+
+
+def test_transmission_dB():
+    d = dict(wavelength_nm=np.array([1560, 1550, 1540]), T=np.array([0.2, 0.5, 0.1]))
+    assert np.isclose(transmission_dB(d), 10 * np.log10(0.5))
+    assert np.isclose(transmission_dB(d, 1545e-9), 10 * np.log10(0.3))
+
+
+def test_optimize():
+    import functools
+
+    bounds = dict(period=(0.6e-6, 0.72e-6), ff=(0.3, 0.7))
+    output = functools.partial(transmission_dB, wavelength=1550e-9)
+    for strategy, n in [("neldermead", 60), ("cmaes", 80), ("bayesian", 30)]:
+        d = optimize(
+            _grating,
+            bounds,
+            output,
+            strategy=strategy,
+            max_evaluations=n,
+            batch_size=4 if strategy != "cmaes" else 8,
+            processes=0,
+            progress=False,
+        )
+        assert len(d["points"]) >= n
+        assert d["best"]["output"] > 10 * np.log10(0.68), strategy
+
+
+def _failing_grating(ff=0.5, **kwargs):
+    if ff > 0.5:
+        raise ValueError("simulation failed")
+    return _grating(ff=ff, **kwargs)
+
+
+def test_optimize_failed_points():
+    import functools
+
+    import pytest
+
+    bounds = dict(period=(0.6e-6, 0.72e-6), ff=(0.3, 0.7))
+    output = functools.partial(transmission_dB, wavelength=1550e-9)
+    for strategy in strategies:
+        d = optimize(
+            _failing_grating,
+            bounds,
+            output,
+            strategy=strategy,
+            max_evaluations=40,
+            batch_size=8,
+            processes=0,
+            progress=False,
+        )
+        points = d["points"]
+        failed = points["ff"] > 0.5
+        assert failed.any(), strategy
+        assert points["output"][failed].isnull().all()
+        assert points["output"][~failed].notnull().all()
+        assert d["best"]["ff"] <= 0.5
+        assert d["best"]["output"] > 10 * np.log10(0.6), strategy
+
+        with pytest.raises(ValueError, match="no successful evaluations"):
+            optimize(
+                _failing_grating,
+                dict(period=(0.6e-6, 0.72e-6), ff=(0.55, 0.7)),
+                output,
+                strategy=strategy,
+                max_evaluations=16,
+                batch_size=8,
+                processes=0,
+                progress=False,
+            )
+
+
+def test_optimize_checkpoint(tmp_path):
+    import functools
+
+    bounds = dict(period=(0.6e-6, 0.72e-6), ff=(0.3, 0.7))
+    output = functools.partial(transmission_dB, wavelength=1550e-9)
+    kwargs = dict(strategy="cmaes", batch_size=6, processes=0, progress=False)
+    checkpoint = tmp_path / "cmaes.pkl"
+
+    full = optimize(_grating, bounds, output, max_evaluations=24, **kwargs)
+    optimize(_grating, bounds, output, max_evaluations=12, checkpoint=checkpoint, **kwargs)
+    resumed = optimize(
+        _grating, bounds, output, max_evaluations=24, checkpoint=checkpoint, **kwargs
+    )
+    assert len(resumed["points"]) == 24
+    assert np.allclose(full["points"]["output"], resumed["points"]["output"])
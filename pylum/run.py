@@ -1,27 +1,38 @@
+from pylum import sessions
 from pylum.write_scripts import write_scripts
 
 
-def run_mode(scripts_dict, session=None, return_session=False):
-    """ runs a dict of scripts in a MODE session
-    there should be a main.lsf defined
-    """
-    import lumapi
-
+def _run(solver, scripts_dict, session=None, return_session=False):
     dirpath = scripts_dict.get("dirpath", write_scripts(scripts_dict))
 
-    s = session or lumapi.MODE()
-    s.cd(str(dirpath))
-
-    s.eval(scripts_dict["main.lsf"])
-
     if return_session:
+        with sessions.handout(solver, existing=session) as s:
+            s.cd(str(dirpath))
+            s.eval(scripts_dict["main.lsf"])
         return s
 
+    with sessions.session(solver, existing=session) as s:
+        s.cd(str(dirpath))
+        s.eval(scripts_dict["main.lsf"])
+
+
+def run_mode(scripts_dict, session=None, return_session=False):
+    """ runs a dict of scripts in a MODE session
+    there should be a main.lsf defined
+
+    without a session it uses one from `pylum.sessions`, with return_session=True
+    the caller must hand it back with `sessions.release(s)`
+    """
+    return _run("MODE", scripts_dict, session=session, return_session=return_session)
+
 
 def run_fdtd(scripts_dict, session=None, return_session=False):
     """ runs a dict of scripts in a FDTD session
     there should be a main.lsf defined
 
+    without a session it uses one from `pylum.sessions`, with return_session=True
+    the caller must hand it back with `sessions.release(s)`
+
     .. code-block:: python
 
         import pylum
@@ -31,17 +42,7 @@ def run_fdtd(scripts_dict, session=None, return_session=False):
         run_fdtd(scripts_dict)
 
     """
-    import lumapi
-
-    dirpath = scripts_dict.get("dirpath", write_scripts(scripts_dict))
-
-    s = session or lumapi.FDTD()
-    s.cd(str(dirpath))
-
-    s.eval(scripts_dict["main.lsf"])
-
-    if return_session:
-        return s
+    return _run("FDTD", scripts_dict, session=session, return_session=return_session)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,260 @@
+""" pool of warm lumapi sessions reused across simulations
+
+Starting a session checks out a license and launches the solver, which often takes
+longer than a short 2D simulation. The pool keeps up to `size` idle headless
+sessions per solver type and resets them with `newproject` between jobs.
+
+.. code-block:: python
+
+    from pylum import sessions
+    from pylum.gc import gc2d
+
+    with sessions.session("FDTD") as s:
+        gc2d(session=s)
+
+Functions that return their session (`gc2d`, `dbr.draw`, `waveguide`,
+`run_fdtd(return_session=True)`) take it from the pool through `handout` when no
+session is passed; the caller owns it and must hand it back with
+`sessions.release(s)`. If drawing fails the session is discarded instead.
+
+CONFIG options: `sessions` (idle sessions per solver, default 2) and
+`sessions_hide` (headless, default True)
+"""
+import contextlib
+import threading
+from collections import defaultdict
+
+from pylum.config import CONFIG
+
+solvers = ["FDTD", "MODE"]
+
+
+class SessionPool:
+    """ keeps up to `size` warm sessions per solver type
+
+    Args:
+        size: max number of idle sessions kept per solver
+        hide: start sessions without GUI
+        lumapi: module with FDTD and MODE classes (defaults to `import lumapi`)
+    """
+
+    def __init__(self, size=2, hide=True, lumapi=None):
+        self.size = size
+        self.hide = hide
+        self._lumapi = lumapi
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @property
+    def lumapi(self):
+        if self._lumapi is None:
+            import lumapi
+
+            self._lumapi = lumapi
+        return self._lumapi
+
+    def acquire(self, solver="FDTD"):
+        """ returns an idle session or starts a new one """
+        if solver not in solvers:
+            raise ValueError(f"{solver} not in {solvers}")
+        with self._lock:
+            idle = self._idle[solver]
+            s = idle.pop() if idle else None
+        return s or getattr(self.lumapi, solver)(hide=self.hide)
+
+    def release(self, s, crashed=False):
+        """ resets a session with `newproject` and keeps it warm
+
+        closes the session if it crashed, does not reset or the pool is full
+        """
+        if not crashed:
+            try:
+                s.newproject()
+            except Exception:
+                crashed = True
+
+        with self._lock:
+            idle = self._idle[get_solver(s)]
+            if not crashed and len(idle) < self.size:
+                if s not in idle:
+                    idle.append(s)
+                return
+        _close(s)
+
+    @contextlib.contextmanager
+    def session(self, solver="FDTD", existing=None):
+        """ context manager that hands out a session and takes it back
+
+        the session is closed instead of pooled if the body raises, as the
+        exception may come from a dead or half-configured solver
+
+        Args:
+            solver: FDTD or MODE
+            existing: session to use as is (not taken from, nor returned to the pool)
+        """
+        if existing is not None:
+            yield existing
+            return
+
+        s = self.acquire(solver)
+        try:
+            yield s
+        except BaseException:
+            self.release(s, crashed=True)
+            raise
+        self.release(s)
+
+    @contextlib.contextmanager
+    def handout(self, solver="FDTD", existing=None):
+        """ context manager for functions that return their session to the caller
+
+        a session taken from the pool is closed if the body raises, otherwise the
+        caller owns it and must `release` it
+
+        Args:
+            solver: FDTD or MODE
+            existing: session to use as is (not taken from the pool)
+        """
+        if existing is not None:
+            yield existing
+            return
+
+        s = self.acquire(solver)
+        try:
+            yield s
+        except BaseException:
+            self.release(s, crashed=True)
+            raise
+
+    def idle(self, solver="FDTD"):
+        """ returns number of idle sessions """
+        return len(self._idle[solver])
+
+    def close(self):
+        """ closes all idle sessions """
+        with self._lock:
+            idle = [s for sessions in self._idle.values() for s in sessions]
+            self._idle.clear()
+        for s in idle:
+            _close(s)
+
+
+def get_solver(s):
+    """ returns solver type (FDTD, MODE) of a session """
+    return type(s).__name__
+
+
+def _close(s):
+    try:
+        s.close()
+    except Exception:
+        pass
+
+
+_pool = None
+
+
+def get_pool():
+    """ returns the default pool, configured from CONFIG """
+    global _pool
+    if _pool is None:
+        _pool = SessionPool(
+            size=CONFIG.get("sessions", 2), hide=CONFIG.get("sessions_hide", True)
+        )
+    return _pool
+
+
+def set_pool(pool):
+    """ replaces the default pool (for example with one using fake_lumapi) """
+    global _pool
+    if _pool is not None and _pool is not pool:
+        _pool.close()
+    _pool = pool
+
+
+def acquire(solver="FDTD"):
+    return get_pool().acquire(solver)
+
+
+def release(s, crashed=False):
+    return get_pool().release(s, crashed=crashed)
+
+
+def session(solver="FDTD", existing=None):
+    return get_pool().session(solver, existing=existing)
+
+
+def handout(solver="FDTD", existing=None):
+    return get_pool().handout(solver, existing=existing)
+
+
+def test_pool_reuse():
+    from pylum import fake_lumapi
+
+    pool = SessionPool(size=1, lumapi=fake_lumapi)
+    with pool.session("FDTD") as s1:
+        s1.addrect()
+    with pool.session("FDTD") as s2:
+        pass
+    assert s1 is s2
+    assert s2.calls[-1][0] == "newproject"
+
+    with pool.session("FDTD") as s3:
+        with pool.session("FDTD") as s4:
+            assert s3 is not s4
+    assert pool.idle("FDTD") == 1
+    assert s4.closed or s3.closed
+
+    with pool.session("MODE") as s5:
+        assert isinstance(s5, fake_lumapi.MODE)
+    pool.close()
+    assert s5.closed
+
+
+def test_pool_recycles_crashed_session():
+    from pylum import fake_lumapi
+
+    pool = SessionPool(size=2, lumapi=fake_lumapi)
+    try:
+        with pool.session("FDTD") as s1:
+            s1.close()  # the solver died
+            s1.run()
+    except fake_lumapi.LumApiError:
+        pass
+    assert pool.idle("FDTD") == 0
+
+    with pool.session("FDTD") as s2:
+        s2.run()
+    assert s2 is not s1
+    assert pool.idle("FDTD") == 1
+
+    try:
+        with pool.session("FDTD") as s3:
+            raise ValueError("failed simulation")
+    except ValueError:
+        pass
+    assert s3 is s2 and s3.closed
+    assert pool.idle("FDTD") == 0
+
+
+def test_handout():
+    from pylum import fake_lumapi
+
+    pool = SessionPool(size=1, lumapi=fake_lumapi)
+    with pool.handout("FDTD") as s1:
+        s1.addrect()
+    assert pool.idle("FDTD") == 0 and not s1.closed
+    pool.release(s1)
+    assert pool.idle("FDTD") == 1
+
+    try:
+        with pool.handout("FDTD") as s2:
+            raise ValueError("failed drawing")
+    except ValueError:
+        pass
+    assert s2 is s1 and s2.closed
+    assert pool.idle("FDTD") == 0
+
+
+if __name__ == "__main__":
+    test_pool_reuse()
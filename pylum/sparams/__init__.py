@@ -0,0 +1,6 @@
+""" S-parameter post processing in NumPy (port of `templates/Sparam_passivity.m`)
+
+- `passivity`: batched singular values over (nfreq, nports, nports), passivity
+  enforcement by clipping them, vector fitting of compact rational models and
+  parallel checks of whole `.dat` libraries
+"""
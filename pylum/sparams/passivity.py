@@ -0,0 +1,334 @@
+""" passivity check and enforcement of S-parameters, NumPy port of
+`templates/Sparam_passivity.m`
+
+A network is passive when no combination of inputs comes out with more power, so
+the largest singular value of S must be <= 1 at every frequency (the MATLAB loop
+`norm(Sparam) > 1`). `singular_values` computes them for the whole
+(nfreq, nports, nports) stack in one batched SVD, `clip` enforces passivity by
+clipping them to 1 and `vector_fit` fits a compact rational model with common
+poles (in place of the external VFdriver / RPdriver tools), clipping the model
+response and refitting the residues until it is passive on a dense grid.
+
+`check_library` checks (and optionally enforces) a whole library of Interconnect
+`.dat` files in parallel processes through `pylum.sweep`.
+
+.. code-block:: python
+
+    from pylum.loadsp import read_sparameters_dat
+    from pylum.sparams.passivity import check, check_library, clip, vector_fit
+
+    port_names, f, S = read_sparameters_dat("ring.dat")
+    print(check(S, f))
+    S_passive = clip(S)
+    model = vector_fit(f, S, npoles=20)
+    S_fit = model(f)
+
+    df = check_library("workspace/ring", enforce=True)
+"""
+import pathlib
+
+import numpy as np
+from scipy.constants import speed_of_light
+
+from pylum.loadsp import read_sparameters_dat
+from pylum.loadsp import write_sparameters_dat
+from pylum.sweep import sweep
+
+
+def singular_values(S):
+    """ returns (nfreq, nports) singular values of S (nfreq, nports, nports) """
+    return np.linalg.svd(np.asarray(S), compute_uv=False)
+
+
+def check(S, f=None, tol=1e-6):
+    """returns a passivity report of S (nfreq, nports, nports)
+
+    Args:
+        S: complex S[:, output, input]
+        f: frequency (Hz), adds the wavelengths of the violations
+        tol: violations are singular values > 1 + tol
+
+    Returns:
+        passive: True without violations
+        max_singular_value: largest singular value over frequency
+        violations: number of frequencies with violations
+        index: frequency indices of the violations
+        wavelength_nm: of the violations (with f)
+        worst_wavelength_nm: of the largest singular value (with f)
+    """
+    sigma = singular_values(S)[:, 0]
+    index = np.flatnonzero(sigma > 1 + tol)
+    d = dict(
+        passive=index.size == 0,
+        max_singular_value=float(sigma.max()),
+        violations=int(index.size),
+        index=index,
+    )
+    if f is not None:
+        wavelength_nm = speed_of_light / np.asarray(f) * 1e9
+        d["wavelength_nm"] = wavelength_nm[index]
+        d["worst_wavelength_nm"] = float(wavelength_nm[np.argmax(sigma)])
+    return d
+
+
+def clip(S, max_singular_value=1.0):
+    """returns S with its singular values clipped to max_singular_value
+
+    only the frequencies with violations are decomposed and rebuilt
+    (U min(sigma, max) V^H), the others are returned unchanged
+
+    Args:
+        S: complex (nfreq, nports, nports)
+        max_singular_value: 1 for lossless limit, < 1 leaves a margin
+    """
+    S = np.array(S, dtype=complex)
+    sigma = singular_values(S)[:, 0]
+    index = np.flatnonzero(sigma > max_singular_value)
+    if index.size:
+        U, sigma, Vh = np.linalg.svd(S[index])
+        sigma = np.minimum(sigma, max_singular_value)
+        S[index] = U @ (sigma[..., None] * Vh)
+    return S
+
+
+class RationalModel:
+    """rational model S(f) = sum_m residues_m / (s - poles_m) + d
+
+    with common poles for all the port pairs, s = 1j (f - f_center) / f_scale
+
+    Args:
+        poles: (npoles,) complex, normalized frequency units
+        residues: (npoles, nports, nports) complex
+        d: (nports, nports) complex constant term
+        f_center: (Hz)
+        f_scale: (Hz)
+    """
+
+    def __init__(self, poles, residues, d, f_center, f_scale):
+        self.poles = np.asarray(poles)
+        self.residues = np.asarray(residues)
+        self.d = np.asarray(d)
+        self.f_center = f_center
+        self.f_scale = f_scale
+
+    def s(self, f):
+        return 1j * (np.asarray(f, dtype=float) - self.f_center) / self.f_scale
+
+    def __call__(self, f):
+        """ returns S (nfreq, nports, nports) at frequencies f (Hz) """
+        basis = 1 / (self.s(f)[:, None] - self.poles)
+        return np.tensordot(basis, self.residues, axes=1) + self.d
+
+    def rms_error(self, f, S):
+        return float(np.sqrt(np.mean(np.abs(self(f) - S) ** 2)))
+
+
+def _initial_poles(npoles):
+    """ complex poles spread over the normalized band [-1, 1] with small damping """
+    beta = np.linspace(-1, 1, npoles)
+    return -2 / npoles + 1j * beta
+
+
+def _relocate(s, H, poles, stable=False):
+    """one Sanathanan-Koerner pole relocation of the traces H (nfreq, ntraces)
+
+    fast vector fitting: the QR of each trace eliminates its residues, leaving the
+    equations of the common weight function sigma(s) = 1 + sum c / (s - a)
+    """
+    npoles = poles.size
+    basis = 1 / (s[:, None] - poles)
+    A1 = np.column_stack([basis, np.ones_like(s)])
+    R22 = []
+    b = []
+    for h in H.T:
+        R = np.linalg.qr(np.column_stack([A1, -h[:, None] * basis, h]), mode="r")
+        R22.append(R[npoles + 1 : 2 * npoles + 1, npoles + 1 : -1])
+        b.append(R[npoles + 1 : 2 * npoles + 1, -1])
+    c = np.linalg.lstsq(np.vstack(R22), np.concatenate(b), rcond=None)[0]
+    poles = np.linalg.eigvals(np.diag(poles) - np.outer(np.ones(npoles), c))
+    if stable:
+        poles = np.where(poles.real > 0, -poles.conj(), poles)
+    return poles
+
+
+def _residues(s, H, poles):
+    """ returns least-squares residues (npoles, ntraces) and d (ntraces,) """
+    A = np.column_stack([1 / (s[:, None] - poles), np.ones_like(s)])
+    x = np.linalg.lstsq(A, H, rcond=None)[0]
+    return x[:-1], x[-1]
+
+
+def vector_fit(
+    f,
+    S,
+    npoles=20,
+    niter=10,
+    stable=False,
+    passive=True,
+    max_singular_value=1.0,
+    passivity_iterations=10,
+    oversampling=4,
+):
+    """returns a RationalModel of S(f) with npoles common poles
+
+    vector fitting (Gustavsen and Semlyen) relocates the poles niter times, then
+    with passive=True the model response on an `oversampling` times denser grid is
+    clipped (see clip) and the residues refitted until the model is passive
+
+    Args:
+        f: (nfreq,) frequency (Hz)
+        S: (nfreq, nports, nports) complex
+        npoles: model order (the MATLAB script sweeps 20 to 100)
+        niter: pole relocation iterations
+        stable: flips poles into the left half plane, the phase convention of
+            the solver decides which half is causal (the MATLAB script fits with
+            stable=0)
+        passive: enforces passivity of the model
+        max_singular_value: passivity limit
+        passivity_iterations: maximum clip and refit iterations
+        oversampling: dense grid points per frequency point
+    """
+    f = np.asarray(f, dtype=float)
+    S = np.asarray(S, dtype=complex)
+    nfreq, nports, _ = S.shape
+    f_center = (f.max() + f.min()) / 2
+    f_scale = (f.max() - f.min()) / 2
+    s = 1j * (f - f_center) / f_scale
+    H = S.reshape(nfreq, -1)
+
+    poles = _initial_poles(npoles)
+    for _ in range(niter):
+        poles = _relocate(s, H, poles, stable)
+    residues, d = _residues(s, H, poles)
+
+    def model(residues, d):
+        return RationalModel(
+            poles,
+            residues.reshape(npoles, nports, nports),
+            d.reshape(nports, nports),
+            f_center,
+            f_scale,
+        )
+
+    if passive:
+        dense = np.linspace(f.min(), f.max(), oversampling * nfreq)
+        s_dense = 1j * (dense - f_center) / f_scale
+        target = max_singular_value
+        for _ in range(passivity_iterations):
+            S_dense = model(residues, d)(dense)
+            if singular_values(S_dense)[:, 0].max() <= max_singular_value:
+                break
+            # clip slightly below the limit so the least-squares refit converges
+            target *= 1 - 1e-3
+            S_dense = clip(S_dense, target)
+            residues, d = _residues(s_dense, S_dense.reshape(dense.size, -1), poles)
+    return model(residues, d)
+
+
+def _check_file(filepath, tol=1e-6, enforce=False, suffix="_passive"):
+    """ checks one .dat file, with enforce writes the clipped S-parameters too """
+    port_names, f, S = read_sparameters_dat(filepath)
+    d = check(S, f, tol=tol)
+    d.pop("index")
+    d.pop("wavelength_nm")
+    if enforce and not d["passive"]:
+        filepath = pathlib.Path(filepath)
+        filepath_passive = filepath.with_name(filepath.stem + suffix + filepath.suffix)
+        write_sparameters_dat(filepath_passive, port_names, f, clip(S))
+        d["filepath_passive"] = str(filepath_passive)
+    return d
+
+
+def check_library(dirpath, pattern="*.dat", tol=1e-6, enforce=False, processes=None):
+    """returns a DataFrame with the passivity report of each .dat file
+
+    Args:
+        dirpath: directory or list of .dat files
+        pattern: glob pattern inside dirpath
+        tol: violations are singular values > 1 + tol
+        enforce: writes `{name}_passive.dat` with clipped singular values
+        processes: number of worker processes (None: CPU count, 0: this process)
+    """
+    if isinstance(dirpath, (str, pathlib.Path)):
+        filepaths = sorted(pathlib.Path(dirpath).glob(pattern))
+        filepaths = [p for p in filepaths if not p.stem.endswith("_passive")]
+    else:
+        filepaths = list(dirpath)
+    kwargs_list = [dict(filepath=str(p), tol=tol, enforce=enforce) for p in filepaths]
+    return sweep(
+        _check_file, kwargs_list=kwargs_list, processes=processes, progress=False
+    )
+
+
+def _random_passive(nfreq=101, nports=3, seed=0):
+    """ returns S with unitary matrices times a loss below 1 """
+    rng = np.random.default_rng(seed)
+    shape = (nfreq, nports, nports)
+    A = rng.normal(size=shape) + 1j * rng.normal(size=shape)
+    Q = np.linalg.qr(A)[0]
+    return Q * np.linspace(0.6, 0.95, nports)
+
+
+def _ring(f, loss=0.98):
+    """ returns 2 port all-pass ring S-parameters (passive for loss < 1) """
+    phase = 2 * np.pi * (f - f.mean()) / 1e12
+    t = 0.9
+    thru = (t - loss * np.exp(1j * phase)) / (1 - t * loss * np.exp(1j * phase))
+    S = np.zeros((f.size, 2, 2), dtype=complex)
+    S[:, 1, 0] = S[:, 0, 1] = thru
+    return S
+
+
+def test_check_clip():
+    f = np.linspace(185e12, 195e12, 101)
+    S = _random_passive()
+    assert check(S, f)["passive"]
+    S[10:20] *= 1.1
+    d = check(S, f)
+    assert not d["passive"]
+    assert d["violations"] == 10
+    assert list(d["index"]) == list(range(10, 20))
+    assert np.isclose(d["max_singular_value"], 0.95 * 1.1)
+
+    S_passive = clip(S)
+    assert check(S_passive)["passive"]
+    assert np.allclose(S_passive[:10], S[:10])
+    sigma = singular_values(S_passive)
+    assert np.isclose(sigma.max(), 1)
+    # only the singular values above 1 change
+    assert np.allclose(np.sort(sigma[15])[:-1], np.sort(singular_values(S)[15])[:-1])
+
+
+def test_vector_fit():
+    f = np.linspace(190e12, 196e12, 301)
+    S = _ring(f, loss=0.995)
+    model = vector_fit(f, S, npoles=10, passive=False)
+    assert model.rms_error(f, S) < 1e-4
+
+    poles = np.array([-0.05 + 0.3j, -0.02 - 0.5j, -0.1, -0.03 + 0.8j])
+    residues = np.random.default_rng(0).normal(size=(4, 2, 2)) * 0.05
+    S = RationalModel(poles, residues, 0.1 * np.eye(2), 193e12, 3e12)(f)
+    model = vector_fit(f, S, npoles=4, stable=True, passive=False)
+    assert np.allclose(np.sort_complex(model.poles), np.sort_complex(poles))
+    assert model.rms_error(f, S) < 1e-10
+
+    S_lossy = 1.01 * _ring(f, loss=0.999)
+    assert not check(S_lossy)["passive"]
+    model = vector_fit(f, S_lossy, npoles=10)
+    dense = np.linspace(f.min(), f.max(), 3001)
+    assert check(model(dense))["passive"]
+    assert model.rms_error(f, clip(S_lossy)) < 0.05
+
+
+def test_check_library(tmp_path):
+    f = np.linspace(185e12, 195e12, 51)
+    for i, scale in enumerate([1, 1.1, 1]):
+        S = _random_passive(51, seed=i) * scale
+        write_sparameters_dat(tmp_path / f"c{i}.dat", ["1", "2", "3"], f, S)
+    df = check_library(tmp_path, enforce=True, processes=2)
+    assert list(df["passive"]) == [True, False, True]
+    assert df["error"].isnull().all()
+    port_names, f2, S = read_sparameters_dat(df["filepath_passive"][1])
+    assert check(S, tol=1e-9)["passive"]
+    df = check_library(tmp_path, processes=0)
+    assert len(df) == 3
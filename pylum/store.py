@@ -0,0 +1,274 @@
+""" storage backends for the autoname cache
+
+- `FileStore`: one .h5 file per result (default)
+- `HDF5Store`: all results of a function as groups of one HDF5 file (or a few
+  shards), with chunked compressed datasets and the settings of each result in
+  the group attributes. Big sweeps leave a handful of files instead of thousands.
+
+Select the backend in config.yml with `cache_backend: files` or `cache_backend: hdf5`
+(`cache_shards` and `cache_compression` configure the HDF5 store).
+
+Writes take an exclusive lock and reads a shared lock on a `.lock` file next to
+the store, so one writer can append while other processes read.
+"""
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import pathlib
+import threading
+
+import h5py
+import numpy as np
+
+from pylum.cache import LazyGroup
+from pylum.cache import read_cache
+from pylum.cache import read_group
+from pylum.cache import read_index
+from pylum.cache import write_cache
+from pylum.cache import write_group
+from pylum.cache import write_index
+from pylum.config import CONFIG
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+_thread_lock = threading.RLock()
+tmp_suffix = ".tmp"
+
+
+@contextlib.contextmanager
+def lock(filepath, shared=False):
+    """ inter-process lock on filepath.lock (shared for readers) """
+    filepath = pathlib.Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        with _thread_lock:
+            yield
+        return
+
+    with open(filepath.with_suffix(filepath.suffix + ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_cache_filepath(function_name, key, dirpath=None):
+    """ returns the cache filepath for a function call key """
+    dirpath = pathlib.Path(dirpath or CONFIG["cache"])
+    return dirpath / function_name / key[:2] / f"{key}.h5"
+
+
+class FileStore:
+    """ one .h5 file per result under dirpath/function_name/ """
+
+    def __init__(self, dirpath=None):
+        self.dirpath = pathlib.Path(dirpath or CONFIG["cache"])
+
+    def filepath(self, function_name, key):
+        return get_cache_filepath(function_name, key, dirpath=self.dirpath)
+
+    def exists(self, function_name, key):
+        return self.filepath(function_name, key).exists()
+
+    def read(self, function_name, key):
+        return read_cache(self.filepath(function_name, key))
+
+    def read_lazy(self, function_name, key):
+        """ returns a mapping that reads items on access, use it as context manager """
+        return read_cache(self.filepath(function_name, key), lazy=True)
+
+    def write(self, function_name, key, d, name=None, settings=None):
+        filepath = self.filepath(function_name, key)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        write_cache(d, filepath)
+        dirpath = filepath.parent.parent
+        with lock(dirpath / "index.jsonl"):
+            write_index(dirpath, key, name=name, settings=settings)
+
+    def read_index(self, function_name):
+        """ returns dict of key to entry (name, settings) """
+        dirpath = self.dirpath / function_name
+        with lock(dirpath / "index.jsonl", shared=True):
+            return read_index(dirpath)
+
+
+class HDF5Store:
+    """results of each function as groups of dirpath/function_name.h5
+
+    Args:
+        dirpath: where to store the files
+        shards: splits each function into this many files
+        compression: dataset compression filter (gzip, lzf or None)
+    """
+
+    def __init__(self, dirpath=None, shards=1, compression="gzip"):
+        self.dirpath = pathlib.Path(dirpath or CONFIG["cache"])
+        self.shards = shards
+        self.compression = compression
+
+    def filepath(self, function_name, key):
+        if self.shards > 1:
+            shard = int(key[:8], 16) % self.shards
+            return self.dirpath / f"{function_name}_{shard}.h5"
+        return self.dirpath / f"{function_name}.h5"
+
+    def filepaths(self, function_name):
+        if self.shards > 1:
+            return [self.dirpath / f"{function_name}_{i}.h5" for i in range(self.shards)]
+        return [self.dirpath / f"{function_name}.h5"]
+
+    def exists(self, function_name, key):
+        filepath = self.filepath(function_name, key)
+        if not filepath.exists():
+            return False
+        with lock(filepath, shared=True), h5py.File(filepath, "r") as f:
+            return key in f
+
+    def read(self, function_name, key):
+        filepath = self.filepath(function_name, key)
+        with lock(filepath, shared=True), h5py.File(filepath, "r") as f:
+            return read_group(f[key])
+
+    @contextlib.contextmanager
+    def read_lazy(self, function_name, key):
+        """ context manager yielding a mapping that reads items on access """
+        filepath = self.filepath(function_name, key)
+        with lock(filepath, shared=True), h5py.File(filepath, "r") as f:
+            yield LazyGroup(f[key])
+
+    def write(self, function_name, key, d, name=None, settings=None):
+        filepath = self.filepath(function_name, key)
+        tmp = key + tmp_suffix
+        with lock(filepath), h5py.File(filepath, "a") as f:
+            if tmp in f:
+                del f[tmp]
+            group = f.create_group(tmp, track_order=True)
+            try:
+                write_group(group, d, compression=self.compression)
+            except Exception:
+                del f[tmp]
+                raise
+            group.attrs["name"] = name or ""
+            group.attrs["settings"] = json.dumps(settings or {}, default=str)
+            if key in f:
+                del f[key]
+            f.move(tmp, key)
+
+    def read_index(self, function_name):
+        """ returns dict of key to entry (name, settings) from group attributes """
+        index = {}
+        for filepath in self.filepaths(function_name):
+            if not filepath.exists():
+                continue
+            with lock(filepath, shared=True), h5py.File(filepath, "r") as f:
+                for key, group in f.items():
+                    if key.endswith(tmp_suffix):
+                        continue
+                    index[key] = dict(
+                        key=key,
+                        name=group.attrs.get("name", ""),
+                        settings=json.loads(group.attrs.get("settings", "{}")),
+                    )
+        return index
+
+
+backends = dict(files=FileStore, hdf5=HDF5Store)
+
+
+def get_store():
+    """ returns the store selected by CONFIG["cache_backend"] """
+    backend = CONFIG.get("cache_backend", "files")
+    if backend not in backends:
+        raise ValueError(f"cache_backend {backend} not in {list(backends.keys())}")
+    if backend == "hdf5":
+        return HDF5Store(
+            shards=CONFIG.get("cache_shards", 1),
+            compression=CONFIG.get("cache_compression", "gzip"),
+        )
+    return backends[backend]()
+
+
+def _key(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def test_hdf5_store(tmp_path):
+    store = HDF5Store(dirpath=tmp_path, shards=2)
+    for i in range(6):
+        key = _key(i)
+        d = dict(neff=np.linspace(2, 3, 100) + i, i=i)
+        store.write("waveguide", key, d, name=f"wg{i}", settings=dict(wg_width=i))
+
+    assert len(list(tmp_path.glob("*.h5"))) == 2
+    key = _key(3)
+    assert store.exists("waveguide", key)
+    assert not store.exists("waveguide", "f" * 64)
+    d = store.read("waveguide", key)
+    assert d["i"] == 3
+    assert np.allclose(d["neff"], np.linspace(2, 3, 100) + 3)
+    with store.read_lazy("waveguide", key) as lazy:
+        assert lazy["i"] == 3 and len(lazy) == 2
+
+    index = store.read_index("waveguide")
+    assert len(index) == 6
+    assert index[key]["settings"] == dict(wg_width=3)
+
+    store.write("waveguide", key, dict(i=30))
+    assert store.read("waveguide", key) == dict(i=30)
+
+
+def test_failed_write_leaves_no_entry(tmp_path):
+    for store in [FileStore(dirpath=tmp_path), HDF5Store(dirpath=tmp_path)]:
+        key = _key(0)
+        try:
+            store.write("f", key, dict(a=1, session=object()))
+        except TypeError:
+            pass
+        assert not store.exists("f", key)
+        assert store.read_index("f") == {}
+
+        store.write("f", key, dict(a=1))
+        try:
+            store.write("f", key, dict(a=2, session=object()))
+        except TypeError:
+            pass
+        assert store.read("f", key) == dict(a=1)
+    assert not list(tmp_path.glob("**/*.tmp"))
+
+
+def _write_index_entries(dirpath, start, n=10):
+    store = FileStore(dirpath=dirpath)
+    for i in range(start, start + n):
+        store.write("f", _key(i), dict(i=i), settings=dict(x="x" * 100000, i=i))
+
+
+def test_file_store_index(tmp_path):
+    with concurrent.futures.ProcessPoolExecutor(4) as executor:
+        list(executor.map(_write_index_entries, [tmp_path] * 4, range(0, 40, 10)))
+    store = FileStore(dirpath=tmp_path)
+    index = store.read_index("f")
+    assert sorted(e["settings"]["i"] for e in index.values()) == list(range(40))
+
+    # a writer that died mid-line
+    with open(tmp_path / "f" / "index.jsonl", "a") as f:
+        f.write('{"key": "torn", "na')
+    assert len(store.read_index("f")) == 40
+    store.write("f", _key(40), dict(i=40))
+    assert len(store.read_index("f")) == 41
+
+
+def test_hdf5_store_threads(tmp_path):
+    store = HDF5Store(dirpath=tmp_path)
+
+    def job(i):
+        key = _key(i)
+        store.write("f", key, dict(i=i))
+        return store.read("f", key)["i"]
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(job, range(8))) == list(range(8))
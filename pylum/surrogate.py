@@ -0,0 +1,333 @@
+""" surrogate models trained from the results already in the @autoname cache
+
+`Surrogate` reads the cache index of a function, takes the numeric settings that
+vary across cached calls as inputs and fits a Gaussian process (NumPy/SciPy) to
+one output. Queries return a prediction with its standard deviation, and run the
+real simulation (which is cached and added to the model) when the standard
+deviation is above `max_std`.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.surrogate import Surrogate
+    from pylum.waveguide_dispersion import waveguide_dispersion
+
+    s = Surrogate(waveguide_dispersion, output=lambda d: np.mean(d["ng"]))
+    mean, std = s(wg_width=475e-9, wg_height=212e-9)
+    mean, std = s(wg_width=475e-9, wg_height=212e-9, max_std=1e-3)  # simulates if unsure
+"""
+import numpy as np
+import scipy.linalg
+import scipy.optimize
+
+from pylum.store import get_store
+
+
+class GaussianProcess:
+    """Gaussian process regression with an anisotropic squared exponential kernel
+
+    inputs are scaled to [0, 1] and outputs to zero mean and unit variance, the
+    length scales and the noise maximize the log marginal likelihood (on at most
+    `max_points` random points, the final model uses all of them)
+
+    The model keeps the Cholesky factor of the kernel matrix (n x n, no inverse and
+    no n x n x d tensors), `update` extends it with new points in O(n^2) per point
+
+    Args:
+        noise: initial noise variance (relative to the output variance)
+        max_points: points used to fit the hyperparameters
+    """
+
+    def __init__(self, noise=1e-6, max_points=500):
+        self.noise = noise
+        self.max_points = max_points
+        self.length_scale = None
+
+    def _kernel(self, A, B, length_scale):
+        return np.exp(-0.5 * _sqdist(A / length_scale, B / length_scale))
+
+    def _nll(self, theta, X, y):
+        """ returns negative log marginal likelihood and its gradient """
+        length_scale, noise = np.exp(theta[:-1]), np.exp(theta[-1])
+        X = X / length_scale
+        K = np.exp(-0.5 * _sqdist(X, X))
+        K[np.diag_indices_from(K)] += noise
+        try:
+            L = np.linalg.cholesky(K)
+        except np.linalg.LinAlgError:
+            return 1e10, np.zeros_like(theta)
+        alpha = scipy.linalg.cho_solve((L, True), y)
+        nll = 0.5 * y @ alpha + np.sum(np.log(np.diag(L)))
+
+        # dK/dlog(length_scale_k) = K d2_k, dK/dlog(noise) = noise I
+        W = scipy.linalg.cho_solve((L, True), np.eye(len(X))) - np.outer(alpha, alpha)
+        K[np.diag_indices_from(K)] -= noise
+        WK = W * K
+        grad = [0.5 * np.sum(WK * (x[:, None] - x[None, :]) ** 2) for x in X.T]
+        grad = np.append(grad, 0.5 * noise * np.trace(W))
+        return nll, grad
+
+    def fit(self, X, y, optimize=True):
+        """fits the model to inputs X (n, d) and outputs y (n,)
+
+        Args:
+            X: inputs (n, d)
+            y: outputs (n,)
+            optimize: fits the hyperparameters, otherwise keeps the previous ones
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        y = np.asarray(y, dtype=float)
+        self.xmin = X.min(axis=0)
+        self.xspan = np.where(np.ptp(X, axis=0) > 0, np.ptp(X, axis=0), 1)
+        self.ymean = y.mean()
+        self.ystd = y.std() if y.std() > 0 else 1
+        self.X = (X - self.xmin) / self.xspan
+        self.y = (y - self.ymean) / self.ystd
+
+        if self.length_scale is None:
+            self.length_scale = np.full(X.shape[1], 0.3)
+            optimize = True
+        if optimize and len(X) > 1:
+            i = np.random.default_rng(0).permutation(len(X))[: self.max_points]
+            theta0 = np.log(np.append(self.length_scale, self.noise))
+            bounds = [(np.log(1e-2), np.log(1e1))] * X.shape[1]
+            bounds += [(np.log(1e-10), np.log(1e-1))]
+            result = scipy.optimize.minimize(
+                self._nll,
+                theta0,
+                args=(self.X[i], self.y[i]),
+                jac=True,
+                bounds=bounds,
+                method="L-BFGS-B",
+            )
+            self.length_scale = np.exp(result.x[:-1])
+            self.noise = np.exp(result.x[-1])
+
+        K = self._kernel(self.X, self.X, self.length_scale)
+        K[np.diag_indices_from(K)] += self.noise
+        self._L = np.linalg.cholesky(K)
+        self._alpha = scipy.linalg.cho_solve((self._L, True), self.y)
+        return self
+
+    def update(self, X, y):
+        """adds inputs X (m, d) and outputs y (m,) keeping the hyperparameters and
+        the input and output scaling of the last fit
+
+        extends the Cholesky factor by the new rows (O(n^2 m)) instead of
+        factorizing the whole kernel matrix again (O(n^3))
+        """
+        X = (np.atleast_2d(np.asarray(X, dtype=float)) - self.xmin) / self.xspan
+        y = (np.atleast_1d(np.asarray(y, dtype=float)) - self.ymean) / self.ystd
+        K12 = self._kernel(self.X, X, self.length_scale)
+        K22 = self._kernel(X, X, self.length_scale)
+        K22[np.diag_indices_from(K22)] += self.noise
+        L12 = scipy.linalg.solve_triangular(self._L, K12, lower=True)
+        L22 = np.linalg.cholesky(K22 - L12.T @ L12)
+
+        n, m = len(self.X), len(X)
+        L = np.zeros((n + m, n + m))
+        L[:n, :n] = self._L
+        L[n:, :n] = L12.T
+        L[n:, n:] = L22
+        self._L = L
+        self.X = np.vstack([self.X, X])
+        self.y = np.append(self.y, y)
+        self._alpha = scipy.linalg.cho_solve((self._L, True), self.y)
+        return self
+
+    def predict(self, X, return_std=True):
+        """ returns mean (and standard deviation) at inputs X (n, d) """
+        X = (np.atleast_2d(np.asarray(X, dtype=float)) - self.xmin) / self.xspan
+        k = self._kernel(X, self.X, self.length_scale)
+        mean = self.ymean + self.ystd * (k @ self._alpha)
+        if not return_std:
+            return mean
+        v = scipy.linalg.solve_triangular(self._L, k.T, lower=True)
+        var = np.maximum(1 + self.noise - np.sum(v ** 2, axis=0), 0)
+        return mean, self.ystd * np.sqrt(var)
+
+
+def _sqdist(A, B):
+    """ returns squared distances (n, m) between the rows of A (n, d) and B (m, d) """
+    d2 = np.sum(A ** 2, axis=1)[:, None] + np.sum(B ** 2, axis=1) - 2 * A @ B.T
+    return np.maximum(d2, 0)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _get_output(output, d):
+    """ returns the scalar output of a result dict, output is a key or callable(d) """
+    return float(output(d) if callable(output) else np.asarray(d[output]).squeeze())
+
+
+class Surrogate:
+    """interpolating model of one output of an @autoname function over its cache
+
+    Args:
+        function: @autoname function
+        output: result key (scalar) or function of the result dict returning a float
+        inputs: numeric settings used as inputs (defaults to the ones that vary)
+        fixed: settings that cached results must match (and passed to simulations)
+        max_std: default standard deviation above which queries run a simulation
+        store: cache store (defaults to pylum.store.get_store())
+    """
+
+    def __init__(
+        self, function, output, inputs=None, fixed=None, max_std=None, store=None
+    ):
+        self.function = function
+        self.output = output
+        self.fixed = dict(fixed or {})
+        self.max_std = max_std
+        self.store = store or get_store()
+        self.inputs = inputs
+        self.load()
+        self.fit()
+
+    def load(self):
+        """reads inputs and outputs of the cached results
+
+        only the items the output reads are loaded from each result
+        """
+        name = self.function.__name__
+        index = self.store.read_index(name)
+        entries = [
+            (key, entry["settings"])
+            for key, entry in index.items()
+            if all(entry["settings"].get(k) == v for k, v in self.fixed.items())
+        ]
+        if self.inputs is None:
+            numeric = [
+                k
+                for k in entries[0][1]
+                if all(_is_number(settings.get(k)) for _, settings in entries)
+            ] if entries else []
+            self.inputs = [
+                k for k in numeric if len({settings[k] for _, settings in entries}) > 1
+            ]
+        if not entries or not self.inputs:
+            raise ValueError(f"no cached {name} results varying {self.inputs}")
+
+        X, y = [], []
+        for key, settings in entries:
+            if not all(_is_number(settings.get(k)) for k in self.inputs):
+                continue
+            X.append([settings[k] for k in self.inputs])
+            with self.store.read_lazy(name, key) as d:
+                y.append(_get_output(self.output, d))
+        self.X = np.array(X, dtype=float)
+        self.y = np.array(y, dtype=float)
+        return self.X, self.y
+
+    def fit(self):
+        self.model = GaussianProcess().fit(self.X, self.y)
+        return self
+
+    def predict(self, **kwargs):
+        """returns (mean, std) arrays, kwargs are input values (broadcast)"""
+        missing = set(self.inputs) - set(kwargs.keys())
+        if missing:
+            raise ValueError(f"missing inputs {sorted(missing)}")
+        values = np.broadcast_arrays(*[np.asarray(kwargs[k], float) for k in self.inputs])
+        X = np.stack([v.ravel() for v in values], axis=-1)
+        mean, std = self.model.predict(X)
+        return mean.reshape(values[0].shape), std.reshape(values[0].shape)
+
+    def add(self, x, y, refit=False):
+        """adds points (n, d) and outputs (n,) to the model
+
+        updates the model incrementally, refit=True fits it again (hyperparameters
+        and scaling included)
+        """
+        self.X = np.vstack([self.X, np.atleast_2d(x)])
+        self.y = np.append(self.y, y)
+        if refit:
+            self.model.fit(self.X, self.y)
+        else:
+            self.model.update(x, y)
+        return self
+
+    def simulate(self, **kwargs):
+        """ runs (or loads) the function at one point and adds it to the model """
+        d = self.function(**self.fixed, **kwargs)
+        value = _get_output(self.output, d)
+        self.add([kwargs[k] for k in self.inputs], value)
+        return value
+
+    def __call__(self, max_std=None, **kwargs):
+        """returns (mean, std) at one point
+
+        runs the simulation when std > max_std (returns its value with std=0)
+        """
+        max_std = self.max_std if max_std is None else max_std
+        mean, std = self.predict(**kwargs)
+        mean, std = float(mean), float(std)
+        if max_std is not None and std > max_std:
+            return self.simulate(**kwargs), 0.0
+        return mean, std
+
+
+def test_gaussian_process():
+    x = np.linspace(0, 1, 15)[:, None]
+    y = np.sin(6 * x[:, 0])
+    gp = GaussianProcess().fit(x, y)
+    xt = np.linspace(0.05, 0.95, 7)[:, None]
+    mean, std = gp.predict(xt)
+    assert np.allclose(mean, np.sin(6 * xt[:, 0]), atol=1e-2)
+    assert np.all(std < 1e-2)
+    _, std_far = gp.predict([[3.0]])
+    assert std_far[0] > 0.5
+
+    # the updated Cholesky factor is the one of the whole kernel matrix
+    gp.update([[1.5], [2.0]], np.sin([9.0, 12.0]))
+    K = gp._kernel(gp.X, gp.X, gp.length_scale) + gp.noise * np.eye(17)
+    assert np.allclose(gp._L, np.linalg.cholesky(K))
+    mean, std = gp.predict([[1.5], [2.0]])
+    assert np.allclose(mean, np.sin([9.0, 12.0]), atol=1e-2)
+    assert np.all(std < 1e-2)
+
+
+def test_nll_gradient():
+    rng = np.random.default_rng(1)
+    X, y = rng.random((20, 3)), rng.standard_normal(20)
+    theta = np.log([0.3, 0.5, 0.8, 1e-3])
+    _, grad = GaussianProcess()._nll(theta, X, y)
+    numerical = scipy.optimize.approx_fprime(
+        theta, lambda t: GaussianProcess()._nll(t, X, y)[0], 1e-6
+    )
+    assert np.allclose(grad, numerical, rtol=1e-4, atol=1e-4)
+
+
+def test_surrogate(tmp_path, monkeypatch):
+    from pylum.autoname import autoname
+    from pylum.config import CONFIG
+    from pylum.store import FileStore
+
+    monkeypatch.setitem(CONFIG, "cache", tmp_path)
+    monkeypatch.setitem(CONFIG, "cache_backend", "files")
+    calls = []
+
+    @autoname
+    def _efficiency(period=0.66e-6, ff=0.5, material_wg="si"):
+        calls.append((period, ff))
+        return dict(T=np.exp(-((period - 0.65e-6) / 50e-9) ** 2 - ((ff - 0.5) / 0.1) ** 2))
+
+    for period in np.linspace(0.6e-6, 0.7e-6, 6):
+        for ff in np.linspace(0.3, 0.7, 5):
+            _efficiency(period=float(period), ff=float(ff))
+    _efficiency(period=0.65e-6, ff=0.5, material_wg="sin")
+    n = len(calls)
+
+    s = Surrogate(_efficiency, "T", fixed=dict(material_wg="si"), store=FileStore())
+    assert s.inputs == ["period", "ff"]
+    assert len(s.y) == 30
+    mean, std = s(period=0.655e-6, ff=0.52)
+    exact = np.exp(-((0.005e-6) / 50e-9) ** 2 - (0.02 / 0.1) ** 2)
+    assert abs(mean - exact) < 3 * std + 0.02
+    assert len(calls) == n
+
+    mean, std = s(period=0.9e-6, ff=0.52, max_std=1e-3)
+    assert std == 0 and len(calls) == n + 1
+    assert len(s.y) == 31
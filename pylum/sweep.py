@@ -0,0 +1,199 @@
+""" parallel parameter sweeps of pylum functions
+
+Points already in the @autoname cache are loaded, the rest are dispatched
+across a process pool where each worker keeps its own warm solver session.
+Results stream back as jobs finish. Failed points are reported in the `error`
+column and are not cached, so running the same sweep again resumes it.
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.sweep import sweep
+    from pylum.waveguide_dispersion import waveguide_dispersion
+
+    df = sweep(
+        waveguide_dispersion,
+        grid=dict(wg_width=np.linspace(440e-9, 500e-9, 4), wg_height=[210e-9, 220e-9]),
+        solver="MODE",
+        processes=4,
+    )
+"""
+import concurrent.futures
+import inspect
+import itertools
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from pylum import sessions
+
+_worker = {}
+
+
+def grid_to_kwargs_list(grid):
+    """ returns a list of kwargs for the cartesian product of a dict of values """
+    keys = list(grid.keys())
+    values = [[_to_python(v) for v in np.atleast_1d(grid[key])] for key in keys]
+    return [dict(zip(keys, point)) for point in itertools.product(*values)]
+
+
+def _to_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _init_worker(solver=None, lumapi=None):
+    """ sets up the session pool of a worker process """
+    if lumapi:
+        import importlib
+
+        lumapi = importlib.import_module(lumapi)
+    sessions.set_pool(sessions.SessionPool(size=1, lumapi=lumapi))
+    _worker["solver"] = solver
+
+
+def _run_job(function, kwargs, solver=None):
+    """ returns (result, error) for one point, results without sessions """
+    try:
+        if solver:
+            with sessions.session(solver) as s:
+                result = function(session=s, **kwargs)
+        else:
+            result = function(**kwargs)
+        result = {k: v for k, v in result.items() if k not in ["session", "settings"]}
+        return result, None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _worker_job(function, kwargs):
+    return _run_job(function, kwargs, solver=_worker.get("solver"))
+
+
+def iter_sweep(
+    function,
+    grid=None,
+    kwargs_list=None,
+    processes=None,
+    solver=None,
+    lumapi=None,
+    progress=True,
+):
+    """ yields (index, kwargs, result, error) as jobs finish
+
+    same arguments as `sweep`
+    """
+    if kwargs_list is None:
+        kwargs_list = grid_to_kwargs_list(grid or {})
+    kwargs_list = [dict(kwargs) for kwargs in kwargs_list]
+    n = len(kwargs_list)
+
+    if solver and "session" not in inspect.signature(function).parameters:
+        raise ValueError(f"{function.__name__} does not accept a session")
+
+    is_cached = getattr(function, "is_cached", None)
+    cached = [i for i, k in enumerate(kwargs_list) if is_cached and is_cached(**k)]
+    pending = sorted(set(range(n)) - set(cached))
+    done = 0
+
+    def _report(i, error):
+        if progress:
+            status = "failed" if error else "done"
+            print(f"[{done}/{n}] {function.__name__} {kwargs_list[i]} {status}")
+
+    for i in cached:
+        result, error = _run_job(function, kwargs_list[i])
+        done += 1
+        _report(i, error)
+        yield i, kwargs_list[i], result, error
+
+    if processes == 0:
+        for i in pending:
+            result, error = _run_job(function, kwargs_list[i], solver=solver)
+            done += 1
+            _report(i, error)
+            yield i, kwargs_list[i], result, error
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(solver, lumapi)
+    ) as executor:
+        futures = {
+            executor.submit(_worker_job, function, kwargs_list[i]): i for i in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                result, error = future.result()
+            except Exception:
+                result, error = None, traceback.format_exc()
+            done += 1
+            _report(i, error)
+            yield i, kwargs_list[i], result, error
+
+
+def sweep(
+    function,
+    grid=None,
+    kwargs_list=None,
+    processes=None,
+    solver=None,
+    lumapi=None,
+    progress=True,
+):
+    """ runs a function over a parameter grid, returns a DataFrame
+
+    Args:
+        function: pylum function (cached points are skipped for @autoname functions)
+        grid: dict of name: values, sweeps the cartesian product
+        kwargs_list: list of kwargs dicts (instead of grid)
+        processes: number of worker processes (None: CPU count, 0: this process)
+        solver: FDTD or MODE session passed to each job as `session`, None for no session
+        lumapi: module name for worker sessions (for example pylum.fake_lumapi)
+        progress: prints progress
+
+    Returns:
+        DataFrame with one row per point in input order: kwargs, results and `error`
+    """
+    rows = {}
+    for i, kwargs, result, error in iter_sweep(
+        function,
+        grid=grid,
+        kwargs_list=kwargs_list,
+        processes=processes,
+        solver=solver,
+        lumapi=lumapi,
+        progress=progress,
+    ):
+        row = dict(kwargs)
+        row.update(result or {})
+        row["error"] = error
+        rows[i] = row
+
+    return pd.DataFrame([rows[i] for i in sorted(rows)])
+
+
+def _square(x=1, fail=False, session=None):
+    if fail:
+        raise ValueError("failed on purpose")
+    return dict(y=x ** 2, has_session=session is not None)
+
+
+def test_sweep():
+    df = sweep(
+        _square,
+        grid=dict(x=np.arange(3), fail=[False, True]),
+        processes=2,
+        solver="FDTD",
+        lumapi="pylum.fake_lumapi",
+        progress=False,
+    )
+    assert len(df) == 6
+    ok = df[df["error"].isnull()]
+    assert list(ok["y"]) == [0, 1, 4]
+    assert all(ok["has_session"])
+    assert df["error"].notnull().sum() == 3
+
+
+if __name__ == "__main__":
+    print(sweep(_square, grid=dict(x=np.arange(5)), processes=0))
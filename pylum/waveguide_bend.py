@@ -2,16 +2,88 @@
 - draw waveguide bend
 - calculate bend loss
 - plot bend loss vs radius
+
+the straight reference mode and each bend radius are separate @autoname results
 """
+import traceback
+
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 
+from pylum import sessions
 from pylum.autoname import autoname
+from pylum.modes import get_mode
+from pylum.modes import overlap
+from pylum.sweep import sweep
 from pylum.waveguide import waveguide
 
 
 @autoname
-def waveguide_bend(radius=np.array([3, 5, 10]) * 1e-6, session=None, **kwargs):
+def waveguide_bend_reference(session=None, **kwargs):
+    """Computes the straight waveguide mode that all bend radius jobs overlap with.
+
+    Args:
+        session: None
+        kwargs: waveguide settings (see pylum.waveguide.waveguide)
+
+    Returns:
+        neff: straight waveguide effective index
+        loss_dB_m: propagation loss
+        y, z, Ex, Ey, Ez, Hx, Hy, Hz: mode fields (see pylum.modes)
+    """
+    with sessions.session("MODE", existing=session) as s:
+        waveguide(session=s, **kwargs)
+        s.setanalysis("bent waveguide", 0)
+        if s.findmodes() == 0:
+            raise ValueError(f"no straight waveguide mode found for {kwargs}")
+        return get_mode(s)
+
+
+@autoname
+def waveguide_bend_radius(radius=5e-6, session=None, **kwargs):
+    """Computes the bend mode for one radius and its coupling to the straight mode.
+
+    The straight mode comes from the waveguide_bend_reference cache, so each radius
+    is an independent job (and cache entry) that can run in any session.
+
+    Args:
+        radius: waveguide bend radius (m)
+        session: None
+        kwargs: waveguide settings (see pylum.waveguide.waveguide)
+
+    Returns:
+        neff: bend effective index
+        loss_dB_m: bend propagation loss
+        power_coupling: from the straight into the bent mode
+        loss_mode: mode missmatch loss per 90 degree bend (2 transitions)
+        loss_radiation: bend mode loss over the 90 degree arc (loss_dB_m 2 pi r / 4)
+        loss_propagation: quarter turn propagation loss (assuming 2dB/cm)
+    """
+    with sessions.session("MODE", existing=session) as s:
+        reference = waveguide_bend_reference(session=s, **kwargs)
+        waveguide(session=s, **kwargs)
+        s.setanalysis("bent waveguide", 1)
+        s.setanalysis("bend radius", radius)
+        if s.findmodes() == 0:
+            raise ValueError(f"no bend mode found for radius={radius}")
+        mode = get_mode(s)
+
+    power_coupling = overlap(reference, mode)
+    length = 2 * np.pi * radius / 4
+    return dict(
+        neff=float(abs(mode["neff"])),
+        loss_dB_m=mode["loss_dB_m"],
+        power_coupling=power_coupling,
+        loss_mode=-10 * np.log10(power_coupling ** 2),
+        loss_radiation=mode["loss_dB_m"] * length,
+        loss_propagation=2 * 100 * length,
+    )
+
+
+def waveguide_bend(
+    radius=np.array([3, 5, 10]) * 1e-6, session=None, processes=None, **kwargs
+):
     """Computes bend loss for waveguide bend radius.
 
     Bend losses are caused by:
@@ -19,9 +91,14 @@ def waveguide_bend(radius=np.array([3, 5, 10]) * 1e-6, session=None, **kwargs):
     - propagation loss
     - 2 mode missmatchs from the radial to straight and back to radial
 
+    Each radius is a cached waveguide_bend_radius job sharing one cached
+    waveguide_bend_reference straight mode, so adding a radius only runs that
+    radius, and the jobs run in parallel MODE sessions (see pylum.sweep).
+
     Args:
         radius: waveguide bend radius (m)
-        session: None
+        session: runs all the radius in this session (no parallel sessions)
+        processes: number of parallel MODE sessions (see pylum.sweep)
         wg_width: 500e-9
         wg_height: 220e-9
         slab_height: 0
@@ -39,59 +116,44 @@ def waveguide_bend(radius=np.array([3, 5, 10]) * 1e-6, session=None, **kwargs):
         modes: 4
 
     Returns:
-        session: lumapi.MODE session
         neff: bend effective index iterable (includes zero)
-        radius_all: bend radius iterable (includes zero)
         radius: bend radius (m) iterable
-        loss: mode missmatch loss per bend
-        loss_dB_m: propagation loss
-        loss_per_bend: total propagation loss
-
+        power_coupling: from the straight into the bent mode
+        loss_mode: mode missmatch loss per bend
+        loss_propagation: quarter turn propagation loss
+        loss_radiation: radiation loss per bend
+        error: traceback of each radius that failed (nan results), None if done
     """
-    s = waveguide(session=session, **kwargs)
-    if 0 not in radius:
-        radius = list(radius)
-        radius.insert(0, 0)
-
-    neff = np.zeros_like(radius)
-    loss_dB_m = np.zeros_like(radius)
-    loss_per_bend = np.zeros_like(radius)
-    power_coupling = np.zeros_like(radius)
-
-    for i, r in enumerate(radius):
-        if r > 0:
-            s.setanalysis("bent waveguide", 1)
-            s.setanalysis("bend radius", r)
-        else:
-            s.setanalysis("bent waveguide", 0)
-        nn = s.findmodes()
-        if nn > 0:
-            neff[i] = abs(s.getdata("FDE::data::mode1", "neff").squeeze())
-            loss_dB_m[i] = s.getdata("FDE::data::mode1", "loss")
-            loss_per_bend[i] = loss_dB_m[i] * 2 * np.pi * r / 4
-            s.copydcard("mode1", f"radius{r}")
-
-            # Perform mode-overlap calculations between the straight and bent waveguides
-            if r > 0:
-                out = s.overlap("::radius0", f"::radius{r}").squeeze()
-                power_coupling[i] = out[1]  # power coupling
-
-    loss_mode = -10 * np.log10(
-        power_coupling[1:] ** 2
-    )  # 2X couplings per 90 degree bend vs radius (^2 for two)
-    loss_radiation = loss_per_bend[1:] - loss_per_bend[0]
-    loss_propagation = (
-        2 * 100 * 2 * np.pi * np.array(radius[1:]) / 4
-    )  # quarter turn propagation (assuming 2dB/cm)
+    radius = [float(r) for r in radius if r > 0]
+    # only runs (and opens a MODE session) when the straight mode is not cached
+    reference = waveguide_bend_reference(session=session, **kwargs)
 
-    return dict(
-        session=s,
-        neff=neff,
-        radius=radius[1:],
-        loss_mode=loss_mode,
-        loss_propagation=loss_propagation,
-        loss_radiation=loss_radiation,
-    )
+    kwargs_list = [dict(kwargs, radius=r) for r in radius]
+    if session is not None:
+        rows = []
+        for k in kwargs_list:
+            try:
+                rows.append(dict(waveguide_bend_radius(session=session, **k), error=None))
+            except Exception:
+                rows.append(dict(error=traceback.format_exc()))
+        df = pd.DataFrame(rows)
+    else:
+        df = sweep(
+            waveguide_bend_radius,
+            kwargs_list=kwargs_list,
+            solver="MODE",
+            processes=processes,
+            progress=False,
+        )
+
+    keys = ["neff", "power_coupling", "loss_mode", "loss_propagation", "loss_radiation"]
+    d = {
+        key: np.array(df[key] if key in df else np.full(len(df), np.nan), dtype=float)
+        for key in keys
+    }
+    d["neff"] = np.insert(d["neff"], 0, abs(reference["neff"]))
+    error = [None if pd.isnull(e) else e for e in df["error"]]
+    return dict(d, radius=radius, error=error)
 
 
 def plot_waveguide_bend_loss(d):
@@ -117,10 +179,86 @@ def plot_waveguide_bend_loss(d):
     return f, ax
 
 
+def _fake_mode_session():
+    """ fake MODE session with Gaussian modes shifted outwards in bends """
+    from pylum import fake_lumapi
+
+    state = dict(waveguide=0, radius=0, findmodes=0)
+    y = np.linspace(-2e-6, 2e-6, 81)
+    z = np.linspace(-1e-6, 1.2e-6, 45)
+
+    def setanalysis(key, value):
+        state[key.split()[-1]] = value
+
+    def findmodes():
+        state["findmodes"] += 1
+        return 1
+
+    def getdata(mode, key):
+        r = state["radius"] if state["waveguide"] else np.inf
+        shift = 0.2e-6 * 1e-6 / r
+        Ey = np.exp(-(((y[:, None] - shift) / 0.4e-6) ** 2) - ((z - 0.1e-6) / 0.2e-6) ** 2)
+        data = dict(
+            neff=2.4 + 0.1e-6 / r,
+            loss=100 + 1e4 * np.exp(-r / 1e-6),
+            x=0,
+            y=y,
+            z=z,
+            Ex=0 * Ey,
+            Ey=Ey,
+            Ez=0 * Ey,
+            Hx=0 * Ey,
+            Hy=0 * Ey,
+            Hz=2.4 * Ey,
+        )
+        return data[key]
+
+    s = fake_lumapi.MODE(
+        returns=dict(setanalysis=setanalysis, findmodes=findmodes, getdata=getdata)
+    )
+    return s, state
+
+
+def test_waveguide_bend(tmp_path, monkeypatch):
+    from pylum.config import CONFIG
+
+    monkeypatch.setitem(CONFIG, "cache", tmp_path)
+    s, state = _fake_mode_session()
+
+    d = waveguide_bend(radius=[3e-6, 10e-6], session=s)
+    assert state["findmodes"] == 3
+    assert d["power_coupling"][0] < d["power_coupling"][1] < 1
+    assert d["error"] == [None, None]
+    assert len(d["neff"]) == 3
+
+    d = waveguide_bend(radius=[3e-6, 5e-6, 10e-6], session=s)
+    assert state["findmodes"] == 4
+    assert np.all(np.diff(d["loss_mode"]) < 0)
+
+    pool = sessions.SessionPool(size=1)
+    monkeypatch.setattr(sessions, "_pool", pool)
+    acquired = []
+    monkeypatch.setattr(pool, "acquire", lambda solver: acquired.append(solver) or s)
+    monkeypatch.setattr(pool, "release", lambda s, crashed=False: None)
+    d = waveguide_bend(radius=[3e-6, 4e-6, 10e-6], processes=0)
+    assert state["findmodes"] == 5
+    assert np.all(np.isfinite(d["loss_mode"]))
+    assert np.all(np.diff(d["loss_radiation"]) < 0)
+    assert d["error"] == [None, None, None]
+    radius = np.array([3e-6, 4e-6, 10e-6])
+    loss_dB_m = 100 + 1e4 * np.exp(-radius / 1e-6)  # the fake session bend loss
+    assert np.allclose(d["loss_radiation"], loss_dB_m * 2 * np.pi * radius / 4)
+
+    # everything cached: no MODE session is opened
+    n = len(acquired)
+    waveguide_bend(radius=[3e-6, 10e-6], processes=0)
+    assert len(acquired) == n
+
+
 if __name__ == "__main__":
     # import lumapi
     # s = lumapi.MODE()
 
-    d = waveguide_bend(cache=False)
+    d = waveguide_bend()
     plot_waveguide_bend_loss(d)
     plt.show()
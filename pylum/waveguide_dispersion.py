@@ -5,10 +5,19 @@ import numpy as np
 import pandas as pd
 from scipy.constants import speed_of_light as c
 
+from pylum import sessions
+from pylum.analytic.eim import eim_dispersion
 from pylum.autoname import autoname
+from pylum.autoname import get_cache_key
+from pylum.config import CONFIG
+from pylum.modes import export_modes
+from pylum.sweep import sweep
 from pylum.waveguide import waveguide
 
 
+engines = ["fde", "eim"]
+
+
 @autoname
 def waveguide_dispersion(
     wavelength=1.55e-6,
@@ -16,6 +25,8 @@ def waveguide_dispersion(
     nmodes=5,
     wavelength_min=1.5e-6,
     session=None,
+    engine="fde",
+    fields=False,
     **kwargs
 ):
     """Computes effective and group index over wavelength.
@@ -26,6 +37,9 @@ def waveguide_dispersion(
         nmodes: number of modes
         wavelength_min: for sweeping wavelength
         session: lumapi.MODE Session (for debugging)
+        engine: "fde" (MODE) or "eim" (effective index method, no lumapi)
+        fields: writes mode `mode_number` at `wavelength` to a modes file (see pylum.modes)
+            named after the cache key
         wg_width: 500e-9
         wg_height: 220e-9
         slab_height: 0
@@ -45,44 +59,82 @@ def waveguide_dispersion(
         wavelengths: for detailed dispersion calculation
         neff: effective index iterable (includes zero)
         ng: group index
+        fields: modes file with mode{mode_number} (only with fields=True)
 
     """
-    s = waveguide(session=session, wavelength=wavelength, **kwargs)
-
-    s.run()
-    s.setanalysis("wavelength", wavelength)
-    s.findmodes()
-    s.selectmode(mode_number)
-
-    s.setanalysis("track selected mode", mode_number)
-    s.setanalysis("number of test modes", nmodes)
-    s.setanalysis("detailed dispersion calculation", 0)
-
-    # This feature is useful for higher-order dispersion.
-    s.setanalysis("stop wavelength", wavelength_min)
-    s.frequencysweep()
-
-    # perform sweep of wavelength and plot
-    f = s.getdata("frequencysweep", "f")
-    neff = s.getdata("frequencysweep", "neff")
-    ng = c / s.getdata("frequencysweep", "vg")
-    # f_vg = s.getdata("frequencysweep", "f_vg")
+    if engine not in engines:
+        raise ValueError(f"{engine} not in {engines}")
+    if fields and engine != "fde":
+        raise ValueError(f"fields=True needs engine='fde', got {engine}")
+    if engine == "eim":
+        return eim_dispersion(
+            wavelength=wavelength,
+            wavelength_min=wavelength_min,
+            mode_number=mode_number,
+            **kwargs,
+        )
+
+    with sessions.session("MODE", existing=session) as s:
+        waveguide(session=s, wavelength=wavelength, **kwargs)
+        s.run()
+        filepath = None
+        if fields:
+            key = get_cache_key(
+                waveguide_dispersion.__wrapped__,
+                wavelength=wavelength,
+                mode_number=mode_number,
+                nmodes=nmodes,
+                wavelength_min=wavelength_min,
+                engine=engine,
+                fields=fields,
+                **kwargs,
+            )
+            name = f"waveguide_dispersion_{key}"
+            filepath = export_modes(s, name, wavelength, modes=[mode_number])
+        s.setanalysis("wavelength", wavelength)
+        s.findmodes()
+        s.selectmode(mode_number)
+
+        s.setanalysis("track selected mode", mode_number)
+        s.setanalysis("number of test modes", nmodes)
+        s.setanalysis("detailed dispersion calculation", 0)
+
+        # This feature is useful for higher-order dispersion.
+        s.setanalysis("stop wavelength", wavelength_min)
+        s.frequencysweep()
+
+        # perform sweep of wavelength and plot
+        f = s.getdata("frequencysweep", "f")
+        neff = s.getdata("frequencysweep", "neff")
+        ng = c / s.getdata("frequencysweep", "vg")
+        # f_vg = s.getdata("frequencysweep", "f_vg")
 
     wavelengths = c / f
     wavelengths = wavelengths.flatten()
     neff = abs(neff.flatten())
     ng = abs(ng.flatten())
-    return dict(wavelengths=wavelengths, neff=neff, ng=ng)
+    d = dict(wavelengths=wavelengths, neff=neff, ng=ng)
+    if filepath:
+        d["fields"] = str(filepath)
+    return d
 
 
 def get_neff_ng(**kwargs):
-    """returns the average group index for a particular waveguide"""
+    """returns the average group index for a particular waveguide
+
+    use engine="eim" for a quick estimate without MODE
+    """
     d = waveguide_dispersion(**kwargs)
     return np.mean(d["neff"]), np.mean(d["ng"])
 
 
-def wim_paper():
-    """reproduce Yufei and Wim paper."""
+def wim_paper(processes=None, engine="fde"):
+    """reproduce Yufei and Wim paper.
+
+    Args:
+        processes: number of parallel MODE sessions (see pylum.sweep)
+        engine: "fde" (MODE) or "eim" (milliseconds, to pick points worth an FDE run)
+    """
     w0 = 470e-9
     h0 = 215e-9
     dwmax = 30e-9
@@ -93,23 +145,19 @@ def wim_paper():
     print(dw * 1e9, dh * 1e9)
     print((dw + w0) * 1e9, (dh + h0) * 1e9)
 
-    ngs = []
-    neffs = []
-    dws = []
-    dhs = []
-
-    for dwi in dw:
-        for dhi in dh:
-            # neff = np.random.rand()
-            # ng = np.random.rand()
-            neff, ng = get_neff_ng(wg_width=w0 + dwi, wg_height=h0 + dhi)
-
-            neffs.append(neff)
-            ngs.append(ng)
-            dws.append(dwi)
-            dhs.append(dhi)
-
-    df = pd.DataFrame(dict(dw=dws, dh=dhs, neff=neffs, ng=ngs))
+    df = sweep(
+        waveguide_dispersion,
+        grid=dict(wg_width=w0 + dw, wg_height=h0 + dh, engine=[engine]),
+        solver="MODE" if engine == "fde" else None,
+        processes=processes if engine == "fde" else 0,
+    )
+    df = df[df["error"].isnull()]
+    neffs = [np.mean(neff) for neff in df["neff"]]
+    ngs = [np.mean(ng) for ng in df["ng"]]
+
+    df = pd.DataFrame(
+        dict(dw=df["wg_width"] - w0, dh=df["wg_height"] - h0, neff=neffs, ng=ngs)
+    )
     df.to_csv("dw_dw.csv")
     plt.plot(neffs, ngs, "o")
     plt.xlabel("neff")
@@ -133,6 +181,13 @@ def plot_waveguide_dispersion(d):
     plt.ylabel("ng)")
 
 
+def test_get_neff_ng_eim(tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIG, "cache", tmp_path)
+    neff, ng = get_neff_ng(wg_width=500e-9, engine="eim")
+    assert 2.4 < neff < 2.6
+    assert 4 < ng < 4.2
+
+
 if __name__ == "__main__":
     neffs, ngs = wim_paper()
     plt.show()
@@ -0,0 +1,235 @@
+""" waveguide modes over many wavelengths with one LSF loop per cross section
+
+`waveguide_dispersion` runs one `frequencysweep` and several `getdata` round-trips,
+and a Python loop over wavelength costs a `setanalysis`, a `findmodes` and two
+`getdata` calls per wavelength and mode. `waveguide_modes` sends the whole loop
+as one LSF script (`modes_script`) that stacks neff and ng of every wavelength and
+mode into a single matrix, fetched with one `getv`. Drawing the cross section still
+takes about 60 lumapi calls, so a cross section costs 64 calls instead of
+`2 + 2 * nmodes` per wavelength (see benchmarks/waveguide_modes.py).
+
+ng is the FDE group index, which MODE only computes with
+`setanalysis("calculate group index", 1)`; both paths enable it.
+
+Sweep cross sections with `pylum.sweep`, each cross section is one cached job:
+
+.. code-block:: python
+
+    import numpy as np
+    from pylum.sweep import sweep
+    from pylum.waveguide_modes import waveguide_modes
+
+    df = sweep(
+        waveguide_modes,
+        grid=dict(wg_width=np.linspace(400e-9, 600e-9, 21), npoints=[101]),
+        solver="MODE",
+        processes=4,
+    )
+"""
+import numpy as np
+
+from pylum import sessions
+from pylum.autoname import autoname
+from pylum.autoname import get_cache_key
+from pylum.config import CONFIG
+from pylum.modes import export_modes
+from pylum.waveguide import waveguide
+
+result_name = "pylum_modes"
+
+
+def _matrix(values):
+    return "[" + ", ".join(repr(float(v)) for v in values) + "]"
+
+
+def modes_script(wavelengths, nmodes=2, name=result_name):
+    """returns an LSF loop that solves all wavelengths and stores one matrix
+
+    the matrix `name` has one row per wavelength and the columns
+    neff of modes 1..nmodes followed by ng of modes 1..nmodes, 0 for missing modes
+
+    Args:
+        wavelengths: list of wavelengths (m)
+        nmodes: number of modes stored per wavelength
+        name: LSF variable with the results
+    """
+    return f"""wavelengths = {_matrix(wavelengths)};
+nmodes = {int(nmodes)};
+setanalysis("calculate group index", 1);
+{name} = matrix(length(wavelengths), 2 * nmodes);
+for (i = 1:length(wavelengths)) {{
+    setanalysis("wavelength", wavelengths(i));
+    n = findmodes;
+    for (m = 1:min(n, nmodes)) {{
+        mode = "FDE::data::mode" + num2str(m);
+        {name}(i, m) = abs(getdata(mode, "neff"));
+        {name}(i, nmodes + m) = abs(getdata(mode, "ng"));
+    }}
+}}
+"""
+
+
+def _solve(s, wavelengths, nmodes):
+    """ per-call path: one setanalysis, findmodes and 2 getdata per wavelength and mode """
+    result = np.zeros((len(wavelengths), 2 * nmodes))
+    s.setanalysis("calculate group index", 1)
+    for i, wavelength in enumerate(wavelengths):
+        s.setanalysis("wavelength", wavelength)
+        n = s.findmodes()
+        for m in range(1, min(int(n), nmodes) + 1):
+            mode = f"FDE::data::mode{m}"
+            result[i, m - 1] = abs(np.asarray(s.getdata(mode, "neff")).squeeze())
+            result[i, nmodes + m - 1] = abs(np.asarray(s.getdata(mode, "ng")).squeeze())
+    return result
+
+
+@autoname
+def waveguide_modes(
+    wavelength=1.55e-6,
+    wavelength_min=1.5e-6,
+    npoints=101,
+    nmodes=2,
+    session=None,
+    batch=True,
+    fields=False,
+    **kwargs
+):
+    """Computes effective and group index of the first modes over wavelength.
+
+    Args:
+        wavelength: 1550e-9
+        wavelength_min: 1500e-9
+        npoints: number of wavelengths from wavelength to wavelength_min
+        nmodes: number of modes
+        session: lumapi.MODE Session
+        batch: one `eval` and one `getv` for all wavelengths (True)
+            or lumapi calls per wavelength and mode
+        fields: writes the modes at `wavelength` to a modes file (see pylum.modes)
+            named after the cache key, so every cross section gets its own file
+        kwargs: waveguide settings (see pylum.waveguide.waveguide)
+
+    Returns:
+        wavelengths: (npoints,)
+        neff: (npoints, nmodes), nan where the mode is not found
+        ng: (npoints, nmodes) group index
+        fields: modes file with mode1 ... (only with fields=True)
+    """
+    key = get_cache_key(
+        waveguide_modes.__wrapped__,
+        wavelength=wavelength,
+        wavelength_min=wavelength_min,
+        npoints=npoints,
+        nmodes=nmodes,
+        fields=fields,
+        **kwargs,
+    )
+    wavelengths = np.linspace(wavelength, wavelength_min, npoints)
+    kwargs.setdefault("modes", max(4, 2 * nmodes))
+    with sessions.session("MODE", existing=session) as s:
+        waveguide(session=s, wavelength=wavelength, **kwargs)
+        if batch:
+            s.eval(modes_script(wavelengths, nmodes))
+            result = np.reshape(s.getv(result_name), (npoints, 2 * nmodes))
+        else:
+            result = _solve(s, wavelengths, nmodes)
+        if fields:
+            filepath = export_modes(s, f"waveguide_modes_{key}", wavelength, nmodes)
+    result = np.where(result > 0, result, np.nan)
+    d = dict(wavelengths=wavelengths, neff=result[:, :nmodes], ng=result[:, nmodes:])
+    if fields:
+        d["fields"] = str(filepath)
+    return d
+
+
+def _fake_neff(wavelength, mode):
+    return 2.6 - 0.9 * (wavelength * 1e6 - 1.55) - 0.5 * (mode - 1)
+
+
+def _fake_mode_session(latency=0, nfound=3):
+    """ fake MODE session that runs the batched script and the per-call path """
+    import re
+
+    from pylum import fake_lumapi
+
+    state = {"wavelength": 1.55e-6, "calculate group index": 0}
+
+    def setanalysis(key, value):
+        state[key] = value
+
+    def getdata(mode, key):
+        m = int(mode[-1])
+        neff = _fake_neff(state["wavelength"], m)
+        y = np.linspace(-1e-6, 1e-6, 41)
+        z = np.linspace(-0.5e-6, 0.7e-6, 25)
+        E = np.exp(-((y[:, None] / (0.3e-6 * m)) ** 2) - (z / 0.2e-6) ** 2)
+        data = dict(neff=neff, loss=0, x=0, y=y, z=z)
+        if state["calculate group index"]:
+            data["ng"] = neff + 1.6
+        data.update(Ex=0 * E, Ey=E, Ez=0 * E, Hx=0 * E, Hy=0 * E, Hz=neff * E)
+        return data[key]
+
+    def eval(script):
+        values = re.search(r"wavelengths = \[([^\]]*)\]", script).group(1)
+        nmodes = int(re.search(r"nmodes = (\d+)", script).group(1))
+        wavelengths = np.array([float(v) for v in values.split(",")])
+        group_index = 'setanalysis("calculate group index", 1);' in script
+        result = np.zeros((len(wavelengths), 2 * nmodes))
+        for m in range(1, min(nfound, nmodes) + 1):
+            if not group_index:
+                raise RuntimeError("ng needs calculate group index")
+            result[:, m - 1] = _fake_neff(wavelengths, m)
+            result[:, nmodes + m - 1] = _fake_neff(wavelengths, m) + 1.6
+        state["result"] = result
+
+    returns = dict(
+        setanalysis=setanalysis,
+        findmodes=lambda: nfound,
+        getdata=getdata,
+        eval=eval,
+        getv=lambda name: state["result"],
+    )
+    return fake_lumapi.MODE(latency=latency, returns=returns)
+
+
+def test_waveguide_modes():
+    s = _fake_mode_session()
+    d = waveguide_modes(session=s, npoints=11, nmodes=4, cache=False)
+    calls = len(s.calls)
+    assert d["neff"].shape == (11, 4)
+    assert np.allclose(d["neff"][:, 0], _fake_neff(d["wavelengths"], 1))
+    assert np.allclose(d["ng"][:, 1], _fake_neff(d["wavelengths"], 2) + 1.6)
+    assert np.all(np.isnan(d["neff"][:, 3]))
+
+    s = _fake_mode_session()
+    d2 = waveguide_modes(session=s, npoints=11, nmodes=4, batch=False, cache=False)
+    assert np.allclose(d["neff"], d2["neff"], equal_nan=True)
+    assert np.allclose(d["ng"], d2["ng"], equal_nan=True)
+    assert len(s.calls) - calls == 11 * (2 + 2 * 3) - 1
+
+
+def test_waveguide_modes_fields(tmp_path, monkeypatch):
+    from pylum.modes import overlap
+    from pylum.modes import read_modes
+
+    monkeypatch.setitem(CONFIG, "cache", tmp_path)
+    s = _fake_mode_session()
+    d = waveguide_modes(session=s, npoints=3, nmodes=2, fields=True)
+    modes = read_modes(d["fields"])
+    assert sorted(modes) == ["mode1", "mode2"]
+    assert modes["mode1"]["Ey"].shape == (41, 25)
+    assert modes["mode1"]["Ey"].dtype == np.complex64
+    assert np.isclose(overlap(modes["mode1"], modes["mode1"]), 1)
+    assert overlap(modes["mode1"], modes["mode2"]) < 0.9
+
+    # widths that round to the same autoname (WW500n) get their own modes file
+    d1 = waveguide_modes(session=s, npoints=3, wg_width=500.4e-9, fields=True)
+    d2 = waveguide_modes(session=s, npoints=3, wg_width=500.6e-9, fields=True)
+    assert d1["name"] == d2["name"]
+    assert d1["fields"] != d2["fields"] != d["fields"]
+
+
+def test_modes_script():
+    script = modes_script([1.5e-6, 1.6e-6], nmodes=2)
+    assert script.startswith("wavelengths = [1.5e-06, 1.6e-06];\nnmodes = 2;")
+    assert 'setanalysis("calculate group index", 1);' in script.split("for")[0]
+    assert script.count("{") == script.count("}") == 2
@@ -0,0 +1,95 @@
+import pathlib
+
+import h5py
+import numpy as np
+import pytest
+
+from pylum.cache import read_cache
+from pylum.cache import write_cache
+
+values = dict(
+    string="Hello!",
+    empty_string="",
+    none=None,
+    true=True,
+    integer=3,
+    real=1.55e-6,
+    imaginary=1 + 2j,
+    path=pathlib.Path("templates") / "dbr" / "dbr_cell.fsp",
+    raw=b"\x00\x01",
+    float64=np.float64(2.5),
+    array=np.linspace(0, 1, 11),
+    complex_array=np.exp(1j * np.arange(4)).reshape(2, 2),
+    strings=np.array(["TE", "TM"]),
+    objects=np.array([np.ones(2), "a", None], dtype=object),
+    floats=[1.0, 2.0, 3.0],
+    gap_width_list=[(0.3e-6, 0.35e-6), (0.31e-6, 0.34e-6)],
+    mixed=[1, "a", None, (2.5,)],
+    empty_list=[],
+    tuple=("si", 220e-9),
+    settings=dict(
+        wg_width=500e-9,
+        material_wg="si",
+        gap_width_list=None,
+        nested=dict(radius=[2e-3, 3e-3]),
+    ),
+)
+
+
+def assert_equal(a, b):
+    assert type(a) is type(b), f"{a!r} {b!r}"
+    if isinstance(a, dict):
+        assert list(a.keys()) == list(b.keys())
+        for k in a:
+            assert_equal(a[k], b[k])
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b)
+        for ai, bi in zip(a, b):
+            assert_equal(ai, bi)
+    elif isinstance(a, np.ndarray) and a.dtype == object:
+        assert a.shape == b.shape
+        for ai, bi in zip(a.ravel(), b.ravel()):
+            assert_equal(ai, bi)
+    elif isinstance(a, np.ndarray):
+        assert a.dtype == b.dtype
+        assert np.array_equal(a, b)
+    else:
+        assert a == b
+
+
+@pytest.mark.parametrize("key", list(values.keys()))
+def test_roundtrip(key, tmp_path):
+    filepath = tmp_path / "cache.h5"
+    d = {key: values[key]}
+    write_cache(d, filepath)
+    assert_equal(d, read_cache(filepath))
+
+
+def test_roundtrip_order(tmp_path):
+    filepath = tmp_path / "cache.h5"
+    write_cache(values, filepath)
+    assert_equal(values, read_cache(filepath))
+
+
+def test_unsupported_type_raises(tmp_path):
+    with pytest.raises(TypeError):
+        write_cache(dict(session=object()), tmp_path / "cache.h5")
+    with pytest.raises(TypeError):
+        write_cache(dict(d={1: 2}), tmp_path / "cache.h5")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_read_modes_close_file(tmp_path):
+    filepath = tmp_path / "cache.h5"
+    write_cache(values, filepath)
+
+    read_cache(filepath)
+    with h5py.File(filepath, "w"):  # fails if a handle is still open
+        pass
+
+    write_cache(values, filepath)
+    with read_cache(filepath, lazy=True) as d:
+        assert d["string"] == "Hello!"
+        assert len(d) == len(values)
+    with h5py.File(filepath, "w"):
+        pass